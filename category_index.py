@@ -0,0 +1,263 @@
+import os
+import re
+import time
+import zlib
+import pathlib
+import numpy as np
+from pdf_scanner import iter_pdf_files
+
+# --- EMBEDDING-KLASSIFIKATOR ---
+# Jede bereits einsortierte PDF ist ein Beispiel mit bekannter Kategorie. Die Textebene
+# der ersten Seite wird eingebettet (/v1/embeddings am target_url oder ein lokaler
+# Hashing-Vektorisierer) und in einem NumPy-Index gehalten. Stimmen die nächsten
+# Nachbarn einer neuen Datei überein, steht die Kategorie ohne Chat-Completion fest;
+# das LLM liefert dann nur noch die Beschreibung für den Dateinamen.
+#
+#   mode "off":    kein Index (Standard)
+#   mode "shadow": Vorhersage wird nur mit der Entscheidung des LLM verglichen
+#   mode "assign": bei Übereinstimmung wird die Kategorie direkt vergeben
+
+INDEX_FILE_NAME = ".pdf_rename_index.npz"
+HASHING_DIM = 2048
+EMBED_BATCH_SIZE = 32
+
+MODE_OFF = "off"
+MODE_SHADOW = "shadow"
+MODE_ASSIGN = "assign"
+
+# Entspricht den classifier_*-Schlüsseln der Konfiguration (siehe configuration.classifier_settings).
+DEFAULT_SETTINGS = {
+    "mode": MODE_OFF,
+    "embedding_model": "",  # leer = lokaler Hashing-Vektorisierer
+    "k": 5,
+    "min_similarity": 0.75,
+    "min_agreement": 1.0,
+}
+
+_TOKEN_RE = re.compile(r"\w{2,}")
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """Lokaler Fallback: Wörter und Wortpaare per CRC32 in einen festen Vektorraum gehasht."""
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall((text or "").lower())
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        vectors = np.copysign(np.log1p(np.abs(vectors)), vectors)  # häufige Wörter dämpfen
+        return _normalize_rows(vectors)
+
+
+class ServerEmbedder:
+    """Einbettungen über /v1/embeddings des OpenAI-kompatiblen Servers."""
+
+    def __init__(self, client, model, base_url):
+        self.client = client
+        self.model = model
+        self.name = f"{str(base_url).rstrip('/')}#{model}"
+        self.dim = None
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = [text or " " for text in texts[start:start + EMBED_BATCH_SIZE]]
+            response = self.client.embeddings.create(model=self.model, input=batch)
+            rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        vectors = np.asarray(rows, dtype=np.float32).reshape(len(texts), -1)
+        self.dim = vectors.shape[1]
+        vectors[[not (text or "").strip() for text in texts]] = 0.0
+        return _normalize_rows(vectors)
+
+
+def create_embedder(client, settings, base_url):
+    """ServerEmbedder, wenn ein Einbettungsmodell konfiguriert und erreichbar ist, sonst HashingEmbedder."""
+    model = settings.get("embedding_model")
+    if model:
+        embedder = ServerEmbedder(client, model, base_url)
+        try:
+            embedder.embed(["probe"])
+            return embedder
+        except Exception as e:
+            print(f"Einbettungsmodell '{model}' nicht verfügbar ({e}). Verwende lokalen Hashing-Vektorisierer.")
+    return HashingEmbedder()
+
+
+class Prediction:
+    """Ergebnis einer Index-Abfrage."""
+    __slots__ = ("category", "agreement", "similarity", "confident")
+
+    def __init__(self, category, agreement, similarity, confident):
+        self.category = category
+        self.agreement = agreement
+        self.similarity = similarity
+        self.confident = confident
+
+
+class CategoryIndex:
+    """Vektor-Index aus (Einbettung, Kategorie)-Paaren mit Kosinus-Ähnlichkeit über ein Matrixprodukt.
+
+    keys identifizieren eingebettete Dateien (relativer Pfad, Größe, mtime), damit ein
+    gespeicherter Index beim nächsten Aufbau nur neue oder geänderte Dateien einbetten muss.
+    """
+
+    def __init__(self, embedder_name, dim):
+        self.embedder_name = embedder_name
+        self.dim = dim
+        self._vectors = np.zeros((64, dim), dtype=np.float32)
+        self.labels = []
+        self.keys = []
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self.labels)]
+
+    def add(self, vector, label, key=None):
+        size = len(self.labels)
+        if size == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        self._vectors[size] = vector
+        self.labels.append(label)
+        self.keys.append(key)
+        self.dirty = True
+
+    def query(self, vector, k=5, min_similarity=0.75, min_agreement=1.0):
+        """Mehrheitskategorie der k nächsten Nachbarn oder None bei leerem Index.
+
+        confident ist gesetzt, wenn mindestens k Beispiele vorliegen, der Anteil der Nachbarn
+        mit der Mehrheitskategorie min_agreement erreicht und deren mittlere Ähnlichkeit
+        min_similarity. OTHER wird nie direkt vergeben.
+        """
+        size = len(self.labels)
+        if not size:
+            return None
+        similarities = self.vectors @ vector
+        k = max(1, min(int(k), size))
+        nearest = np.argpartition(-similarities, k - 1)[:k] if k < size else np.arange(size)
+        votes = {}
+        for i in nearest:
+            votes.setdefault(self.labels[i], []).append(float(similarities[i]))
+        category, sims = max(votes.items(), key=lambda item: (len(item[1]), sum(item[1])))
+        agreement = len(sims) / k
+        similarity = sum(sims) / len(sims)
+        confident = (size >= k and agreement >= min_agreement and similarity >= min_similarity
+                     and category != "OTHER")
+        return Prediction(category, round(agreement, 3), round(similarity, 3), confident)
+
+    def save(self, path):
+        """Schreibt die persistierbaren Einträge (mit key) atomar als .npz."""
+        rows = [i for i, key in enumerate(self.keys) if key]
+        _save_vectors(path, self.vectors[rows], [self.keys[i] for i in rows], self.embedder_name)
+        self.dirty = False
+
+    @staticmethod
+    def load_vectors(path, embedder_name):
+        """{key: vector} eines gespeicherten Index, leer bei fehlender Datei oder anderem Embedder."""
+        try:
+            with np.load(path) as data:
+                if str(data["embedder"]) != embedder_name:
+                    return {}
+                return dict(zip(data["keys"].tolist(), data["vectors"]))
+        except (OSError, KeyError, ValueError):
+            return {}
+
+
+def _save_vectors(path, vectors, keys, embedder_name):
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, vectors=vectors, keys=np.array(keys, dtype=str), embedder=np.array(embedder_name))
+    os.replace(tmp_path, path)
+
+
+def relocate_keys(base_dir, moves):
+    """Schreibt die Schlüssel des gespeicherten Index auf verschobene Dateien um (output_layout.migrate).
+
+    moves: (alter Pfad, neuer Pfad) unter base_dir. Größe und mtime bleiben beim Verschieben
+    erhalten, die Einbettungen werden also beim nächsten Aufbau wiederverwendet.
+    """
+    base_dir = pathlib.Path(base_dir)
+    path = base_dir / INDEX_FILE_NAME
+    renamed = {pathlib.Path(old).relative_to(base_dir).as_posix(): pathlib.Path(new).relative_to(base_dir).as_posix()
+               for old, new in moves}
+    with np.load(path) as data:
+        vectors, keys, embedder_name = data["vectors"], data["keys"].tolist(), str(data["embedder"])
+    relocated = []
+    for key in keys:
+        rel_path, size, mtime_ns = key.rsplit("|", 2)
+        relocated.append(f"{renamed[rel_path]}|{size}|{mtime_ns}" if rel_path in renamed else key)
+    _save_vectors(path, vectors, relocated, embedder_name)
+
+
+def file_key(path, base_dir):
+    """Schlüssel einer einsortierten Datei im Index (None, wenn sie nicht lesbar ist)."""
+    path = pathlib.Path(path)
+    try:
+        stat = path.stat()
+        return f"{path.relative_to(base_dir).as_posix()}|{stat.st_size}|{stat.st_mtime_ns}"
+    except (OSError, ValueError):
+        return None
+
+
+def build_index(base_dir, category_map, embedder, extract_texts):
+    """Baut den Index aus den Kategorieordnern unter base_dir auf.
+
+    extract_texts(paths) liefert die Textebene der ersten Seite je Datei (z.B. über den Render-Pool).
+    Einbettungen unveränderter Dateien werden aus INDEX_FILE_NAME übernommen.
+    Gibt (CategoryIndex, stats) zurück.
+    """
+    started = time.perf_counter()
+    base_dir = pathlib.Path(base_dir)
+    dir_labels = {}
+    for category, directory in category_map.items():
+        dir_labels.setdefault(pathlib.Path(directory).as_posix(), category)
+
+    cached = CategoryIndex.load_vectors(base_dir / INDEX_FILE_NAME, embedder.name)
+    known, missing = [], []
+    for directory, category in dir_labels.items():
+        folder = base_dir / directory
+        if not folder.is_dir():
+            continue
+        for pdf_path in iter_pdf_files(folder, recursive=True):
+            key = file_key(pdf_path, base_dir)
+            if key is None:
+                continue
+            if key in cached:
+                known.append((cached[key], category, key))
+            else:
+                missing.append((pdf_path, category, key))
+
+    new_vectors = embedder.embed(extract_texts([path for path, _, _ in missing])) if missing else None
+    dim = (new_vectors.shape[1] if new_vectors is not None
+           else len(known[0][0]) if known else embedder.dim or HASHING_DIM)
+    index = CategoryIndex(embedder.name, dim)
+    for vector, category, key in known:
+        index.add(vector, category, key)
+    for row, (_, category, key) in enumerate(missing):
+        index.add(new_vectors[row], category, key)
+    index.dirty = bool(missing) or len(known) != len(cached)
+
+    stats = {
+        "embedder": embedder.name,
+        "indexed": len(index),
+        "reused": len(known),
+        "embedded": len(missing),
+        "build_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    return index, stats
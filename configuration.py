@@ -9,6 +9,26 @@ class ConfigManager:
             "pdf_dir": r"C:/Users/steph/Documents/dev/python_ai/pdf",
             "target_url": "http://127.0.0.1:1234/v1",
             "model_name": "qwen/qwen3-vl-4b",
+            "model_cascade": [], # z.B. ["klein", "gross"]: ersetzt model_name, günstigstes Modell zuerst
+            "render_workers": 0, # 0 = ein Render-Prozess pro CPU-Kern
+            "memory_budget_mb": 0, # 0 = unbegrenzt
+            "quarantine_dir": "QUARANTINE", # Ordner unter pdf_dir für defekte/verschlüsselte/leere PDFs, leer = nur melden
+            "max_pdf_size_mb": 200, # größere PDFs kommen in die Quarantäne, 0 = unbegrenzt
+            "render_cache_mb": 1024, # Render-Cache für erste Seiten (Wiederholungsläufe, Vorschaubilder), 0 = aus
+            "render_cache_dir": "", # leer = Benutzer-Cache (~/.cache/pdf_rename/render bzw. %LOCALAPPDATA%)
+            "shard_layout": "", # Unterordner je Kategorie, z.B. "{category}/{yyyy}/{mm}"; leer = flach. Je Kategorie überschreibbar ("shard_layout" in der Kategorie)
+            "profile_runs": False, # Stack-Sampler je Lauf: .collapsed/.speedscope.json in .pdf_rename_profiles unter pdf_dir (oder ein Ordnerpfad)
+            "catalog": True, # einsortierte Dateien in den Volltextkatalog (.pdf_rename_catalog.sqlite) aufnehmen
+            "recursive_scan": False,
+            "include_patterns": [], # z.B. ["scan_*.pdf"]
+            "exclude_patterns": [], # z.B. ["*_entwurf.pdf", "archiv/*"]
+            "model_endpoints": [], # weitere Server, deren Modelle abgefragt werden
+            "classifier_mode": "off", # "off", "shadow" (nur vergleichen) oder "assign" (Kategorie direkt vergeben)
+            "classifier_embedding_model": "", # leer = lokaler Hashing-Vektorisierer statt /v1/embeddings
+            "classifier_k": 5, # Anzahl nächster Nachbarn
+            "classifier_min_similarity": 0.75, # mittlere Kosinus-Ähnlichkeit der übereinstimmenden Nachbarn
+            "classifier_min_agreement": 1.0, # Anteil der Nachbarn mit derselben Kategorie
+            "model_cache": {}, # URL -> {"models": [...], "fetched_at": Zeitstempel}
             "window_geometry": [100, 100, 900, 800],
             "categories": [
                 {
@@ -95,17 +115,35 @@ class ConfigManager:
             print(f"Konfigurationsdatei '{self.config_file}' nicht gefunden. Verwende Standardwerte.")
             return self.default_config.copy()
 
-    def save_config(self, config_data: dict):
-        """Speichert die aktuelle Konfiguration in die JSON-Datei."""
+    def save_config(self, config_data: dict, verbose=True):
+        """Speichert die aktuelle Konfiguration in die JSON-Datei.
+
+        Schlüssel, die nicht in config_data enthalten sind (z.B. Einstellungen ohne GUI-Feld), bleiben erhalten.
+        """
+        config_data = {**self.config, **config_data}
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config_data, f, indent=4, ensure_ascii=False)
-            print(f"Konfiguration erfolgreich gespeichert in '{self.config_file}'.")
+            self.config = config_data
+            if verbose:
+                print(f"Konfiguration erfolgreich gespeichert in '{self.config_file}'.")
             return True
         except IOError as e:
             print(f"Fehler beim Speichern der Konfiguration '{self.config_file}': {e}")
             return False
 
+    def update_model_cache(self, discovery_results: dict):
+        """Übernimmt erfolgreiche Ergebnisse der Modellsuche (URL -> {"models", "fetched_at"}) in den Cache.
+
+        Einträge unerreichbarer Endpunkte bleiben unverändert. Nur der Cache wird geschrieben,
+        nicht gespeicherte Änderungen in der GUI bleiben davon unberührt.
+        """
+        model_cache = dict(self.config.get("model_cache", {}))
+        for url, result in discovery_results.items():
+            if "models" in result:
+                model_cache[url] = {"models": result["models"], "fetched_at": result["fetched_at"]}
+        return self.save_config({"model_cache": model_cache}, verbose=False)
+
     def get_default_config(self):
         """Gibt eine Kopie der Standardkonfiguration zurück."""
         return self.default_config.copy()
@@ -113,3 +151,36 @@ class ConfigManager:
     def get_current_config(self):
         """Gibt die aktuell geladene Konfiguration zurück."""
         return self.config.copy()
+
+def classifier_settings(config: dict):
+    """Die classifier_*-Einstellungen ohne Präfix, z.B. {"mode": "assign", "k": 5, ...} (siehe category_index)."""
+    prefix = "classifier_"
+    return {key[len(prefix):]: value for key, value in config.items() if key.startswith(prefix)}
+
+def shard_layouts(config: dict):
+    """Ablagestruktur je aktiver Kategorie (Name -> Muster) plus "*" für das globale shard_layout (siehe output_layout)."""
+    layouts = {"*": config.get("shard_layout", "")}
+    for cat in config.get("categories", []):
+        if cat.get("active", False) and cat.get("name", "").strip() and cat.get("shard_layout"):
+            layouts[cat["name"]] = cat["shard_layout"]
+    return {name: pattern for name, pattern in layouts.items() if pattern}
+
+def run_models(config: dict, selected_model: str = ""):
+    """Modell(e) für einen Lauf: die model_cascade (Liste), falls gesetzt – sie ersetzt die Modellauswahl –,
+    sonst das gewählte Modell bzw. model_name."""
+    cascade = [name for name in config.get("model_cascade") or [] if name]
+    return cascade or selected_model or config.get("model_name", "")
+
+def assemble_prompt(config: dict):
+    """Baut aus der Konfiguration den finalen Prompt und die Category Map (Name -> Verzeichnis).
+
+    Berücksichtigt nur aktive Kategorien mit ausgefülltem Namen und Verzeichnis.
+    """
+    valid_active_categories = [
+        cat for cat in config.get("categories", [])
+        if cat.get("active", False) and cat.get("name", "").strip() and cat.get("directory", "").strip()
+    ]
+    category_definitions = [f"### {i+1}. {cat['name']}\n{cat['prompt']}" for i, cat in enumerate(valid_active_categories)]
+    assembled_prompt = config.get("base_prompt_template", "").replace("{{category_definitions}}", "\n\n".join(category_definitions))
+    category_map = {cat['name']: cat['directory'] for cat in valid_active_categories}
+    return assembled_prompt, category_map
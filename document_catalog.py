@@ -0,0 +1,356 @@
+import re
+import sys
+import json
+import time
+import sqlite3
+import pathlib
+import argparse
+import datetime
+import multiprocessing
+
+from pdf_scanner import iter_pdf_files
+
+# --- DOKUMENTKATALOG ---
+# Jede einsortierte Datei landet mit Checksumme, Original- und neuem Namen, Kategorie,
+# Datum (aus dem YYYYMMDD-Präfix), Modellantwort und Textebene der ersten Seite in einer
+# SQLite-Datenbank im PDF-Verzeichnis. Eine FTS5-Tabelle macht Namen, Modellantwort und
+# Text in Millisekunden durchsuchbar; der Katalog lässt sich jederzeit aus den
+# Kategorieordnern neu aufbauen.
+#
+#   python document_catalog.py search /pfad/zum/pdf_dir hypothekarzins --year 2023
+#   python document_catalog.py rebuild /pfad/zum/pdf_dir --config config.json
+
+CATALOG_FILE_NAME = ".pdf_rename_catalog.sqlite"
+# Einträge werden gesammelt und gemeinsam geschrieben (wie das Journal).
+FLUSH_ROWS = 64
+FLUSH_INTERVAL = 2.0
+REBUILD_BATCH_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    checksum TEXT,
+    original_name TEXT,
+    new_name TEXT NOT NULL,
+    category TEXT,
+    doc_date TEXT,
+    model_output TEXT,
+    text TEXT NOT NULL DEFAULT '',
+    size INTEGER,
+    mtime_ns INTEGER,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_category_date ON documents (category, doc_date);
+CREATE INDEX IF NOT EXISTS documents_date ON documents (doc_date);
+CREATE INDEX IF NOT EXISTS documents_checksum ON documents (checksum);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    new_name, original_name, category, model_output, text,
+    content='documents', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, new_name, original_name, category, model_output, text)
+    VALUES (new.id, new.new_name, new.original_name, new.category, new.model_output, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, new_name, original_name, category, model_output, text)
+    VALUES ('delete', old.id, old.new_name, old.original_name, old.category, old.model_output, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, new_name, original_name, category, model_output, text)
+    VALUES ('delete', old.id, old.new_name, old.original_name, old.category, old.model_output, old.text);
+    INSERT INTO documents_fts (rowid, new_name, original_name, category, model_output, text)
+    VALUES (new.id, new.new_name, new.original_name, new.category, new.model_output, new.text);
+END;
+"""
+
+_UPSERT = (
+    "INSERT INTO documents (path, checksum, original_name, new_name, category, doc_date, model_output, text, "
+    "size, mtime_ns, added) VALUES (:path, :checksum, :original_name, :new_name, :category, :doc_date, "
+    ":model_output, :text, :size, :mtime_ns, :added) "
+    "ON CONFLICT (path) DO UPDATE SET checksum = excluded.checksum, "
+    "original_name = COALESCE(excluded.original_name, documents.original_name), new_name = excluded.new_name, "
+    "category = excluded.category, doc_date = excluded.doc_date, "
+    "model_output = COALESCE(excluded.model_output, documents.model_output), text = excluded.text, "
+    "size = excluded.size, mtime_ns = excluded.mtime_ns"
+)
+
+# '<YYYYMMDD>_<beschreibung>_<checksumme>[_<kollisionssuffix>]' (siehe placement_plan.place_file)
+_NAME_RE = re.compile(r"^(?:(\d{8})_)?.*?(?:_([0-9a-f]{10}))?(?:_\d{3})?$")
+_QUERY_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def name_date(filename_stem):
+    """Datum aus dem YYYYMMDD-Präfix eines Dateinamens oder None."""
+    match = re.match(r"^(\d{8})_", filename_stem)
+    if not match:
+        return None
+    try:
+        datetime.datetime.strptime(match.group(1), "%Y%m%d")
+    except ValueError:
+        return None
+    return match.group(1)
+
+
+def name_checksum(filename_stem):
+    """Checksumme aus dem Namen einer einsortierten Datei oder None."""
+    match = _NAME_RE.match(filename_stem)
+    return match.group(2) if match else None
+
+
+def match_expression(query):
+    """Übersetzt eine Freitext-Suche in einen FTS5-Ausdruck: alle Wörter, jeweils als Präfix.
+
+    'hypothekarzins 2023' findet so auch '20230315_hypothekarzinsabrechnung'.
+    """
+    return " ".join(f'"{token}"*' for token in _QUERY_TOKEN_RE.findall(query))
+
+
+class DocumentCatalog:
+    """Katalog der einsortierten Dateien unter base_dir (SQLite mit FTS5-Volltextindex).
+
+    add() puffert bis zu flush_rows Einträge (höchstens FLUSH_INTERVAL Sekunden) und schreibt sie
+    gesammelt in einer Transaktion; close() schreibt den Rest. Die SQLite-Verbindung gehört dem
+    Thread, der den Katalog öffnet: nur dort add(), search() und close() aufrufen.
+    """
+
+    def __init__(self, base_dir, path=None, timeout=30.0, flush_rows=FLUSH_ROWS):
+        self.base_dir = pathlib.Path(base_dir)
+        self.path = pathlib.Path(path) if path else self.base_dir / CATALOG_FILE_NAME
+        self.flush_rows = flush_rows
+        self._conn = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        try:
+            self._conn.executescript(_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self._conn.close()
+            raise RuntimeError(f"SQLite ohne FTS5-Unterstützung, Katalog nicht verfügbar: {e}")
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.flush()
+        self._conn.close()
+        self._conn = None
+
+    def _row(self, path, checksum=None, original_name=None, category=None, model_output=None, text=""):
+        path = pathlib.Path(path)
+        try:
+            st = path.stat()
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            size = mtime_ns = None
+        return {
+            "path": path.relative_to(self.base_dir).as_posix(),
+            "checksum": checksum or name_checksum(path.stem),
+            "original_name": original_name,
+            "new_name": path.name,
+            "category": category,
+            "doc_date": name_date(path.stem),
+            "model_output": model_output,
+            "text": text or "",
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "added": time.time(),
+        }
+
+    def add(self, path, checksum=None, original_name=None, category=None, model_output=None, text=""):
+        """Nimmt eine einsortierte Datei auf (oder aktualisiert sie); path liegt unter base_dir."""
+        self._buffer.append(self._row(path, checksum, original_name, category, model_output, text))
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def _write(self, rows, delete_paths=()):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(_UPSERT, rows)
+            self._conn.executemany("DELETE FROM documents WHERE path = ?", [(p,) for p in delete_paths])
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def relocate(self, moves):
+        """Übernimmt verschobene Dateien (alter Pfad, neuer Pfad) unter base_dir mit allen Angaben."""
+        self.flush()
+        rows = [(pathlib.Path(new).relative_to(self.base_dir).as_posix(), pathlib.Path(new).name,
+                 pathlib.Path(old).relative_to(self.base_dir).as_posix()) for old, new in moves]
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("UPDATE OR REPLACE documents SET path = ?, new_name = ? WHERE path = ?", rows)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def search(self, query="", category=None, date_from=None, date_to=None, limit=20):
+        """Sucht im Katalog. Gibt Treffer als dicts zurück, die besten zuerst (ohne query: neueste zuerst).
+
+        query: Freitext (alle Wörter müssen als Präfix vorkommen); category: exakter Kategoriename;
+        date_from / date_to: YYYYMMDD, YYYYMM oder YYYY (jeweils einschließlich).
+        """
+        self.flush()
+        conditions, params = [], []
+        if category:
+            conditions.append("d.category = ?")
+            params.append(category)
+        if date_from:
+            conditions.append("d.doc_date >= ?")
+            params.append(str(date_from).ljust(8, "0"))
+        if date_to:
+            conditions.append("d.doc_date <= ?")
+            params.append(str(date_to).ljust(8, "9"))
+        expression = match_expression(query or "")
+        if expression:
+            sql = ("SELECT d.path, d.new_name, d.original_name, d.category, d.doc_date, d.checksum, "
+                   "snippet(documents_fts, 4, '[', ']', ' … ', 12) AS snippet, bm25(documents_fts) AS rank "
+                   "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+                   "WHERE documents_fts MATCH ?")
+            params.insert(0, expression)
+            order = "rank"
+        else:
+            sql = ("SELECT d.path, d.new_name, d.original_name, d.category, d.doc_date, d.checksum, "
+                   "'' AS snippet, 0.0 AS rank FROM documents d WHERE 1")
+            order = "d.doc_date DESC, d.id DESC"
+        sql += "".join(f" AND {condition}" for condition in conditions) + f" ORDER BY {order} LIMIT ?"
+        params.append(int(limit))
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def stats(self):
+        """Anzahl Dokumente insgesamt und je Kategorie."""
+        self.flush()
+        rows = self._conn.execute("SELECT category, COUNT(*) FROM documents GROUP BY category").fetchall()
+        return {"documents": sum(count for _, count in rows), "categories": {row[0]: row[1] for row in rows}}
+
+    def rebuild(self, category_map, extract_texts, full=False):
+        """Gleicht den Katalog mit den Kategorieordnern ab.
+
+        Neue oder geänderte Dateien werden aufgenommen (Text über extract_texts(paths), z.B.
+        RenderPool.first_page_texts), verschwundene entfernt. Originalname und Modellantwort
+        bleiben erhalten, wo sie bekannt sind. full=True liest alle Dateien neu ein.
+        Gibt {'indexed', 'added', 'removed', 'unchanged', 'seconds'} zurück.
+        """
+        started = time.perf_counter()
+        self.flush()
+        known = {row["path"]: (row["size"], row["mtime_ns"])
+                 for row in self._conn.execute("SELECT path, size, mtime_ns FROM documents")}
+        dir_labels = {}
+        for category, directory in category_map.items():
+            dir_labels.setdefault(pathlib.Path(directory).as_posix(), category)
+
+        seen, changed = set(), []
+        for directory, category in dir_labels.items():
+            folder = self.base_dir / directory
+            if not folder.is_dir():
+                continue
+            for pdf_path in iter_pdf_files(folder, recursive=True):
+                rel_path = pdf_path.relative_to(self.base_dir).as_posix()
+                seen.add(rel_path)
+                try:
+                    st = pdf_path.stat()
+                except OSError:
+                    continue
+                if full or known.get(rel_path) != (st.st_size, st.st_mtime_ns):
+                    changed.append((pdf_path, category))
+
+        removed = [path for path in known if path not in seen]
+        for start in range(0, max(len(changed), 1), REBUILD_BATCH_SIZE):
+            batch = changed[start:start + REBUILD_BATCH_SIZE]
+            texts = extract_texts([path for path, _ in batch]) if batch else []
+            rows = [self._row(path, category=category, text=text) for (path, category), text in zip(batch, texts)]
+            self._write(rows, removed if start == 0 else ())
+        return {"indexed": len(seen), "added": len(changed), "removed": len(removed),
+                "unchanged": len(seen) - len(changed), "seconds": round(time.perf_counter() - started, 2)}
+
+
+def _load_category_map(args):
+    if args.job:
+        from pdf_processor import load_job_spec
+        category_map = load_job_spec(args.job)["category_map"]
+        return json.loads(category_map) if isinstance(category_map, str) else category_map
+    from configuration import ConfigManager, assemble_prompt
+    return assemble_prompt(ConfigManager(args.config).get_current_config())[1]
+
+
+def _print_results(results, elapsed_ms, as_json):
+    if as_json:
+        print(json.dumps({"results": results, "query_ms": round(elapsed_ms, 2)}, ensure_ascii=False))
+        return
+    for result in results:
+        date = result["doc_date"] or "--------"
+        print(f"{date}  {result['category'] or '-':<14} {result['path']}")
+        if result["snippet"]:
+            print(f"          {' '.join(result['snippet'].split())}")
+    print(f"{len(results)} Treffer in {elapsed_ms:.1f} ms", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Volltextsuche über einsortierte PDFs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search_parser = commands.add_parser("search", help="Katalog durchsuchen")
+    search_parser.add_argument("pdf_dir")
+    search_parser.add_argument("query", nargs="*", help="Suchwörter (alle müssen vorkommen, Präfixsuche)")
+    search_parser.add_argument("--category", help="Nur diese Kategorie")
+    search_parser.add_argument("--year", help="Nur Dokumente dieses Jahres (YYYY)")
+    search_parser.add_argument("--from", dest="date_from", help="Frühestes Datum (YYYY, YYYYMM oder YYYYMMDD)")
+    search_parser.add_argument("--to", dest="date_to", help="Spätestes Datum (YYYY, YYYYMM oder YYYYMMDD)")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.add_argument("--json", action="store_true", help="Treffer als JSON ausgeben")
+    rebuild_parser = commands.add_parser("rebuild", help="Katalog aus den Kategorieordnern aufbauen bzw. abgleichen")
+    rebuild_parser.add_argument("pdf_dir")
+    rebuild_parser.add_argument("--config", default="config.json", help="Konfiguration mit den Kategorien")
+    rebuild_parser.add_argument("--job", help="Kategorien aus einer Job-Spezifikation statt aus der Konfiguration")
+    rebuild_parser.add_argument("--full", action="store_true", help="Alle Dateien neu einlesen")
+    rebuild_parser.add_argument("--render-workers", type=int, default=0, help="Prozesse für das Auslesen der Textebene")
+    stats_parser = commands.add_parser("stats", help="Anzahl Dokumente je Kategorie")
+    stats_parser.add_argument("pdf_dir")
+    args = parser.parse_args(argv)
+
+    pdf_dir = pathlib.Path(args.pdf_dir)
+    if not pdf_dir.is_dir():
+        print(f"Fehler: '{pdf_dir}' ist kein gültiges Verzeichnis.", file=sys.stderr)
+        return 1
+    try:
+        catalog = DocumentCatalog(pdf_dir)
+    except (RuntimeError, sqlite3.Error) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 1
+    with catalog:
+        if args.command == "search":
+            started = time.perf_counter()
+            results = catalog.search(" ".join(args.query), args.category, args.date_from or args.year,
+                                     args.date_to or args.year, args.limit)
+            _print_results(results, (time.perf_counter() - started) * 1000, args.json)
+        elif args.command == "rebuild":
+            from render_pool import RenderPool
+            try:
+                category_map = _load_category_map(args)
+            except (OSError, ValueError) as e:
+                print(f"Fehler beim Laden der Kategorien: {e}", file=sys.stderr)
+                return 1
+            with RenderPool(args.render_workers) as render_pool:
+                stats = catalog.rebuild(category_map, render_pool.first_page_texts, args.full)
+            print(f"Katalog: {stats['indexed']} Dokumente, {stats['added']} neu eingelesen, "
+                  f"{stats['removed']} entfernt ({stats['seconds']:.1f} s)")
+        else:
+            print(json.dumps(catalog.stats(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,353 @@
+import io
+import re
+import sys
+import csv
+import json
+import time
+import hashlib
+import pathlib
+import argparse
+import itertools
+import contextlib
+import tempfile
+from types import SimpleNamespace
+
+from pdf_processor import PdfProcessor, DEFAULT_MAX_TOKENS
+from placement_plan import PlanWriter
+from render_pool import RenderPool, DEFAULT_ZOOM, DEFAULT_JPG_QUALITY
+
+# --- EVALUATION ---
+# Misst für ein Raster von Einstellungen (Zoom, JPEG-Qualität, max_tokens, Modell), wie gut die
+# Pipeline einen Korpus mit bekannten Kategorien und Daten einordnet und was das kostet:
+# Kategorie-Genauigkeit, exakte Datumstreffer, Dateien/s und Tokens je Datei, dazu die
+# Pareto-Front. Die Dateien laufen im Plan-Modus durch PdfProcessor (nichts wird kopiert).
+#
+# Labels (labels.jsonl im Korpusordner oder --labels), eine Zeile je Datei, Pfade relativ zum Korpus:
+#   {"file": "lohn/2024.pdf", "category": "STEUER", "date": "2024-01-15"}
+# oder labels.csv mit den Spalten file,category,date. "date" darf fehlen (kein Datumsvergleich).
+#
+#   python evaluation.py /pfad/zum/korpus --set zoom=1.0,1.5 --set jpg_quality=60,85
+#   python evaluation.py /pfad/zum/korpus --grid grid.json --record antworten.jsonl
+#   python evaluation.py /pfad/zum/korpus --grid grid.json --replay antworten.jsonl --json ergebnis.json
+#
+# --record speichert die Antworten des Servers, --replay spielt sie ohne Server wieder ab
+# (nur für Einstellungen, die aufgezeichnet wurden; Bild und Prompt sind Teil des Schlüssels).
+
+GRID_KEYS = ("zoom", "jpg_quality", "max_tokens", "model")
+LABEL_FILE_NAMES = ("labels.jsonl", "labels.csv")
+# Ziele der Pareto-Front: (Kennzahl, True = größer ist besser)
+PARETO_OBJECTIVES = (("accuracy", True), ("files_per_s", True), ("tokens_per_file", False))
+
+_STATUS_CATEGORY_RE = re.compile(r"\((.+)\)$")
+_NAME_DATE_RE = re.compile(r"^(\d{8})(?:_|$)")
+
+
+class LabelledFile:
+    __slots__ = ("path", "category", "date")
+
+    def __init__(self, path, category, date=None):
+        self.path = path
+        self.category = category
+        self.date = date  # YYYYMMDD oder None
+
+
+def normalize_date(value):
+    """'2024-01-15', '20240115' oder '15.01.2024' als YYYYMMDD; None bei leerem Wert."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    match = re.fullmatch(r"(\d{1,2})\.(\d{1,2})\.(\d{4})", value)
+    if match:
+        day, month, year = match.groups()
+        return f"{year}{int(month):02d}{int(day):02d}"
+    digits = value.replace("-", "")
+    if not re.fullmatch(r"\d{8}", digits):
+        raise ValueError(f"Ungültiges Datum im Label: '{value}'")
+    return digits
+
+
+def load_labels(corpus_dir, labels_path=None):
+    """Liest die Labels des Korpus (JSON Lines oder CSV); wirft ValueError bei fehlenden Dateien/Feldern."""
+    corpus_dir = pathlib.Path(corpus_dir)
+    if labels_path is None:
+        labels_path = next((corpus_dir / name for name in LABEL_FILE_NAMES if (corpus_dir / name).exists()), None)
+        if labels_path is None:
+            raise ValueError(f"Keine Labels gefunden ({' oder '.join(LABEL_FILE_NAMES)} in {corpus_dir})")
+    labels_path = pathlib.Path(labels_path)
+    with open(labels_path, encoding="utf-8", newline="") as f:
+        if labels_path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    samples = []
+    for number, row in enumerate(rows, 1):
+        if not row.get("file") or not row.get("category"):
+            raise ValueError(f"{labels_path}: Eintrag {number} braucht 'file' und 'category'")
+        pdf_path = corpus_dir / row["file"]
+        if not pdf_path.is_file():
+            raise ValueError(f"{labels_path}: Datei nicht gefunden: {pdf_path}")
+        samples.append(LabelledFile(pdf_path, row["category"].strip(), normalize_date(row.get("date"))))
+    if not samples:
+        raise ValueError(f"{labels_path}: keine Einträge")
+    return samples
+
+
+def build_grid(grid=None, defaults=None):
+    """Kartesisches Produkt der Werte je Einstellung; fehlende Einstellungen nehmen den Standardwert.
+
+    grid: {"zoom": [1.0, 1.5], "model": ["klein", ["klein", "gross"]], ...}; eine Liste als Modell ist eine Kaskade.
+    """
+    grid = dict(grid or {})
+    unknown = set(grid) - set(GRID_KEYS)
+    if unknown:
+        raise ValueError(f"Unbekannte Einstellung im Raster: {', '.join(sorted(unknown))} (erlaubt: {', '.join(GRID_KEYS)})")
+    values = []
+    for key in GRID_KEYS:
+        options = grid.get(key)
+        if options is None:
+            options = [defaults[key]]
+        elif not isinstance(options, list) or not options:
+            raise ValueError(f"Raster: '{key}' braucht eine nicht leere Liste")
+        values.append(options)
+    return [dict(zip(GRID_KEYS, combination)) for combination in itertools.product(*values)]
+
+
+def parse_set_option(text):
+    """'zoom=1.0,1.5' -> ('zoom', [1.0, 1.5]); Modellnamen bleiben Text."""
+    key, sep, raw = text.partition("=")
+    key = key.strip()
+    if not sep or key not in GRID_KEYS:
+        raise ValueError(f"--set erwartet name=wert[,wert...] mit name aus {', '.join(GRID_KEYS)}: '{text}'")
+    items = [item.strip() for item in raw.split(",") if item.strip()]
+    if key == "zoom":
+        return key, [float(item) for item in items]
+    if key in ("jpg_quality", "max_tokens"):
+        return key, [int(item) for item in items]
+    return key, items
+
+
+def response_key(request):
+    """Schlüssel einer Chat-Anfrage (Modell, Parameter, Prompt und Bild) für --record/--replay."""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseRecorder:
+    """Steht für den OpenAI-Client: zählt Aufrufe und Tokens, zeichnet Antworten auf oder spielt sie ab.
+
+    client: echter Client (live, optional mit record_path) oder None mit replay_path.
+    """
+
+    def __init__(self, client=None, record_path=None, replay_path=None):
+        self.client = client
+        self.chat = SimpleNamespace(completions=self)
+        self.base_url = getattr(client, "base_url", "")
+        self.recorded = {}
+        if replay_path:
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recorded[entry["key"]] = entry
+        self._record_file = open(record_path, "a", encoding="utf-8") if record_path else None
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.missing = 0
+
+    def close(self):
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+
+    def create(self, **request):
+        key = response_key(request)
+        if self.client is None:
+            entry = self.recorded.get(key)
+            if entry is None:
+                self.missing += 1
+                raise LookupError("keine aufgezeichnete Antwort für diese Anfrage")
+            content, usage = entry["content"], entry.get("usage") or {}
+        else:
+            response = self.client.chat.completions.create(**request)
+            content = response.choices[0].message.content or ""
+            usage = {"prompt_tokens": getattr(response.usage, "prompt_tokens", 0) or 0,
+                     "completion_tokens": getattr(response.usage, "completion_tokens", 0) or 0}
+            if self._record_file is not None:
+                self._record_file.write(json.dumps({"key": key, "model": request.get("model"), "content": content,
+                                                    "usage": usage}, ensure_ascii=False) + "\n")
+                self._record_file.flush()
+        self.calls += 1
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(**usage))
+
+
+def evaluate_setting(setting, samples, base_dir, category_map, prompt, render_pool, recorder):
+    """Läuft den Korpus mit einer Einstellung durch und gibt die Kennzahlen zurück."""
+    render_pool.zoom = setting["zoom"]
+    render_pool.jpg_quality = setting["jpg_quality"]
+    recorder.reset()
+    outcomes = {}
+    with tempfile.TemporaryDirectory() as tmp, \
+            PlanWriter(pathlib.Path(tmp) / "plan.jsonl", base_dir) as plan_writer, \
+            PdfProcessor(base_dir, "", setting["model"], prompt, category_map, render_pool=render_pool,
+                         client=recorder, plan_writer=plan_writer, quarantine_dir="",
+                         max_tokens=setting["max_tokens"]) as processor:
+        started = time.perf_counter()
+        for data, _ in processor.iter_results([sample.path for sample in samples]):
+            outcomes[data["source_path"]] = data
+        seconds = time.perf_counter() - started
+
+    correct = dated = date_hits = errors = 0
+    mistakes = []
+    for sample in samples:
+        data = outcomes.get(str(sample.path), {})
+        match = _STATUS_CATEGORY_RE.search(data.get("status", ""))
+        category = match.group(1) if match else None
+        if category is None:
+            errors += 1
+        if category == sample.category:
+            correct += 1
+        date = None
+        name_match = _NAME_DATE_RE.match(data.get("new_filename", ""))
+        if name_match:
+            date = name_match.group(1)
+        if sample.date is not None:
+            dated += 1
+            date_hits += date == sample.date
+        if category != sample.category or (sample.date is not None and date != sample.date):
+            mistakes.append({"file": str(sample.path), "expected": [sample.category, sample.date],
+                             "got": [category, date], "error": data.get("error_message", "")})
+
+    files = len(samples)
+    tokens = recorder.prompt_tokens + recorder.completion_tokens
+    return {
+        "setting": setting,
+        "files": files,
+        "accuracy": round(correct / files, 4),
+        "date_match": round(date_hits / dated, 4) if dated else None,
+        "errors": errors,
+        "files_per_s": round(files / seconds, 2) if seconds > 0 else 0.0,
+        "tokens_per_file": round(tokens / files, 1),
+        "completion_tokens_per_file": round(recorder.completion_tokens / files, 1),
+        "calls_per_file": round(recorder.calls / files, 2),
+        "missing_replies": recorder.missing,
+        "seconds": round(seconds, 2),
+        "mistakes": mistakes,
+    }
+
+
+def pareto_front(results, objectives=PARETO_OBJECTIVES):
+    """Setzt 'pareto' je Ergebnis: True, wenn keine andere Einstellung in allen Zielen mindestens
+    gleich gut und in einem besser ist. Einstellungen mit fehlenden Aufzeichnungen (--replay) sind
+    unvollständig gemessen und gehören nie zur Front."""
+    def score(result):
+        return [result[name] if larger else -result[name] for name, larger in objectives]
+
+    complete = [result for result in results if not result["missing_replies"]]
+    scores = [score(result) for result in complete]
+    for result in results:
+        result["pareto"] = False
+    for result, own in zip(complete, scores):
+        result["pareto"] = not any(
+            all(o >= s for o, s in zip(other, own)) and any(o > s for o, s in zip(other, own))
+            for other in scores if other is not own
+        )
+    return results
+
+
+def run_evaluation(samples, settings, base_dir, category_map, prompt, recorder, render_workers=0, on_result=None):
+    """Bewertet alle Einstellungen mit einem gemeinsamen Render-Pool; gibt die Ergebnisse mit Pareto-Markierung zurück."""
+    results = []
+    with RenderPool(render_workers) as render_pool:
+        # Worker vorab starten, damit die erste Einstellung nicht den Prozessstart mitmisst.
+        list(render_pool.imap([samples[0].path]))
+        for setting in settings:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = evaluate_setting(setting, samples, base_dir, category_map, prompt, render_pool, recorder)
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return pareto_front(results)
+
+
+def describe_setting(setting):
+    model = setting["model"]
+    model = ">".join(model) if isinstance(model, list) else model
+    return f"zoom={setting['zoom']:g} q={setting['jpg_quality']} max_tokens={setting['max_tokens']} model={model}"
+
+
+def print_table(results):
+    print(f"\n{'':2}{'Einstellung':<60} {'Genau':>6} {'Datum':>6} {'Fehler':>6} {'Dat./s':>7} {'Tok./Dat.':>9}")
+    for result in sorted(results, key=lambda r: (-r["accuracy"], -r["files_per_s"])):
+        date_match = f"{result['date_match']:.1%}" if result["date_match"] is not None else "-"
+        print(f"{'*' if result['pareto'] else ' ':2}{describe_setting(result['setting']):<60} "
+              f"{result['accuracy']:>6.1%} {date_match:>6} {result['errors']:>6} "
+              f"{result['files_per_s']:>7.2f} {result['tokens_per_file']:>9.1f}")
+    print("* = Pareto-Front (Genauigkeit, Dateien/s, Tokens je Datei)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genauigkeit und Durchsatz verschiedener Einstellungen auf einem gelabelten Korpus messen.")
+    parser.add_argument("corpus_dir", help="Ordner mit den PDFs und labels.jsonl/labels.csv")
+    parser.add_argument("--labels", default=None, help="Labels-Datei (Standard: labels.jsonl bzw. labels.csv im Korpus)")
+    parser.add_argument("--config", default="config.json", help="Kategorien, Prompt, Server und Modell aus config.json")
+    parser.add_argument("--grid", default=None, help="JSON-Datei mit Listen je Einstellung (zoom, jpg_quality, max_tokens, model)")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=WERTE",
+                        help="Werte einer Einstellung, z.B. zoom=1.0,1.5 (ersetzt den Eintrag aus --grid)")
+    replies = parser.add_mutually_exclusive_group()
+    replies.add_argument("--record", default=None, help="Antworten des Servers in diese Datei aufzeichnen")
+    replies.add_argument("--replay", default=None, help="Aufgezeichnete Antworten statt des Servers verwenden")
+    parser.add_argument("--render-workers", type=int, default=0, help="Render-Prozesse (0 = ein Prozess pro CPU-Kern)")
+    parser.add_argument("--json", default=None, help="Ergebnisse (inkl. Fehlzuordnungen je Einstellung) als JSON speichern")
+    args = parser.parse_args(argv)
+
+    from configuration import ConfigManager, assemble_prompt
+    config = ConfigManager(args.config).get_current_config()
+    prompt, category_map = assemble_prompt(config)
+    try:
+        samples = load_labels(args.corpus_dir, args.labels)
+        grid = {}
+        if args.grid:
+            with open(args.grid, encoding="utf-8") as f:
+                grid = json.load(f)
+        grid.update(parse_set_option(option) for option in args.set)
+        defaults = {"zoom": DEFAULT_ZOOM, "jpg_quality": DEFAULT_JPG_QUALITY, "max_tokens": DEFAULT_MAX_TOKENS,
+                    "model": config.get("model_cascade") or config["model_name"]}
+        settings = build_grid(grid, defaults)
+    except (OSError, ValueError) as e:
+        print(f"Fehler: {e}")
+        return 2
+    unknown = sorted({sample.category for sample in samples} - set(category_map))
+    if unknown:
+        print(f"Warnung: Kategorien in den Labels, die nicht aktiv konfiguriert sind: {', '.join(unknown)}")
+
+    if args.replay:
+        recorder = ResponseRecorder(replay_path=args.replay)
+    else:
+        from openai import OpenAI
+        recorder = ResponseRecorder(OpenAI(base_url=config["target_url"], api_key="lm-studio"), record_path=args.record)
+    print(f"{len(samples)} Dateien, {len(settings)} Einstellungen"
+          f"{' (aufgezeichnete Antworten)' if args.replay else ' gegen ' + config['target_url']}")
+    try:
+        results = run_evaluation(samples, settings, args.corpus_dir, category_map, prompt, recorder, args.render_workers,
+                                 on_result=lambda r: print(f"  {describe_setting(r['setting'])}: "
+                                                           f"{r['accuracy']:.1%} in {r['seconds']} s"))
+    finally:
+        recorder.close()
+    print_table(results)
+    if any(result["missing_replies"] for result in results):
+        print("Hinweis: Für manche Anfragen gab es keine Aufzeichnung; sie zählen als Fehler.")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
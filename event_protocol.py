@@ -0,0 +1,83 @@
+import json
+import sys
+import time
+import threading
+
+# --- JSON-LINES EVENT PROTOCOL ---
+# pdf_processor.py --job schreibt pro Ereignis eine JSON-Zeile auf stdout:
+#   {"v": 1, "event": "start",    "time": ..., "pdf_dir": ..., "model_name": ..., ...}
+#   {"v": 1, "event": "result",   "time": ..., "original_filename": ..., "timings": {...}, ...}
+#   {"v": 1, "event": "progress", "time": ..., "processed": n, "total": m, "scan_complete": bool}
+#   {"v": 1, "event": "state",    "time": ..., "state": "running" | "paused" | "cancelling"}
+#   {"v": 1, "event": "summary",  "time": ..., "processed": n, "succeeded": n, "errors": n, "cancelled": bool, ...}
+#   {"v": 1, "event": "ready",    "time": ..., "pid": ...}   (nur --serve: bereit für den nächsten Job)
+# job_scheduler.py ergänzt alle Ereignisse um "job_id"; progress enthält dort zusätzlich
+# name, state, queued und eta_s.
+# Freitext-Ausgaben (print) gehen in diesem Modus auf stderr.
+
+PROTOCOL_VERSION = 1
+
+EVENT_START = "start"
+EVENT_RESULT = "result"
+EVENT_PROGRESS = "progress"
+EVENT_STATE = "state"
+EVENT_SUMMARY = "summary"
+EVENT_LOG = "log"
+EVENT_READY = "ready"
+
+
+class EventWriter:
+    """Schreibt Ereignisse als einzelne, sofort geflushte JSON-Zeilen (thread-sicher)."""
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        # RLock: Signal-Handler (Abbruch) können im selben Thread mitten in emit() auslösen.
+        self._lock = threading.RLock()
+
+    def emit(self, event, **fields):
+        record = {"v": PROTOCOL_VERSION, "event": event, "time": time.time()}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+class EventLineParser:
+    """Inkrementeller Parser für den Ereignisstrom.
+
+    feed() nimmt beliebig zerstückelte Bytes entgegen (z.B. aus QProcess) und gibt
+    nur Ereignisse vollständiger Zeilen zurück; ein angefangener Rest wird bis zum
+    nächsten Aufruf gepuffert. Zeilen, die kein JSON sind, werden als "log"-Ereignis
+    geliefert, Ereignisse einer neueren Protokollversion ebenfalls unverändert.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        if b"\n" not in data:
+            return []
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [event for event in map(self._parse_line, lines) if event is not None]
+
+    def flush(self):
+        """Verarbeitet einen verbleibenden Rest ohne abschließenden Zeilenumbruch."""
+        rest, self._buffer = self._buffer, b""
+        event = self._parse_line(rest)
+        return [event] if event is not None else []
+
+    @staticmethod
+    def _parse_line(line: bytes):
+        text = line.decode("utf-8", errors="replace").strip()
+        if not text:
+            return None
+        if text.startswith("{"):
+            try:
+                event = json.loads(text)
+                if isinstance(event, dict) and "event" in event:
+                    return event
+            except json.JSONDecodeError:
+                pass
+        return {"v": PROTOCOL_VERSION, "event": EVENT_LOG, "message": text}
@@ -1,20 +1,30 @@
 import sys
 import os
-import pathlib
 import json
-import requests
+import time
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QFileDialog, QGroupBox, QFormLayout,
-    QTableWidget, QTableWidgetItem, QHeaderView, QSplitter,
+    QTableView, QHeaderView, QSplitter,
     QScrollArea, QFrame, QMainWindow, QPushButton, QLabel,
 
     QLineEdit, QTextEdit, QComboBox, QCheckBox, QProgressBar
 )
-from PyQt6.QtCore import Qt, QProcess, QPoint
+from PyQt6.QtCore import Qt, QProcess, QProcessEnvironment, QPoint, QObject, QTimer, QSize, pyqtSignal
 from PyQt6.QtGui import QIcon
 
-from configuration import ConfigManager
+from configuration import ConfigManager, classifier_settings, shard_layouts, assemble_prompt, run_models
+from event_protocol import (
+    EventLineParser, EVENT_START, EVENT_RESULT, EVENT_PROGRESS, EVENT_STATE, EVENT_SUMMARY, EVENT_LOG
+)
+from results_model import ResultsTableModel, ResultsFilterProxyModel, THUMBNAIL_HEIGHT
+from model_discovery import (
+    configured_endpoints, discover_models_async, cached_models, normalize_base_url, format_cache_age
+)
+
+class ModelDiscoveryNotifier(QObject):
+    """Carries model discovery results from the background thread to the GUI thread."""
+    finished = pyqtSignal(object)
 
 class CustomTitleBar(QWidget):
     def __init__(self, parent):
@@ -150,14 +160,23 @@ class CategoryWidget(QWidget):
 class MainContentWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.process = None
+        self.process = None  # long-lived "pdf_processor.py --serve" worker
+        self.job_running = False
+        self.worker_restarts = []  # start times of automatic restarts
+        self.shutting_down = False
+        self.event_parser = EventLineParser()
         self.total_pdfs = 0
         self.processed_pdfs = 0
+        self.model_discovery = ModelDiscoveryNotifier(self)
+        self.model_discovery.finished.connect(self.handle_models_discovered)
+        self.model_discovery_running = False
         
         self.config_manager = ConfigManager()
         
         self.init_ui()
         self.load_initial_config()
+        # Start the worker once the window is up, so the first run does not pay for it.
+        QTimer.singleShot(0, self.ensure_worker)
 
     def init_ui(self):
         main_layout = QVBoxLayout(self)
@@ -252,7 +271,11 @@ class MainContentWidget(QWidget):
         self.cancel_button = QPushButton("Verarbeitung abbrechen", self)
         self.cancel_button.clicked.connect(self.cancel_processing)
         self.cancel_button.setEnabled(False)
+        self.pause_button = QPushButton("Pausieren", self)
+        self.pause_button.clicked.connect(self.toggle_pause_processing)
+        self.pause_button.setEnabled(False)
         action_buttons_layout.addWidget(self.start_button)
+        action_buttons_layout.addWidget(self.pause_button)
         action_buttons_layout.addWidget(self.cancel_button)
         top_layout.addLayout(action_buttons_layout)
 
@@ -275,13 +298,33 @@ class MainContentWidget(QWidget):
         info_layout.addWidget(self.target_url_info_label)
         info_layout.addWidget(self.status_info_label)
         self.info_group_box.setLayout(info_layout)
+        self.model_name_combobox.currentTextChanged.connect(lambda _text: self.update_info_labels())
 
         self.results_group_box = QGroupBox("Verarbeitungsergebnisse")
         results_layout = QVBoxLayout()
         results_layout.setContentsMargins(15, 15, 15, 15)
-        self.output_table = QTableWidget(self)
-        self.output_table.setColumnCount(6)
-        self.output_table.setHorizontalHeaderLabels(["Original Filename", "Checksum", "New Filename", "Status", "Target Folder", "Error Message"])
+        results_filter_layout = QHBoxLayout()
+        self.errors_only_checkbox = QCheckBox("Nur Fehler anzeigen", self)
+        self.results_filter_input = QLineEdit(self)
+        self.results_filter_input.setPlaceholderText("Ergebnisse filtern...")
+        results_filter_layout.addWidget(self.errors_only_checkbox)
+        results_filter_layout.addWidget(self.results_filter_input)
+        results_layout.addLayout(results_filter_layout)
+
+        # Virtualized table: rows live in a columnar model, the view only paints what is visible.
+        self.results_model = ResultsTableModel(self)
+        self.results_proxy = ResultsFilterProxyModel(self)
+        self.results_proxy.setSourceModel(self.results_model)
+        self.errors_only_checkbox.toggled.connect(self.results_proxy.set_errors_only)
+        self.results_filter_input.textChanged.connect(self.results_proxy.set_text_filter)
+        self.output_table = QTableView(self)
+        self.output_table.setModel(self.results_proxy)
+        self.output_table.setSortingEnabled(True)
+        self.output_table.sortByColumn(-1, Qt.SortOrder.AscendingOrder)
+        self.output_table.verticalHeader().setDefaultSectionSize(22)
+        # First-page thumbnails from the render cache (portrait A4 at THUMBNAIL_HEIGHT).
+        self.output_table.setIconSize(QSize(THUMBNAIL_HEIGHT * 3 // 4, THUMBNAIL_HEIGHT))
+        self.output_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
         results_layout.addWidget(self.output_table)
         self.results_group_box.setLayout(results_layout)
 
@@ -386,6 +429,12 @@ class MainContentWidget(QWidget):
         if isinstance(geometry, list) and len(geometry) == 4:
             self.window().setGeometry(geometry[0], geometry[1], geometry[2], geometry[3])
 
+        # Show the last known model list immediately; the refresh runs in the background.
+        cached, fetched_at = cached_models(self.config_manager.get_current_config(), self.target_url_input.text())
+        if cached:
+            self._populate_model_combobox(cached)
+            self.add_log_message(f"{len(cached)} Modelle aus dem Cache geladen (Stand: {format_cache_age(fetched_at)}).")
+
         if self.target_url_input.text():
             self.fetch_lm_studio_models()
 
@@ -422,66 +471,100 @@ class MainContentWidget(QWidget):
         pdf_dir = current_config.get("pdf_dir")
         target_url = current_config.get("target_url")
         model_name = current_config.get("model_name")
-        all_categories = current_config.get("categories", [])
         base_template = current_config.get("base_prompt_template")
 
         if not all([pdf_dir, target_url, model_name, base_template]):
             self.add_log_message("<font color='red'>Fehler: Bitte füllen Sie die allgemeinen Konfigurationsfelder und die Base Prompt Vorlage aus.</font>")
             return
 
-        valid_active_categories = [
-            cat for cat in all_categories 
-            if cat.get("active", False) and cat.get("name", "").strip() and cat.get("directory", "").strip()
-        ]
-
-        if not valid_active_categories:
+        assembled_prompt, category_map = assemble_prompt(current_config)
+        if not category_map:
             self.add_log_message("<font color='red'>Fehler: Es muss mindestens eine aktive Kategorie mit ausgefülltem Namen und Verzeichnis vorhanden sein.</font>")
             return
-        
-        category_definitions = [f"### {i+1}. {cat['name']}\n{cat['prompt']}" for i, cat in enumerate(valid_active_categories)]
-        assembled_prompt = base_template.replace("{{category_definitions}}", "\n\n".join(category_definitions))
-        category_map = {cat['name']: cat['directory'] for cat in valid_active_categories}
-        category_map_json = json.dumps(category_map)
 
-        self.output_table.clearContents()
-        self.output_table.setRowCount(0)
+        self.results_model.clear()
         self.add_log_message(f"<font color='blue'>Starte Verarbeitung für Verzeichnis: {pdf_dir}</font>")
         self.set_ui_enabled(False)
 
-        try:
-            pdf_files = list(pathlib.Path(pdf_dir).glob("*.pdf"))
-            self.total_pdfs = len(pdf_files)
-            if self.total_pdfs == 0:
-                self.add_log_message("<font color='orange'>Warnung: Keine PDF-Dateien im ausgewählten Verzeichnis gefunden.</font>")
-                self.set_ui_enabled(True)
-                return
-            self.progress_bar.setMaximum(self.total_pdfs)
-            self.processed_pdfs = 0
-        except Exception as e:
-            self.add_log_message(f"<font color='red'>Fehler beim Zählen der PDF-Dateien: {e}</font>")
+        if not os.path.isdir(pdf_dir):
+            self.add_log_message(f"<font color='red'>Fehler: '{pdf_dir}' ist kein gültiges Verzeichnis.</font>")
             self.set_ui_enabled(True)
             return
+        # The total is not known up front: the processor scans the directory while
+        # it works, so the bar stays in busy mode until it reports a running total.
+        self.total_pdfs = 0
+        self.processed_pdfs = 0
+        self.progress_bar.setRange(0, 0)
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
 
+        # The job spec goes to the warm worker as one JSON line on stdin;
+        # results come back as JSON-lines events on stdout.
+        stored_config = self.config_manager.get_current_config()
+        models = run_models(stored_config, model_name)
+        if isinstance(models, list):
+            self.add_log_message(f"<font color='blue'>Modell-Kaskade aus der Konfiguration aktiv: {' → '.join(models)} "
+                                 f"(ersetzt die Modellauswahl)</font>")
+        job = {
+            "pdf_dir": pdf_dir,
+            "target_url": target_url,
+            "model_name": models,
+            "assembled_prompt": assembled_prompt,
+            "category_map": category_map,
+            "render_workers": stored_config.get("render_workers", 0),
+            "memory_budget_mb": stored_config.get("memory_budget_mb", 0),
+            "classifier": classifier_settings(stored_config),
+            "quarantine_dir": stored_config.get("quarantine_dir", "QUARANTINE"),
+            "max_pdf_size_mb": stored_config.get("max_pdf_size_mb", 0),
+            "render_cache_mb": stored_config.get("render_cache_mb", 0),
+            "render_cache_dir": stored_config.get("render_cache_dir", ""),
+            "shard_layout": shard_layouts(stored_config),
+            "catalog": stored_config.get("catalog", True),
+            "profile": stored_config.get("profile_runs", False),
+            "recursive": stored_config.get("recursive_scan", False),
+            "include_patterns": stored_config.get("include_patterns", []),
+            "exclude_patterns": stored_config.get("exclude_patterns", []),
+        }
+        self.ensure_worker()
+        self.job_running = True
+        self.process.write((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def ensure_worker(self):
+        """Starts the persistent processing worker unless it is already running."""
+        if self.process is not None and self.process.state() != QProcess.ProcessState.NotRunning:
+            return
         self.process = QProcess(self)
         self.process.readyReadStandardOutput.connect(self.handle_stdout)
         self.process.readyReadStandardError.connect(self.handle_stderr)
         self.process.finished.connect(self.handle_process_finished)
+        self.event_parser = EventLineParser()
 
         script_path = os.path.join(os.path.dirname(__file__), "pdf_processor.py")
-        os.environ["PYTHONUNBUFFERED"] = "1"
-
-        command = [
-            sys.executable, script_path, pdf_dir, target_url, model_name,
-            assembled_prompt, category_map_json
-        ]
-        self.process.start(command[0], command[1:])
+        environment = QProcessEnvironment.systemEnvironment()
+        environment.insert("PYTHONUNBUFFERED", "1")
+        self.process.setProcessEnvironment(environment)
+        self.process.start(sys.executable, [script_path, "--serve"])
+
+    def shutdown_worker(self):
+        """Asks the worker to exit (cancelling a running job) and waits briefly."""
+        self.shutting_down = True
+        if self.process is None or self.process.state() == QProcess.ProcessState.NotRunning:
+            return
+        if self.job_running:
+            self.process.write(b"cancel\n")
+        self.process.write(b"shutdown\n")
+        self.process.closeWriteChannel()
+        if not self.process.waitForFinished(5000):
+            self.process.kill()
+            self.process.waitForFinished(1000)
 
     def set_ui_enabled(self, enabled):
         """Enables or disables UI elements during processing."""
         self.start_button.setEnabled(enabled)
         self.cancel_button.setEnabled(not enabled)
+        self.cancel_button.setText("Verarbeitung abbrechen")
+        self.pause_button.setEnabled(not enabled)
+        self.pause_button.setText("Pausieren")
         self.browse_pdf_dir_button.setEnabled(enabled)
         self.target_url_input.setEnabled(enabled)
         self.model_name_combobox.setEnabled(enabled)
@@ -506,87 +589,163 @@ class MainContentWidget(QWidget):
             else:
                 self.start_button.setEnabled(False)
 
-    def handle_process_finished(self, exit_code, exit_status):
-        if exit_status == QProcess.ExitStatus.NormalExit:
+    def finish_run(self, ok, message):
+        """Ends the current run in the GUI (the worker itself keeps running)."""
+        self.job_running = False
+        self.results_model.flush()
+        self.progress_bar.setVisible(False)
+        if ok:
             self.add_log_message("<font color='green'>✅ Verarbeitung abgeschlossen.</font>")
             self.status_info_label.setText("Status: Processing Complete")
         else:
-            self.add_log_message(f"<font color='red'>❌ Verarbeitung mit Fehler beendet. Exit Code: {exit_code}</font>")
-            self.status_info_label.setText(f"Status: Error (Exit Code: {exit_code})")
+            self.add_log_message(f"<font color='red'>❌ {message}</font>")
+            self.status_info_label.setText("Status: Error")
         self.set_ui_enabled(True)
 
+    def handle_process_finished(self, exit_code, exit_status):
+        """The worker exited: finish a running job as failed and restart the worker."""
+        self.handle_events(self.event_parser.flush())
+        if self.shutting_down:
+            return
+        if self.job_running:
+            self.finish_run(False, f"Verarbeitung mit Fehler beendet. Exit Code: {exit_code}")
+        # Restart automatically, but give up after repeated crashes within a minute;
+        # the next click on "Verarbeitung starten" starts it again in any case.
+        now = time.monotonic()
+        self.worker_restarts = [t for t in self.worker_restarts if now - t < 60] + [now]
+        if len(self.worker_restarts) <= 3:
+            self.add_log_message("<font color='orange'>Verarbeitungsprozess beendet, wird neu gestartet...</font>")
+            QTimer.singleShot(1000 * len(self.worker_restarts), self.ensure_worker)
+        else:
+            self.add_log_message("<font color='red'>Verarbeitungsprozess stürzt wiederholt ab; "
+                                 "er wird beim nächsten Start erneut gestartet.</font>")
+
     def update_info_labels(self):
-        self.model_info_label.setText(f"Modell: {self.model_name_combobox.currentText() or 'N/A'}")
+        models = run_models(self.config_manager.get_current_config(), self.model_name_combobox.currentText())
+        if isinstance(models, list):
+            # model_cascade in config.json replaces the dropdown selection.
+            self.model_info_label.setText(f"Modell-Kaskade: {' → '.join(models)}")
+            self.model_name_combobox.setToolTip("Inaktiv: model_cascade in der Konfiguration ersetzt diese Auswahl.")
+        else:
+            self.model_info_label.setText(f"Modell: {models or 'N/A'}")
+            self.model_name_combobox.setToolTip("")
         self.target_url_info_label.setText(f"Target URL: {self.target_url_input.text()}")
-        if self.process is None: self.status_info_label.setText("Status: Idle")
-        elif self.process.state() == QProcess.ProcessState.Running: self.status_info_label.setText("Status: Processing...")
-        else: self.status_info_label.setText("Status: Processing Complete")
+        if self.job_running: self.status_info_label.setText("Status: Processing...")
+        else: self.status_info_label.setText("Status: Idle")
 
     def add_log_message(self, message):
         print(message)
 
     def fetch_lm_studio_models(self):
-        """Fetches the list of available models from the LM Studio API."""
+        """Starts fetching the available models from all configured endpoints in the background."""
         lm_studio_url = self.target_url_input.text().strip()
         if not lm_studio_url:
             self.add_log_message("<font color='red'>Bitte geben Sie zuerst die LM Studio Target URL an.</font>")
             return
 
-        if not lm_studio_url.endswith('/v1'):
-            lm_studio_url = lm_studio_url.rstrip('/') + '/v1'
-            self.target_url_input.setText(lm_studio_url)
-
-        models_url = f"{lm_studio_url}/models"
-        self.add_log_message(f"Versuche, Modelle von {models_url} abzurufen...")
-
-        try:
-            response = requests.get(models_url, timeout=10)
-            response.raise_for_status()
-            models_data = response.json()
-            
-            if 'data' not in models_data:
-                self.add_log_message("<font color='orange'>Keine Modelle gefunden oder unerwartetes Format von LM Studio.</font>")
-                return
-
-            available_models = [model['id'] for model in models_data.get('data', [])]
-            
-            if not available_models:
-                self.add_log_message("<font color='orange'>Keine Modelle in der Antwort von LM Studio gefunden.</font>")
-                return
-
-            current_model = self.model_name_combobox.currentText()
-            self.model_name_combobox.clear()
-            self.model_name_combobox.addItems(available_models)
-            self.add_log_message(f"<font color='green'>{len(available_models)} Modelle von LM Studio geladen.</font>")
-
-            index = self.model_name_combobox.findText(current_model)
-            if index != -1:
-                self.model_name_combobox.setCurrentIndex(index)
-            elif available_models:
-                self.model_name_combobox.setCurrentIndex(0)
-
-        except requests.exceptions.Timeout:
-            self.add_log_message(f"<font color='red'>Fehler: Zeitüberschreitung beim Abrufen der Modelle von {models_url}.</font>")
-        except requests.exceptions.RequestException as e:
-            self.add_log_message(f"<font color='red'>Fehler beim Abrufen der Modelle von LM Studio: {e}</font>")
-        except Exception as e:
-            self.add_log_message(f"<font color='red'>Ein unerwarteter Fehler ist aufgetreten: {e}</font>")
+        normalized_url = normalize_base_url(lm_studio_url)
+        if normalized_url != lm_studio_url:
+            self.target_url_input.setText(normalized_url)
+
+        if self.model_discovery_running:
+            return
+        endpoints = configured_endpoints({**self.config_manager.get_current_config(), "target_url": normalized_url})
+        self.add_log_message(f"Versuche, Modelle von {', '.join(endpoints)} abzurufen...")
+        self.model_discovery_running = True
+        self.fetch_models_button.setText("Lade Modelle...")
+        discover_models_async(endpoints, self.model_discovery.finished.emit)
+
+    def handle_models_discovered(self, results):
+        """Applies discovery results (GUI thread) and stores them in the model cache."""
+        self.model_discovery_running = False
+        self.fetch_models_button.setText("Modelle laden")
+        self.config_manager.update_model_cache(results)
+
+        for url, result in results.items():
+            if "error" in result:
+                self.add_log_message(f"<font color='red'>{result['error']}</font>")
+
+        result = results.get(normalize_base_url(self.target_url_input.text()))
+        if not result or "models" not in result:
+            return
+        if not result["models"]:
+            self.add_log_message("<font color='orange'>Keine Modelle in der Antwort von LM Studio gefunden.</font>")
+            return
+        self._populate_model_combobox(result["models"])
+        self.add_log_message(f"<font color='green'>{len(result['models'])} Modelle von LM Studio geladen.</font>")
+
+    def _populate_model_combobox(self, available_models):
+        """Replaces the model list while keeping the current selection if it is still available."""
+        current_model = self.model_name_combobox.currentText()
+        self.model_name_combobox.clear()
+        self.model_name_combobox.addItems(available_models)
+
+        index = self.model_name_combobox.findText(current_model)
+        if index != -1:
+            self.model_name_combobox.setCurrentIndex(index)
+        elif available_models:
+            self.model_name_combobox.setCurrentIndex(0)
+
+    def send_control_command(self, command):
+        """Sends a control command (pause/resume/cancel) to the processor via stdin."""
+        if self.job_running and self.process and self.process.state() == QProcess.ProcessState.Running:
+            self.process.write(f"{command}\n".encode("utf-8"))
 
     def cancel_processing(self):
-        if self.process and self.process.state() == QProcess.ProcessState.Running:
+        """First click: cooperative cancel (the current file is finished, progress is checkpointed).
+        Second click: terminate the worker (it is restarted automatically)."""
+        if not (self.job_running and self.process and self.process.state() == QProcess.ProcessState.Running):
+            return
+        if self.cancel_button.text() == "Abbruch erzwingen":
             self.process.terminate()
+            return
+        self.send_control_command("cancel")
+        self.cancel_button.setText("Abbruch erzwingen")
+        self.pause_button.setEnabled(False)
+
+    def toggle_pause_processing(self):
+        if self.pause_button.text() == "Pausieren":
+            self.send_control_command("pause")
+            self.pause_button.setText("Fortsetzen")
+        else:
+            self.send_control_command("resume")
+            self.pause_button.setText("Pausieren")
 
     def handle_stdout(self):
-        data = self.process.readAllStandardOutput().data().decode('utf-8', errors='replace')
-        lines = data.strip().split('\n')
-        for line in lines:
-            if "Original Filename" in line: continue
-            parts = line.split('|')
-            if len(parts) == 6:
-                row_position = self.output_table.rowCount()
-                self.output_table.insertRow(row_position)
-                for i, part in enumerate(parts):
-                    self.output_table.setItem(row_position, i, QTableWidgetItem(part.strip()))
+        data = self.process.readAllStandardOutput().data()
+        self.handle_events(self.event_parser.feed(data))
+
+    def handle_events(self, events):
+        """Applies parsed JSON-lines events from the processor to the table and progress bar."""
+        results = [event for event in events if event.get("event") == EVENT_RESULT]
+        if results:
+            # Buffered in the model and inserted in one batch per timer tick.
+            self.results_model.append_results(results)
+
+        for event in events:
+            event_type = event.get("event")
+            if event_type == EVENT_PROGRESS:
+                self.processed_pdfs = event.get("processed", 0)
+                self.total_pdfs = max(event.get("total", 0), self.processed_pdfs)
+                self.progress_bar.setRange(0, self.total_pdfs)
+                self.progress_bar.setValue(self.processed_pdfs)
+            elif event_type == EVENT_START:
+                self.status_info_label.setText("Status: Processing...")
+            elif event_type == EVENT_STATE:
+                state_labels = {"running": "Processing...", "paused": "Paused", "cancelling": "Cancelling..."}
+                self.status_info_label.setText(f"Status: {state_labels.get(event.get('state'), event.get('state'))}")
+            elif event_type == EVENT_SUMMARY:
+                self.add_log_message(
+                    f"<font color='blue'>{event.get('succeeded', 0)} erfolgreich, {event.get('errors', 0)} Fehler "
+                    f"in {event.get('elapsed_s', 0)} s.</font>"
+                )
+                if event.get("cancelled"):
+                    self.add_log_message("<font color='orange'>Verarbeitung abgebrochen. Der nächste Lauf setzt beim "
+                                         "nächsten unverarbeiteten PDF fort.</font>")
+                if self.job_running:
+                    self.finish_run(event.get("ok", False), event.get("error", "Verarbeitung fehlgeschlagen."))
+            elif event_type == EVENT_LOG:
+                self.add_log_message(event.get("message", ""))
 
     def handle_stderr(self):
         data = self.process.readAllStandardError().data().decode('utf-8', errors='replace')
@@ -621,6 +780,7 @@ class PDFProcessorGUI(QMainWindow):
 
     def closeEvent(self, event):
         self.mainContent.save_current_config()
+        self.mainContent.shutdown_worker()
         super().closeEvent(event)
 
     def mousePressEvent(self, event):
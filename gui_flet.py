@@ -2,13 +2,15 @@ import flet as ft
 from flet import Control
 import os
 import json
-import pathlib
-import requests
 import subprocess
 import sys
 import threading
-from configuration import ConfigManager
-import pdf_processor
+import multiprocessing
+from configuration import ConfigManager, classifier_settings, shard_layouts, assemble_prompt, run_models
+from job_control import ProcessingJob
+from model_discovery import (
+    configured_endpoints, discover_models_async, cached_models, normalize_base_url, format_cache_age
+)
 
 class CategoryControl(ft.Container):
     """A Flet control for a single category's configuration."""
@@ -58,6 +60,180 @@ class CategoryControl(ft.Container):
         if self.on_remove:
             self.on_remove(self)
 
+# Height of the first-page thumbnails in the results table (fits the default DataTable row).
+THUMBNAIL_HEIGHT = 40
+
+def _preview_image(path):
+    """Thumbnail from the render cache; the image is read from disk, nothing is rendered again."""
+    if not path:
+        return ft.Text("")
+    return ft.Image(src=path, height=THUMBNAIL_HEIGHT, fit=ft.BoxFit.CONTAIN, cache_height=THUMBNAIL_HEIGHT * 2,
+                    tooltip=path)
+
+# Result fields kept for the table; everything else in a result (timings, ...) is dropped.
+RESULT_KEYS = ('preview', 'original_filename', 'checksum', 'new_filename', 'status', 'target_folder', 'error_message')
+
+class BufferedTableUpdater:
+    """Collects results from the worker thread and flushes them to the DataTable on a fixed cadence.
+
+    Every result is kept in `results`; the table shows one page of `page_size` rows. While the
+    newest page is shown, each flush only appends the new rows (or starts the next page), so the
+    per-update cost stays constant no matter how many files have been processed. `navigation`
+    pages back through earlier results and can restrict the table to errors.
+    """
+    def __init__(self, page, table, progress_bar, info_text, interval=0.5, page_size=200):
+        self.page = page
+        self.table = table
+        self.progress_bar = progress_bar
+        self.info_text = info_text
+        self.interval = interval
+        self.page_size = page_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._render_lock = threading.RLock()  # flush thread and navigation clicks
+        self._stop = threading.Event()
+        self._thread = None
+        self.results = []
+        self.error_results = []
+        self.page_index = None  # None: follow the newest page
+        self.errors_only = False
+        self.processed = 0
+        self.errors = 0
+        self.total = 0
+
+        self.page_label = ft.Text("")
+        self.prev_button = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="Ältere Ergebnisse",
+                                         on_click=lambda e: self.show_page(-1), disabled=True)
+        self.next_button = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="Neuere Ergebnisse",
+                                         on_click=lambda e: self.show_page(1), disabled=True)
+        self.errors_only_checkbox = ft.Checkbox(label="Nur Fehler", value=False, on_change=self.toggle_errors_only)
+        self.navigation = ft.Row([self.prev_button, self.page_label, self.next_button, self.errors_only_checkbox])
+
+    def add(self, data):
+        """Called from the processing thread; never touches the page."""
+        with self._lock:
+            self._pending.append(data)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="flet-table-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the flush thread and flushes whatever is still queued."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _view(self):
+        return self.error_results if self.errors_only else self.results
+
+    def _page_count(self, rows):
+        return max(1, -(-len(rows) // self.page_size))
+
+    def _current_page(self, rows):
+        last = self._page_count(rows) - 1
+        return last if self.page_index is None else min(self.page_index, last)
+
+    @staticmethod
+    def _row(data):
+        return ft.DataRow(cells=[
+            ft.DataCell(_preview_image(data.get('preview'))),
+            ft.DataCell(ft.Text(data.get('original_filename', ''))),
+            ft.DataCell(ft.Text(data.get('checksum', ''))),
+            ft.DataCell(ft.Text(data.get('new_filename', ''))),
+            ft.DataCell(ft.Text(data.get('status', ''))),
+            ft.DataCell(ft.Text(data.get('target_folder', ''))),
+            ft.DataCell(ft.Text(data.get('error_message', ''))),
+        ])
+
+    def _fill_table(self, rows, page_number):
+        start = page_number * self.page_size
+        self.table.rows[:] = [self._row(data) for data in rows[start:start + self.page_size]]
+
+    def _update_labels(self):
+        rows = self._view()
+        page_number = self._current_page(rows)
+        page_count = self._page_count(rows)
+        start = page_number * self.page_size
+        shown = f"Zeilen {start + 1}–{start + len(self.table.rows)} von {len(rows)}" if rows else "keine Zeilen"
+        self.page_label.value = f"Seite {page_number + 1} von {page_count} ({shown})"
+        self.prev_button.disabled = page_number == 0
+        self.next_button.disabled = page_number >= page_count - 1
+        self.info_text.value = f"{self.processed} von {self.total} Dateien verarbeitet, {self.errors} Fehler"
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        with self._render_lock:
+            rows = self._view()
+            shown_page = self._current_page(rows)
+            shown_rows = len(rows)
+            for data in pending:
+                data = {key: data.get(key, '') for key in RESULT_KEYS}
+                self.results.append(data)
+                if data['status'] == "Error":
+                    self.error_results.append(data)
+            if self.page_index is None:
+                new_page = self._current_page(rows)
+                if new_page == shown_page:
+                    # Still on the same page: only the new rows are built.
+                    self.table.rows.extend(self._row(data) for data in rows[shown_rows:])
+                else:
+                    self._fill_table(rows, new_page)
+
+            self.processed += len(pending)
+            self.errors += sum(1 for data in pending if data.get('status') == "Error")
+            # The total grows while the directory scan is still running.
+            self.total = max(self.total, pending[-1].get('total_files', 0), self.processed)
+            if self.total > 0:
+                self.progress_bar.value = self.processed / self.total
+            self._update_labels()
+            self.page.update(self.table, self.progress_bar, self.info_text, self.navigation)
+
+    def show_page(self, step):
+        """Moves `step` pages back (-1) or forward (+1); the newest page follows new results again."""
+        with self._render_lock:
+            rows = self._view()
+            last = self._page_count(rows) - 1
+            target = min(max(self._current_page(rows) + step, 0), last)
+            self.page_index = None if target == last else target
+            self._fill_table(rows, target)
+            self._update_labels()
+            self.page.update(self.table, self.navigation)
+
+    def toggle_errors_only(self, e):
+        with self._render_lock:
+            self.errors_only = bool(self.errors_only_checkbox.value)
+            self.page_index = None
+            rows = self._view()
+            self._fill_table(rows, self._current_page(rows))
+            self._update_labels()
+            self.page.update(self.table, self.navigation)
+
+    def reset(self):
+        with self._lock:
+            self._pending = []
+        with self._render_lock:
+            self.table.rows.clear()
+            self.results = []
+            self.error_results = []
+            self.page_index = None
+            self.processed = 0
+            self.errors = 0
+            self.total = 0
+            self._update_labels()
+            self.info_text.value = ""
+
 def main(page: ft.Page):
     page.title = "PDF Organizer & Renamer"
     page.vertical_alignment = ft.MainAxisAlignment.START
@@ -79,6 +255,7 @@ def main(page: ft.Page):
     
     output_table = ft.DataTable(
         columns=[
+            ft.DataColumn(ft.Text("Preview")),
             ft.DataColumn(ft.Text("Original Filename")),
             ft.DataColumn(ft.Text("Checksum")),
             ft.DataColumn(ft.Text("New Filename")),
@@ -92,6 +269,10 @@ def main(page: ft.Page):
     
     progress_bar = ft.ProgressBar(value=0, visible=False)
     status_info_label = ft.Text("Status: Idle", style=ft.TextThemeStyle.BODY_LARGE)
+    results_info_label = ft.Text("", style=ft.TextThemeStyle.BODY_MEDIUM)
+    table_updater = BufferedTableUpdater(page, output_table, progress_bar, results_info_label)
+    current_job = [None] # ProcessingJob of the running thread, if any
+    model_discovery_running = [False]
     
     # --- Functions ---
 
@@ -107,36 +288,50 @@ def main(page: ft.Page):
         file_picker.get_directory_path(dialog_title="Wählen Sie das PDF-Verzeichnis")
 
     def fetch_lm_studio_models(e):
+        """Queries all configured endpoints in a background thread; the UI stays responsive."""
         lm_studio_url = target_url_input.value.strip()
         if not lm_studio_url:
             show_snackbar("Bitte geben Sie zuerst die LM Studio Target URL an.", ft.Colors.RED)
             return
 
-        if not lm_studio_url.endswith('/v1'):
-            lm_studio_url = lm_studio_url.rstrip('/') + '/v1'
-            target_url_input.value = lm_studio_url
-        
-        models_url = f"{lm_studio_url}/models"
-        show_snackbar(f"Versuche, Modelle von {models_url} abzurufen...", ft.Colors.BLUE)
+        lm_studio_url = normalize_base_url(lm_studio_url)
+        target_url_input.value = lm_studio_url
+        if model_discovery_running[0]:
+            return
 
-        try:
-            response = requests.get(models_url, timeout=10)
-            response.raise_for_status()
-            models_data = response.json()
-            
-            available_models = [model['id'] for model in models_data.get('data', [])]
-            if not available_models:
-                show_snackbar("Keine Modelle in der Antwort von LM Studio gefunden.", ft.Colors.ORANGE)
-                return
-
-            model_name_combobox.options = [ft.dropdown.Option(model) for model in available_models]
-            show_snackbar(f"{len(available_models)} Modelle von LM Studio geladen.", ft.Colors.GREEN)
-            page.update()
+        endpoints = configured_endpoints({**config_manager.get_current_config(), "target_url": lm_studio_url})
+        if e is not None:
+            show_snackbar(f"Versuche, Modelle von {', '.join(endpoints)} abzurufen...", ft.Colors.BLUE)
+        model_discovery_running[0] = True
+        fetch_models_button.text = "Lade Modelle..."
+        page.update()
+        discover_models_async(endpoints, lambda results: on_models_discovered(results, lm_studio_url, e is not None))
+
+    def on_models_discovered(results, lm_studio_url, notify_success):
+        # Runs in the discovery thread; Flet controls can be updated from there.
+        model_discovery_running[0] = False
+        fetch_models_button.text = "Modelle laden"
+        config_manager.update_model_cache(results)
+
+        errors = [result["error"] for result in results.values() if "error" in result]
+        result = results.get(lm_studio_url, {})
+        available_models = result.get("models")
+        if available_models:
+            set_model_options(available_models)
+            if notify_success:
+                show_snackbar(f"{len(available_models)} Modelle von LM Studio geladen.", ft.Colors.GREEN)
+        elif available_models is not None:
+            show_snackbar("Keine Modelle in der Antwort von LM Studio gefunden.", ft.Colors.ORANGE)
+        if errors:
+            show_snackbar(" | ".join(errors), ft.Colors.RED)
+        page.update()
 
-        except requests.exceptions.RequestException as err:
-            show_snackbar(f"Fehler beim Abrufen der Modelle: {err}", ft.Colors.RED)
-        except Exception as err:
-            show_snackbar(f"Ein unerwarteter Fehler ist aufgetreten: {err}", ft.Colors.RED)
+    def set_model_options(available_models):
+        model_name_combobox.options = [ft.dropdown.Option(model) for model in available_models]
+        current_model = model_name_combobox.value
+        if current_model and current_model not in available_models:
+            # Keep the configured model selectable even if the server does not list it right now.
+            model_name_combobox.options.append(ft.dropdown.Option(current_model))
 
     def remove_category_widget(widget_to_remove):
         categories_column.controls.remove(widget_to_remove)
@@ -174,6 +369,9 @@ def main(page: ft.Page):
             if not any(opt.key == model_name for opt in model_name_combobox.options):
                  model_name_combobox.options.append(ft.dropdown.Option(model_name))
             model_name_combobox.value = model_name
+        # model_cascade in config.json replaces the dropdown selection; say so next to it.
+        models = run_models(config_manager.get_current_config())
+        model_name_combobox.helper_text = f"Kaskade aktiv: {' → '.join(models)}" if isinstance(models, list) else None
 
         categories_column.controls.clear()
         for category in config.get("categories", []):
@@ -219,8 +417,34 @@ def main(page: ft.Page):
             cat_ctrl.disabled = not enabled
         
         cancel_button.disabled = enabled
+        pause_button.disabled = enabled
+        pause_button.text = "Pausieren"
         page.update()
 
+    def on_job_state_change(state):
+        labels = {"running": "Processing...", "paused": "Paused", "cancelling": "Cancelling..."}
+        status_info_label.value = f"Status: {labels.get(state, state)}"
+        page.update(status_info_label)
+
+    def cancel_processing(e):
+        # Cooperative: the current file is finished and progress is checkpointed.
+        if current_job[0] is not None:
+            current_job[0].cancel()
+            pause_button.disabled = True
+            page.update(pause_button)
+
+    def toggle_pause_processing(e):
+        job = current_job[0]
+        if job is None:
+            return
+        if job.paused:
+            job.resume()
+            pause_button.text = "Pausieren"
+        else:
+            job.pause()
+            pause_button.text = "Fortsetzen"
+        page.update(pause_button)
+
     def start_processing(e):
         config = read_config_from_gui()
         pdf_dir = config.get("pdf_dir")
@@ -233,70 +457,70 @@ def main(page: ft.Page):
         # ...
 
         set_ui_enabled(False)
-        output_table.rows.clear()
+        table_updater.reset()
         progress_bar.value = 0
         progress_bar.visible = True
         status_info_label.value = "Status: Processing..."
         page.update()
 
         # Run processing in a separate thread to avoid blocking the UI
-        thread = threading.Thread(target=run_processing_thread, args=(config,))
+        current_job[0] = ProcessingJob(on_state_change=on_job_state_change)
+        thread = threading.Thread(target=run_processing_thread, args=(config, current_job[0]))
         thread.start()
 
-    def run_processing_thread(config):
+    def run_processing_thread(config, job):
         try:
+            import pdf_processor  # imported on first run so the window shows before the processing libraries load
             pdf_dir = config.get("pdf_dir")
             target_url = config.get("target_url")
             model_name = config.get("model_name")
-            all_categories = config.get("categories", [])
-            base_template = config.get("base_prompt_template")
-
-            valid_active_categories = [
-                cat for cat in all_categories 
-                if cat.get("active", False) and cat.get("name", "").strip() and cat.get("directory", "").strip()
-            ]
-            
-            category_definitions = [f"### {i+1}. {cat['name']}\n{cat['prompt']}" for i, cat in enumerate(valid_active_categories)]
-            assembled_prompt = base_template.replace("{{category_definitions}}", "\n\n".join(category_definitions))
-            category_map = {cat['name']: cat['directory'] for cat in valid_active_categories}
+            assembled_prompt, category_map = assemble_prompt(config)
             category_map_json = json.dumps(category_map)
 
-            pdf_files = list(pathlib.Path(pdf_dir).glob("*.pdf"))
-            total_pdfs = len(pdf_files)
-            processed_pdfs_count = [0] # Mutable list to track count in inner function
-
-            def progress_callback(data):
-                output_table.rows.append(
-                    ft.DataRow(cells=[
-                        ft.DataCell(ft.Text(data.get('original_filename', ''))),
-                        ft.DataCell(ft.Text(data.get('checksum', ''))),
-                        ft.DataCell(ft.Text(data.get('new_filename', ''))),
-                        ft.DataCell(ft.Text(data.get('status', ''))),
-                        ft.DataCell(ft.Text(data.get('target_folder', ''))),
-                        ft.DataCell(ft.Text(data.get('error_message', ''))),
-                    ])
-                )
-                processed_pdfs_count[0] += 1
-                if total_pdfs > 0:
-                    progress_bar.value = processed_pdfs_count[0] / total_pdfs
-                page.update()
+            # Results are queued here and flushed to the page by the updater thread.
+            table_updater.start()
 
+            stored_config = config_manager.get_current_config()
+            models = run_models(stored_config, model_name)
+            if isinstance(models, list):
+                status_info_label.value = f"Status: Processing... (Modell-Kaskade: {' → '.join(models)})"
+                page.update(status_info_label)
             pdf_processor.process_pdfs(
                 pdf_dir,
                 target_url,
-                model_name,
+                models,
                 assembled_prompt,
                 category_map_json,
-                progress_callback=progress_callback
+                progress_callback=table_updater.add,
+                render_workers=stored_config.get("render_workers", 0),
+                memory_budget_mb=stored_config.get("memory_budget_mb", 0),
+                classifier=classifier_settings(stored_config),
+                quarantine_dir=stored_config.get("quarantine_dir", "QUARANTINE"),
+                max_pdf_size_mb=stored_config.get("max_pdf_size_mb", 0),
+                render_cache_mb=stored_config.get("render_cache_mb", 0),
+                render_cache_dir=stored_config.get("render_cache_dir", ""),
+                shard_layout=shard_layouts(stored_config),
+                catalog=stored_config.get("catalog", True),
+                profile=stored_config.get("profile_runs", False),
+                recursive=stored_config.get("recursive_scan", False),
+                include_patterns=stored_config.get("include_patterns", []),
+                exclude_patterns=stored_config.get("exclude_patterns", []),
+                job=job
             )
 
-            status_info_label.value = "Status: Processing Complete"
-            show_snackbar("✅ Verarbeitung abgeschlossen.", ft.Colors.GREEN)
+            if job.cancelled:
+                status_info_label.value = "Status: Cancelled"
+                show_snackbar("Verarbeitung abgebrochen. Der nächste Lauf setzt beim nächsten unverarbeiteten PDF fort.", ft.Colors.ORANGE)
+            else:
+                status_info_label.value = "Status: Processing Complete"
+                show_snackbar("✅ Verarbeitung abgeschlossen.", ft.Colors.GREEN)
 
         except Exception as ex:
             status_info_label.value = "Status: Error"
             show_snackbar(f"❌ Fehler bei der Verarbeitung: {ex}", ft.Colors.RED)
         finally:
+            current_job[0] = None
+            table_updater.stop()
             progress_bar.visible = False
             set_ui_enabled(True)
             page.update()
@@ -310,7 +534,8 @@ def main(page: ft.Page):
     reset_config_button = ft.ElevatedButton("Auf Standard zurücksetzen", on_click=reset_config)
     add_category_button = ft.ElevatedButton("Neue Kategorie hinzufügen", on_click=add_category_widget)
     start_button = ft.ElevatedButton("Verarbeitung starten", on_click=start_processing, bgcolor=ft.Colors.BLUE, color=ft.Colors.WHITE)
-    cancel_button = ft.ElevatedButton("Verarbeitung abbrechen", disabled=True) # Note: Cancel logic is complex with subprocess and not implemented here for brevity.
+    cancel_button = ft.ElevatedButton("Verarbeitung abbrechen", on_click=cancel_processing, disabled=True)
+    pause_button = ft.ElevatedButton("Pausieren", on_click=toggle_pause_processing, disabled=True)
 
     # --- Initial Config Load ---
     load_config(None)
@@ -384,13 +609,15 @@ def main(page: ft.Page):
                             controls=[
                                 ft.Row(
                                     alignment=ft.MainAxisAlignment.CENTER,
-                                    controls=[start_button, cancel_button]
+                                    controls=[start_button, pause_button, cancel_button]
                                 ),
                                 progress_bar,
                                 ft.Divider(),
                                 ft.Row([
                                     status_info_label,
                                 ]),
+                                results_info_label,
+                                table_updater.navigation,
                                 ft.Column([output_table], scroll=ft.ScrollMode.ALWAYS, expand=True)
                             ]
                         )
@@ -401,5 +628,16 @@ def main(page: ft.Page):
         )
     )
 
+    # --- Model list: cached list first, refreshed in the background ---
+    cached, fetched_at = cached_models(config_manager.get_current_config(), target_url_input.value)
+    if cached:
+        set_model_options(cached)
+        status_info_label.value = f"Status: Idle ({len(cached)} Modelle aus dem Cache, Stand: {format_cache_age(fetched_at)})"
+        page.update()
+    if target_url_input.value:
+        fetch_lm_studio_models(None)
+
 if __name__ == "__main__":
+    # Needed for the render process pool in frozen (PyInstaller) builds.
+    multiprocessing.freeze_support()
     ft.app(target=main)
@@ -0,0 +1,128 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+# --- IMPORT-TIME BENCHMARK ---
+# Misst mit `python -X importtime` die Importzeit der Einstiegsmodule in einem
+# frischen Interpreter und prüft sie gegen ein Budget. Zusätzlich darf beim Import
+# keine der schweren Verarbeitungsbibliotheken geladen werden; diese werden erst
+# beim ersten Lauf importiert.
+#
+#   python import_benchmark.py                 # alle Module, Standardbudgets
+#   python import_benchmark.py --budget gui=300 --repeat 5 --json
+
+# Kumulierte Importzeit in ms (Minimum über --repeat Läufe).
+DEFAULT_BUDGETS_MS = {
+    "pdf_processor": 150,
+    "watch_daemon": 150,
+    "gui": 250,
+    "gui_flet": 600,
+}
+
+# Dürfen beim Import der Einstiegsmodule nicht geladen werden.
+HEAVY_MODULES = ("fitz", "pymupdf", "PIL", "openai", "httpx", "requests", "numpy")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure_import(module, cwd=None):
+    """Importiert module in einem frischen Interpreter.
+
+    Gibt (kumulierte Zeit in µs, {Modulname: kumulierte µs}) zurück; das Dictionary enthält
+    nur Module, die beim Import von module geladen wurden (nicht den Interpreterstart).
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Import von '{module}' fehlgeschlagen:\n{completed.stderr[-2000:]}")
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(2)), len(match.group(3))))
+    # Kinder stehen vor ihrem Elternmodul und sind tiefer eingerückt.
+    for index in range(len(entries) - 1, -1, -1):
+        name, cumulative_us, depth = entries[index]
+        if name == module:
+            modules = {}
+            for child_name, child_us, child_depth in reversed(entries[:index]):
+                if child_depth <= depth:
+                    break
+                modules[child_name] = child_us
+            return cumulative_us, modules
+    return 0, {}
+
+
+def check_module(module, budget_ms, repeat=3, cwd=None):
+    """Misst ein Modul repeat-mal und prüft Budget und verbotene Importe."""
+    best_us, modules = None, {}
+    for _ in range(max(1, repeat)):
+        total_us, run_modules = measure_import(module, cwd)
+        if best_us is None or total_us < best_us:
+            best_us, modules = total_us, run_modules
+    heavy = sorted(name for name in modules if name in HEAVY_MODULES)
+    slowest = sorted(((us, name) for name, us in modules.items() if name != module), reverse=True)[:5]
+    return {
+        "module": module,
+        "import_ms": round(best_us / 1000, 1),
+        "budget_ms": budget_ms,
+        "heavy_imports": heavy,
+        "slowest": [{"module": name, "ms": round(us / 1000, 1)} for us, name in slowest],
+        "ok": best_us / 1000 <= budget_ms and not heavy,
+    }
+
+
+def _parse_budgets(values):
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for value in values or []:
+        module, _, ms = value.partition("=")
+        if not ms:
+            raise argparse.ArgumentTypeError(f"Erwartet MODUL=MS, erhalten: {value}")
+        budgets[module] = float(ms)
+    return budgets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prüft die Importzeit der Einstiegsmodule gegen ein Budget.")
+    parser.add_argument("modules", nargs="*", help="Zu prüfende Module (Standard: alle mit Budget)")
+    parser.add_argument("--budget", action="append", metavar="MODUL=MS", help="Budget überschreiben oder ergänzen")
+    parser.add_argument("--repeat", type=int, default=3, help="Messungen pro Modul; das Minimum zählt")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    args = parser.parse_args(argv)
+
+    budgets = _parse_budgets(args.budget)
+    modules = args.modules or list(budgets)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    results = []
+    for module in modules:
+        try:
+            results.append(check_module(module, budgets.get(module, float("inf")), args.repeat, cwd))
+        except RuntimeError as e:
+            results.append({"module": module, "ok": False, "error": str(e)})
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        for result in results:
+            if "error" in result:
+                print(f"FEHLER  {result['module']}: {result['error']}")
+                continue
+            flag = "OK    " if result["ok"] else "ÜBER  "
+            print(f"{flag}{result['module']:<16} {result['import_ms']:>8.1f} ms  (Budget {result['budget_ms']} ms)")
+            if result["heavy_imports"]:
+                print(f"        lädt schwere Module beim Import: {', '.join(result['heavy_imports'])}")
+            if not result["ok"]:
+                for entry in result["slowest"]:
+                    print(f"        {entry['ms']:>8.1f} ms  {entry['module']}")
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
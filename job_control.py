@@ -0,0 +1,133 @@
+import os
+import pathlib
+import threading
+
+# --- JOB CONTROL ---
+# Kooperatives Abbrechen/Pausieren eines Laufs und ein Checkpoint, damit ein
+# späterer Lauf bei der nächsten unverarbeiteten Datei weitermacht.
+
+CHECKPOINT_FILE_NAME = ".pdf_rename_checkpoint"
+
+STATE_RUNNING = "running"
+STATE_PAUSED = "paused"
+STATE_CANCELLING = "cancelling"
+
+
+class ProcessingJob:
+    """Steuert einen laufenden process_pdfs-Aufruf von einem anderen Thread aus.
+
+    Pause und Abbruch greifen zwischen zwei Dateien: die laufende LLM-Anfrage wird
+    noch beendet und ihr Ergebnis einsortiert, danach werden keine neuen Dateien
+    mehr gestartet. on_state_change(state) wird bei jedem Zustandswechsel aufgerufen.
+    """
+
+    def __init__(self, on_state_change=None):
+        self._cancel = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self.on_state_change = on_state_change
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set() and not self._cancel.is_set()
+
+    @property
+    def state(self):
+        if self.cancelled:
+            return STATE_CANCELLING
+        return STATE_PAUSED if self.paused else STATE_RUNNING
+
+    def _notify(self):
+        if self.on_state_change:
+            self.on_state_change(self.state)
+
+    def pause(self):
+        if not self.cancelled and self._resume.is_set():
+            self._resume.clear()
+            self._notify()
+
+    def resume(self):
+        if not self._resume.is_set():
+            self._resume.set()
+            self._notify()
+
+    def cancel(self):
+        if not self.cancelled:
+            self._cancel.set()
+            self._resume.set()  # ein pausierter Lauf soll sofort aufwachen
+            self._notify()
+
+    def wait_if_paused(self):
+        """Blockiert, solange pausiert ist. Gibt False zurück, wenn der Job abgebrochen wurde."""
+        self._resume.wait()
+        return not self.cancelled
+
+    def handle_command(self, command):
+        """Führt ein Textkommando aus ('pause', 'resume', 'cancel'). Gibt True zurück, wenn es bekannt war."""
+        action = {"pause": self.pause, "resume": self.resume, "cancel": self.cancel}.get(command.strip().lower())
+        if action is None:
+            return False
+        action()
+        return True
+
+
+class RunCheckpoint:
+    """Append-only Liste erledigter Dateien im PDF-Verzeichnis.
+
+    Jede Zeile ist 'relativer Pfad<TAB>Größe<TAB>mtime_ns'; eine Datei gilt nur als
+    erledigt, solange sie unverändert ist. Nach einem vollständigen Lauf wird der
+    Checkpoint gelöscht.
+    """
+
+    def __init__(self, pdf_dir):
+        self.pdf_dir = pathlib.Path(pdf_dir)
+        self.path = self.pdf_dir / CHECKPOINT_FILE_NAME
+        self.done = self._load()
+        self._file = None
+
+    def _key(self, pdf_path):
+        st = os.stat(pdf_path)
+        rel_path = pathlib.Path(pdf_path).relative_to(self.pdf_dir).as_posix()
+        return f"{rel_path}\t{st.st_size}\t{st.st_mtime_ns}"
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return {line.rstrip("\n") for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def is_done(self, pdf_path):
+        try:
+            return self._key(pdf_path) in self.done
+        except (OSError, ValueError):
+            return False
+
+    def mark_done(self, pdf_path):
+        try:
+            key = self._key(pdf_path)
+        except (OSError, ValueError):
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(key + "\n")
+        self._file.flush()
+        self.done.add(key)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """Entfernt den Checkpoint nach einem vollständig abgeschlossenen Lauf."""
+        self.close()
+        self.done = set()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
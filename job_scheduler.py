@@ -0,0 +1,497 @@
+import os
+import sys
+import json
+import time
+import signal
+import pathlib
+import argparse
+import itertools
+import threading
+import contextlib
+import multiprocessing
+from collections import deque
+
+from render_pool import RenderPool
+from pdf_scanner import PdfScanner
+from job_control import ProcessingJob, RunCheckpoint
+from run_journal import RunJournal, recover_journals
+from pdf_processor import (
+    PdfProcessor, validate_job_spec, processor_summary, scan_exclude_dirs, open_catalog, retry_later
+)
+from preflight import QUARANTINE_DIR_NAME
+from event_protocol import EventWriter, EVENT_START, EVENT_RESULT, EVENT_PROGRESS, EVENT_STATE, EVENT_SUMMARY, EVENT_READY
+
+# --- MULTI-DIRECTORY SCHEDULER ---
+# Mehrere Jobs (Verzeichnis plus Konfigurations-Snapshot im Format von --job) teilen sich
+# einen Render-Pool und die Inferenz. Eine höhere Priorität hat immer Vorrang (ein
+# interaktiver Posteingang überholt ein Archiv-Backfill); Jobs gleicher Priorität
+# erhalten Dateien abwechselnd im Verhältnis ihres Gewichts.
+#
+#   python job_scheduler.py jobs.json            # Liste von Job-Spezifikationen, Ende wenn alle fertig
+#   python job_scheduler.py --serve              # Jobs und Kommandos jederzeit über stdin
+
+PRIORITIES = {"interactive": 10, "normal": 0, "backfill": -10}
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_PAUSED = "paused"
+STATE_DONE = "done"
+STATE_CANCELLED = "cancelled"
+
+# Gewichtung der jüngsten Messung im gleitenden Mittel der Sekunden pro Datei.
+EMA_ALPHA = 0.2
+
+
+def parse_priority(value):
+    """Priorität als Zahl (größer = wichtiger) oder als Name aus PRIORITIES."""
+    if isinstance(value, str) and value.strip().lower() in PRIORITIES:
+        return PRIORITIES[value.strip().lower()]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Ungültige Priorität: {value!r} (Zahl oder {', '.join(PRIORITIES)})")
+
+
+class ScheduledJob:
+    """Ein Verzeichnis im Scheduler mit eigenem Checkpoint, Journal und PdfProcessor."""
+
+    def __init__(self, job_id, spec, priority=0, weight=1.0, name=None):
+        self.job_id = job_id
+        self.spec = spec
+        self.priority = priority
+        self.weight = max(float(weight), 0.01)
+        self.pdf_dir = pathlib.Path(spec["pdf_dir"]).resolve()
+        self.name = name or self.pdf_dir.name
+        self.control = ProcessingJob()
+        self.ready = deque()  # gefundene, noch nicht eingereichte Dateien
+        self.feeding = True  # Suche und Checkpoint-Abgleich laufen noch
+        self.in_flight = 0  # eingereicht, aber noch nicht verarbeitet
+        self.virtual_time = 0.0
+        self.scanner = self.checkpoint = self.journal = self.processor = None
+        self.prepared = False  # Kategorie-Index und Katalog sind geöffnet (im Scheduler-Thread)
+        self.skipped = self.processed = self.succeeded = self.errors = 0
+        self.finished = False
+        self.started = time.perf_counter()
+
+    @property
+    def active(self):
+        return not self.finished
+
+    @property
+    def total(self):
+        return (self.scanner.discovered if self.scanner is not None else 0) - self.skipped
+
+    @property
+    def remaining(self):
+        return max(0, self.total - self.processed)
+
+    @property
+    def state(self):
+        if self.finished:
+            return STATE_CANCELLED if self.control.cancelled else STATE_DONE
+        if self.control.paused:
+            return STATE_PAUSED
+        return STATE_RUNNING if self.processed or self.in_flight else STATE_QUEUED
+
+
+class JobScheduler:
+    """Verteilt die Dateien mehrerer Jobs auf einen gemeinsamen Render-Pool und die Inferenz.
+
+    Vorrang hat die höchste Priorität mit bereitstehenden Dateien. Innerhalb einer Stufe
+    bekommt der Job mit der kleinsten virtuellen Zeit die nächste Datei; jede Datei rückt
+    sie um 1/weight vor (Stride-Scheduling). Ein Job, der nach einer Pause wieder Dateien
+    hat, wird auf die kleinste virtuelle Zeit seiner Stufe angehoben, damit er keinen
+    Vorsprung aufholt. Ein Vorrang greift nach höchstens `prefetch` bereits gerenderten Dateien.
+
+    on_event(event, **fields) erhält start/result/progress/state/summary, jeweils mit job_id.
+    """
+
+    def __init__(self, render_workers=0, memory_budget_mb=0, on_event=None, prefetch=None, max_pdf_size_mb=0,
+                 render_cache_mb=0, render_cache_dir=None):
+        self.render_pool = RenderPool(render_workers, memory_budget_bytes=int(memory_budget_mb or 0) * 1024 * 1024,
+                                      max_file_bytes=int(max_pdf_size_mb or 0) * 1024 * 1024,
+                                      cache_mb=render_cache_mb, cache_dir=render_cache_dir)
+        self.prefetch = prefetch or self.render_pool.workers
+        self.on_event = on_event or (lambda event, **fields: None)
+        self.jobs = {}
+        self.seconds_per_file = None
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._clients = {}
+        self._closing = False
+        self._last_result_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        self.render_pool.close()
+
+    # --- Jobs verwalten (aus beliebigen Threads) ---
+
+    def submit(self, spec, priority=0, weight=1.0, name=None):
+        """Plant einen Job ein und gibt seine job_id zurück; wirft ValueError bei ungültiger Spezifikation."""
+        validate_job_spec(spec)
+        if spec.get("plan_file"):
+            raise ValueError("Der Plan-Modus wird im Scheduler nicht unterstützt.")
+        if not pathlib.Path(spec["pdf_dir"]).is_dir():
+            raise ValueError(f"'{spec['pdf_dir']}' ist kein gültiges Verzeichnis.")
+        with self._cond:
+            if self._closing:
+                raise ValueError("Der Scheduler wird beendet.")
+            job = ScheduledJob(next(self._ids), spec, parse_priority(priority), weight, name)
+            if any(other.active and other.pdf_dir == job.pdf_dir for other in self.jobs.values()):
+                raise ValueError(f"Für '{job.pdf_dir}' ist bereits ein Job eingeplant.")
+            self.jobs[job.job_id] = job
+        try:
+            self._open(job)
+        except Exception:
+            with self._cond:
+                del self.jobs[job.job_id]
+            raise
+        job.control.on_state_change = lambda state: self.on_event(EVENT_STATE, job_id=job.job_id, state=state)
+        self.on_event(EVENT_START, job_id=job.job_id, name=job.name, pdf_dir=str(job.pdf_dir),
+                      priority=job.priority, weight=job.weight, model_name=spec["model_name"])
+        threading.Thread(target=self._feed, args=(job,), name=f"scheduler-feed-{job.job_id}", daemon=True).start()
+        return job.job_id
+
+    def pause(self, job_id):
+        self._job(job_id).control.pause()
+
+    def resume(self, job_id):
+        self._job(job_id).control.resume()
+        with self._cond:
+            self._cond.notify_all()
+
+    def cancel(self, job_id):
+        """Bricht einen Job ab; bereits gerenderte Dateien des Jobs werden verworfen, nicht verarbeitet."""
+        job = self._job(job_id)
+        job.control.cancel()
+        with self._cond:
+            job.ready.clear()
+            self._cond.notify_all()
+
+    def shutdown(self):
+        """Bricht alle Jobs ab; run() kehrt zurück, sobald keine Datei mehr in Arbeit ist."""
+        with self._cond:
+            self._closing = True
+            jobs = [job for job in self.jobs.values() if job.active]
+        for job in jobs:
+            self.cancel(job.job_id)
+
+    def status(self):
+        """Fortschritt aller Jobs (wie das progress-Ereignis)."""
+        with self._cond:
+            return [self._progress(job) for job in self.jobs.values()]
+
+    def _job(self, job_id):
+        try:
+            return self.jobs[int(job_id)]
+        except (KeyError, ValueError):
+            raise ValueError(f"Unbekannter Job: {job_id}")
+
+    def _client(self, target_url):
+        if target_url not in self._clients:
+            from openai import OpenAI
+            self._clients[target_url] = OpenAI(base_url=target_url, api_key="lm-studio")
+        return self._clients[target_url]
+
+    def _open(self, job):
+        spec = job.spec
+        category_map = spec["category_map"]
+        if isinstance(category_map, str):
+            category_map = json.loads(category_map)
+        rolled_forward, cleaned_up = recover_journals(job.pdf_dir)
+        if rolled_forward or cleaned_up:
+            print(f"[{job.name}] Journal-Wiederherstellung: {rolled_forward} Dateien abgeschlossen, "
+                  f"{cleaned_up} unvollständige Dateien entfernt.")
+        job.checkpoint = RunCheckpoint(job.pdf_dir)
+        if not spec.get("resume", True):
+            job.checkpoint.clear()
+        job.journal = RunJournal(job.pdf_dir)
+        job.processor = PdfProcessor(job.pdf_dir, spec["target_url"], spec["model_name"], spec["assembled_prompt"],
+                                     category_map, journal=job.journal, classifier=spec.get("classifier"),
+                                     render_pool=self.render_pool, client=self._client(spec["target_url"]),
+                                     quarantine_dir=spec.get("quarantine_dir", QUARANTINE_DIR_NAME),
+                                     shard_layout=spec.get("shard_layout"))
+        exclude_dirs = scan_exclude_dirs(category_map, spec.get("quarantine_dir", QUARANTINE_DIR_NAME))
+        job.scanner = PdfScanner(job.pdf_dir, spec.get("recursive", False), spec.get("include_patterns"),
+                                 spec.get("exclude_patterns"), exclude_dirs=exclude_dirs)
+
+    def _feed(self, job):
+        """Überträgt die gefundenen Dateien eines Jobs in seine Warteschlange (eigener Thread je Job)."""
+        try:
+            for pdf_path in job.scanner:
+                if job.control.cancelled:
+                    break
+                if job.checkpoint.done and job.checkpoint.is_done(pdf_path):
+                    job.skipped += 1
+                    continue
+                with self._cond:
+                    if job.control.cancelled:
+                        break
+                    if not job.ready and not job.in_flight:
+                        self._catch_up(job)
+                    job.ready.append(pdf_path)
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                job.feeding = False
+                self._cond.notify_all()
+
+    def _catch_up(self, job):
+        peers = [other.virtual_time for other in self.jobs.values()
+                 if other is not job and other.active and other.priority == job.priority and other.ready]
+        if peers:
+            job.virtual_time = max(job.virtual_time, min(peers))
+
+    # --- Verteilung (Scheduler-Thread) ---
+
+    def _prepare_jobs(self):
+        """Baut Kategorie-Index und Katalog neuer Jobs im Scheduler-Thread auf: der Index nutzt den
+        gemeinsamen Render-Pool, und die SQLite-Verbindung des Katalogs gehört dem Thread, der sie öffnet."""
+        with self._cond:
+            jobs = [job for job in self.jobs.values() if job.active and not job.prepared]
+        for job in jobs:
+            try:
+                if not job.control.cancelled:
+                    job.processor.ensure_index()
+                    if job.spec.get("catalog", True):
+                        job.processor.catalog = open_catalog(job.pdf_dir)
+            finally:
+                job.prepared = True
+
+    def _pick(self):
+        candidates = [job for job in self.jobs.values() if job.ready and job.active and job.prepared
+                      and not job.control.paused and not job.control.cancelled]
+        if not candidates:
+            return None
+        top = max(job.priority for job in candidates)
+        job = min((job for job in candidates if job.priority == top), key=lambda job: (job.virtual_time, job.job_id))
+        job.virtual_time += 1.0 / job.weight
+        return job
+
+    def _files(self, order):
+        """Liefert Dateien in fairer Reihenfolge, solange welche bereitstehen; order erhält den Job je Datei."""
+        while True:
+            with self._cond:
+                if any(job.active and not job.prepared for job in self.jobs.values()):
+                    return  # Runde auslaufen lassen; run() bereitet den neuen Job vor
+                job = self._pick()
+                if job is None:
+                    return
+                pdf_path = job.ready.popleft()
+                job.in_flight += 1
+            order.append(job)
+            yield pdf_path
+
+    def run(self, stop_when_idle=True):
+        """Verarbeitet, bis alle Jobs fertig sind (stop_when_idle) bzw. bis shutdown()."""
+        while True:
+            self._prepare_jobs()
+            order = deque()
+            for rendered in self.render_pool.imap(self._files(order), prefetch=self.prefetch):
+                self._process(order.popleft(), rendered)
+                self._finish_jobs()
+            self._last_result_at = None  # Leerlauf zählt nicht in die Sekunden pro Datei
+            self._finish_jobs()
+            with self._cond:
+                active = [job for job in self.jobs.values() if job.active]
+                if not active and (self._closing or stop_when_idle):
+                    return
+                if not any((job.ready or not job.prepared) and not job.control.paused for job in active):
+                    self._cond.wait(timeout=1.0)
+
+    def _process(self, job, rendered):
+        reported = [False]
+
+        def on_result(data):
+            reported[0] = True
+            if not retry_later(data):
+                job.checkpoint.mark_done(data["source_path"])
+            job.processed += 1
+            if data["status"] == "Error":
+                job.errors += 1
+            else:
+                job.succeeded += 1
+            data.update(job_id=job.job_id, total_files=job.total, scan_complete=not job.feeding)
+            self.on_event(EVENT_RESULT, **data)
+
+        try:
+            if not job.control.cancelled:
+                job.processor.process_rendered(rendered, on_result)
+        finally:
+            now = time.perf_counter()
+            with self._cond:
+                job.in_flight -= 1
+                if not reported[0] and not job.control.cancelled:
+                    job.processed += 1  # z.B. PDF ohne Seiten
+                if self._last_result_at is not None:
+                    interval = now - self._last_result_at
+                    self.seconds_per_file = (interval if self.seconds_per_file is None else
+                                             EMA_ALPHA * interval + (1 - EMA_ALPHA) * self.seconds_per_file)
+                self._last_result_at = now
+                progress = self._progress(job)
+            self.on_event(EVENT_PROGRESS, **progress)
+
+    def eta_seconds(self, job):
+        """Geschätzte Restdauer eines Jobs bei der aktuellen Verteilung (None ohne Messwerte).
+
+        Jobs höherer Priorität laufen vorher vollständig; von Jobs gleicher Priorität wird bis
+        zum Ende dieses Jobs der Anteil min(deren Rest, Rest * deren weight / weight) verarbeitet.
+        """
+        if self.seconds_per_file is None or job.control.paused:
+            return None
+        remaining = job.remaining
+        if not remaining:
+            return 0.0
+        others = [other for other in self.jobs.values() if other.active and not other.control.paused]
+        files = sum(other.remaining for other in others if other.priority > job.priority)
+        files += sum(min(other.remaining, remaining * other.weight / job.weight)
+                     for other in others if other.priority == job.priority)
+        return round(files * self.seconds_per_file, 1)
+
+    def _progress(self, job):
+        return {
+            "job_id": job.job_id,
+            "name": job.name,
+            "priority": job.priority,
+            "state": job.state,
+            "processed": job.processed,
+            "total": job.total,
+            "scan_complete": not job.feeding,
+            "queued": len(job.ready),
+            "eta_s": self.eta_seconds(job) if job.active else 0.0,
+        }
+
+    def _finish_jobs(self):
+        with self._cond:
+            finished = [job for job in self.jobs.values() if job.active and not job.in_flight and not job.ready
+                        and (not job.feeding or job.control.cancelled)]
+            for job in finished:
+                job.finished = True
+        for job in finished:
+            self._close_job(job)
+
+    def _close_job(self, job):
+        cancelled = job.control.cancelled
+        job.journal.close()
+        if cancelled:
+            job.checkpoint.close()
+        else:
+            job.checkpoint.clear()
+        if job.processor.catalog is not None:
+            job.processor.catalog.close()
+        job.processor.close()
+        self.on_event(EVENT_SUMMARY, job_id=job.job_id, name=job.name, ok=True, cancelled=cancelled,
+                      elapsed_s=round(time.perf_counter() - job.started, 3), processed=job.processed,
+                      succeeded=job.succeeded, errors=job.errors, skipped=job.skipped,
+                      **processor_summary(job.processor))
+
+
+def _split_entry(entry):
+    """Trennt priority/weight/name von der eigentlichen Job-Spezifikation."""
+    entry = dict(entry)
+    return entry, entry.pop("priority", 0), entry.pop("weight", 1.0), entry.pop("name", None)
+
+
+def load_jobs(path):
+    """Jobs aus einer JSON-Datei (Liste) oder JSON-Lines-Datei (ein Job pro Zeile)."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _handle_command(scheduler, line, writer):
+    """'pause <id>', 'resume <id>', 'cancel <id>' oder 'status'. Gibt False für 'shutdown' zurück."""
+    command, _, argument = line.strip().partition(" ")
+    command = command.lower()
+    if command == "shutdown":
+        return False
+    try:
+        if command == "status":
+            for progress in scheduler.status():
+                writer.emit(EVENT_PROGRESS, **progress)
+        elif command in ("pause", "resume", "cancel"):
+            getattr(scheduler, command)(argument.strip())
+        else:
+            print(f"Kommando ignoriert: {line.strip()}")
+    except ValueError as e:
+        print(e)
+    return True
+
+
+def _submit(scheduler, entry, writer):
+    try:
+        spec, priority, weight, name = _split_entry(entry)
+        scheduler.submit(spec, priority, weight, name)
+    except (ValueError, OSError) as e:
+        print(f"Job abgelehnt: {e}")
+        writer.emit(EVENT_SUMMARY, ok=False, cancelled=False, processed=0, succeeded=0, errors=0, error=str(e))
+
+
+def _read_input(scheduler, stream, writer):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                _submit(scheduler, json.loads(line), writer)
+            except json.JSONDecodeError as e:
+                print(f"Ungültige Job-Zeile: {e}")
+        elif not _handle_command(scheduler, line, writer):
+            break
+    scheduler.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mehrere PDF-Verzeichnisse mit Prioritäten gemeinsam verarbeiten.")
+    parser.add_argument("jobs", nargs="?", help="JSON-Liste oder JSON-Lines-Datei mit Job-Spezifikationen "
+                                                "(wie --job, zusätzlich priority, weight, name)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Jobs (JSON-Zeilen) und Kommandos (pause/resume/cancel <id>, status, shutdown) über stdin")
+    parser.add_argument("--render-workers", type=int, default=0, help="Render-Prozesse (0 = ein Prozess pro CPU-Kern)")
+    parser.add_argument("--memory-budget-mb", type=int, default=0, help="Speicherbudget des Render-Pools (0 = unbegrenzt)")
+    parser.add_argument("--max-pdf-size-mb", type=int, default=0,
+                        help="Größere PDFs werden von der Vorprüfung abgewiesen (0 = unbegrenzt, gilt für alle Jobs)")
+    parser.add_argument("--render-cache-mb", type=int, default=0,
+                        help="Obergrenze des gemeinsamen Render-Caches in MB (0 = aus)")
+    parser.add_argument("--render-cache-dir", default="", help="Ordner des Render-Caches (leer = Benutzer-Cache)")
+    args = parser.parse_args(argv)
+    if not args.jobs and not args.serve:
+        parser.error("Job-Datei oder --serve angeben.")
+
+    writer = EventWriter(sys.stdout)
+    # stdout gehört dem Ereignisstrom.
+    with contextlib.redirect_stdout(sys.stderr), \
+            JobScheduler(args.render_workers, args.memory_budget_mb, on_event=writer.emit,
+                         max_pdf_size_mb=args.max_pdf_size_mb, render_cache_mb=args.render_cache_mb,
+                         render_cache_dir=args.render_cache_dir) as scheduler:
+        # Nicht im Signal-Handler selbst: der Hauptthread kann gerade die Scheduler-Sperre halten.
+        def stop(*_args):
+            threading.Thread(target=scheduler.shutdown, name="scheduler-shutdown", daemon=True).start()
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        if args.jobs:
+            try:
+                entries = load_jobs(args.jobs)
+            except (OSError, ValueError) as e:
+                print(f"Fehler beim Laden der Jobs: {e}")
+                return 1
+            for entry in entries:
+                _submit(scheduler, entry, writer)
+        if args.serve:
+            threading.Thread(target=_read_input, args=(scheduler, sys.stdin, writer),
+                             name="scheduler-input", daemon=True).start()
+            writer.emit(EVENT_READY, pid=os.getpid())
+        scheduler.run(stop_when_idle=not args.serve)
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- MODEL DISCOVERY ---
+# Fragt /models aller konfigurierten Endpunkte parallel in einem Hintergrund-Thread
+# ab, damit die GUIs beim Start nicht blockieren, wenn der Inferenz-Server nicht läuft.
+# Die letzte bekannte Liste pro Endpunkt liegt in der Konfiguration unter "model_cache".
+
+DEFAULT_TIMEOUT = 3.0
+
+
+def normalize_base_url(url):
+    """Ergänzt '/v1', wie es LM Studio / OpenAI-kompatible Server erwarten."""
+    url = (url or "").strip().rstrip("/")
+    if url and not url.endswith("/v1"):
+        url += "/v1"
+    return url
+
+
+def configured_endpoints(config):
+    """target_url plus weitere Endpunkte aus "model_endpoints", ohne Duplikate."""
+    endpoints = []
+    for url in [config.get("target_url", "")] + list(config.get("model_endpoints", [])):
+        url = normalize_base_url(url)
+        if url and url not in endpoints:
+            endpoints.append(url)
+    return endpoints
+
+
+def fetch_models(base_url, timeout=DEFAULT_TIMEOUT):
+    """Gibt die Modell-IDs eines Endpunkts zurück; wirft requests.RequestException oder ValueError."""
+    import requests  # erst im Hintergrund-Thread, nicht beim Start der GUI
+    response = requests.get(f"{base_url}/models", timeout=timeout)
+    response.raise_for_status()
+    models_data = response.json()
+    if not isinstance(models_data, dict) or "data" not in models_data:
+        raise ValueError("Unerwartetes Format der Modellliste.")
+    return [model["id"] for model in models_data["data"] if "id" in model]
+
+
+def discover_models(endpoints, timeout=DEFAULT_TIMEOUT):
+    """Fragt alle Endpunkte parallel ab.
+
+    Gibt {url: {"models": [...], "fetched_at": ts}} bzw. {url: {"error": "..."}} zurück.
+    Die Gesamtdauer ist durch das Timeout eines einzelnen Endpunkts begrenzt.
+    """
+    import requests
+
+    def probe(url):
+        try:
+            return url, {"models": fetch_models(url, timeout), "fetched_at": time.time()}
+        except requests.exceptions.Timeout:
+            return url, {"error": f"Zeitüberschreitung beim Abrufen der Modelle von {url}/models."}
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            return url, {"error": f"Fehler beim Abrufen der Modelle von {url}/models: {e}"}
+
+    if not endpoints:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as pool:
+        return dict(pool.map(probe, endpoints))
+
+
+def discover_models_async(endpoints, on_done, timeout=DEFAULT_TIMEOUT):
+    """Startet discover_models in einem Daemon-Thread und ruft on_done(results) dort auf.
+
+    GUIs müssen das Ergebnis selbst in ihren UI-Thread übergeben (Qt: Signal).
+    """
+    thread = threading.Thread(target=lambda: on_done(discover_models(endpoints, timeout)),
+                              name="model-discovery", daemon=True)
+    thread.start()
+    return thread
+
+
+def cached_models(config, url):
+    """Letzte bekannte Modellliste eines Endpunkts und deren Abrufzeit (oder ([], None))."""
+    entry = config.get("model_cache", {}).get(normalize_base_url(url), {})
+    return list(entry.get("models", [])), entry.get("fetched_at")
+
+
+def format_cache_age(fetched_at):
+    """Kurze Altersangabe für Log-Meldungen, z.B. 'vor 5 Min.'."""
+    if not fetched_at:
+        return "unbekannt"
+    age = max(0, time.time() - fetched_at)
+    if age < 120:
+        return f"vor {int(age)} s"
+    if age < 7200:
+        return f"vor {int(age // 60)} Min."
+    if age < 172800:
+        return f"vor {int(age // 3600)} Std."
+    return f"vor {int(age // 86400)} Tagen"
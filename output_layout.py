@@ -0,0 +1,269 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import pathlib
+import argparse
+
+from pdf_scanner import iter_pdf_files
+
+# --- OUTPUT LAYOUT ---
+# Unterordner je Kategorie statt eines flachen Zielordners, z.B. "{category}/{yyyy}/{mm}".
+# Jahr, Monat und Tag stammen aus dem YYYYMMDD-Präfix des neuen Dateinamens; Dateien ohne
+# gültiges Datum landen unter UNDATED_YEAR/UNDATED_PART. Der erste Pfadteil ist immer der
+# Kategorieordner, damit Dateisuche, Kategorie-Index und Katalog unverändert funktionieren.
+#
+#   python output_layout.py migrate /pfad/zum/pdf_dir --config config.json --dry-run
+#   python output_layout.py migrate /pfad/zum/pdf_dir --layout "{category}/{yyyy}"
+
+FLAT_LAYOUT = "{category}"
+LAYOUT_FIELDS = {"category", "yyyy", "mm", "dd"}
+UNDATED_YEAR = "0000"
+UNDATED_PART = "00"
+MAX_RETRIES = 5
+
+_DATE_PREFIX_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})(?:_|$)")
+
+
+def validate_layout(pattern):
+    """Prüft ein Muster; wirft ValueError bei unbekannten Platzhaltern oder wenn es nicht mit {category} beginnt."""
+    parts = pattern.replace("\\", "/").split("/")
+    if parts[0] != "{category}":
+        raise ValueError(f"Ablage-Muster muss mit '{{category}}' beginnen: '{pattern}'")
+    for part in parts[1:]:
+        if part in ("", ".", ".."):
+            raise ValueError(f"Ungültiger Pfadteil im Ablage-Muster: '{pattern}'")
+        fields = {name for _, name, _, _ in string.Formatter().parse(part) if name is not None}
+        unknown = fields - LAYOUT_FIELDS
+        if unknown:
+            raise ValueError(f"Unbekannter Platzhalter im Ablage-Muster '{pattern}': {', '.join(sorted(unknown))}")
+    return "/".join(parts)
+
+
+def name_date_parts(filename_stem):
+    """(yyyy, mm, dd) aus dem Datumspräfix des Dateinamens, Platzhalterwerte ohne gültiges Datum."""
+    match = _DATE_PREFIX_RE.match(filename_stem)
+    if match:
+        year, month, day = match.groups()
+        if 1 <= int(month) <= 12 and 1 <= int(day) <= 31:
+            return year, month, day
+    return UNDATED_YEAR, UNDATED_PART, UNDATED_PART
+
+
+class OutputLayout:
+    """Bildet Kategorie und Dateiname auf den Zielordner (relativ zum Basisordner) ab.
+
+    layout: ein Muster für alle Kategorien oder {Kategoriename: Muster}, wobei "*" für alle
+    übrigen gilt. Leer/None bedeutet flache Ablage wie bisher.
+    """
+
+    def __init__(self, layout=None):
+        if isinstance(layout, dict):
+            patterns = {name: pattern for name, pattern in layout.items() if pattern}
+        else:
+            patterns = {"*": layout} if layout else {}
+        self.patterns = {name: validate_layout(pattern) for name, pattern in patterns.items()}
+
+    @property
+    def sharded(self):
+        return any(pattern != FLAT_LAYOUT for pattern in self.patterns.values())
+
+    def pattern(self, category_name):
+        return self.patterns.get(category_name) or self.patterns.get("*") or FLAT_LAYOUT
+
+    def target_subdir(self, category_name, category_dir, filename_stem):
+        """Zielordner relativ zum Basisordner für eine Datei der Kategorie."""
+        pattern = self.pattern(category_name)
+        if pattern == FLAT_LAYOUT:
+            return pathlib.Path(category_dir)
+        yyyy, mm, dd = name_date_parts(filename_stem)
+        shard = pattern.split("/", 1)[1].format(yyyy=yyyy, mm=mm, dd=dd, category=category_dir)
+        return pathlib.Path(category_dir) / shard
+
+
+class DirectoryCache:
+    """Merkt sich während eines Laufs, welche Zielordner schon angelegt sind (ein mkdir je Ordner)."""
+
+    def __init__(self):
+        self._known = set()
+
+    def ensure(self, directory):
+        directory = pathlib.Path(directory)
+        if directory not in self._known:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._known.add(directory)
+
+    def forget(self, directory):
+        """Nach einem Fehler im Ordner: beim nächsten Mal erneut anlegen (z.B. extern gelöscht)."""
+        self._known.discard(pathlib.Path(directory))
+
+    def clear(self):
+        self._known.clear()
+
+
+def _free_target(target_dir, stem, suffix):
+    """Freier Zielpfad; bei Kollision mit Zufallssuffix wie placement_plan.place_file."""
+    candidate = target_dir / f"{stem}{suffix}"
+    for _ in range(MAX_RETRIES):
+        if not candidate.exists():
+            return candidate
+        candidate = target_dir / f"{stem}_{random.randint(100, 999)}{suffix}"
+    return None
+
+
+def plan_migration(base_dir, category_map, layout):
+    """Ermittelt alle Dateien in den Kategorieordnern, die laut layout woanders liegen sollten.
+
+    Gibt (moves, unchanged) zurück; moves ist eine Liste von (Quelle, Zielordner).
+    """
+    base_dir = pathlib.Path(base_dir)
+    dir_labels = {}
+    for category, directory in category_map.items():
+        dir_labels.setdefault(pathlib.Path(directory).as_posix(), category)
+    moves, unchanged = [], 0
+    for directory, category in dir_labels.items():
+        folder = base_dir / directory
+        if not folder.is_dir():
+            continue
+        for pdf_path in iter_pdf_files(folder, recursive=True):
+            target_dir = base_dir / layout.target_subdir(category, directory, pdf_path.stem)
+            if pdf_path.parent == target_dir:
+                unchanged += 1
+            else:
+                moves.append((pdf_path, target_dir))
+    return moves, unchanged
+
+
+def migrate(base_dir, category_map, layout, dry_run=False, on_progress=None):
+    """Verschiebt bereits einsortierte Dateien in die Ordnerstruktur von layout (auch zurück auf flach).
+
+    Jede Datei wird einzeln per rename verschoben (gleiches Dateisystem, kein Kopieren); ein
+    abgebrochener Lauf hinterlässt einen gültigen Zwischenstand und kann einfach wiederholt werden.
+    Leer gewordene Unterordner werden entfernt, Katalog und Kategorie-Index auf die neuen Pfade
+    umgeschrieben. Gibt {'moved', 'renamed', 'unchanged', 'failed', 'seconds'} zurück.
+    """
+    started = time.perf_counter()
+    base_dir = pathlib.Path(base_dir)
+    moves, unchanged = plan_migration(base_dir, category_map, layout)
+    stats = {"moved": 0, "renamed": 0, "unchanged": unchanged, "failed": 0}
+    if dry_run:
+        stats["moved"] = len(moves)
+        stats["seconds"] = round(time.perf_counter() - started, 2)
+        return stats
+
+    directories = DirectoryCache()
+    done = []
+    left_dirs = set()
+    for number, (pdf_path, target_dir) in enumerate(moves, 1):
+        try:
+            directories.ensure(target_dir)
+            target = _free_target(target_dir, pdf_path.stem, pdf_path.suffix)
+            if target is None:
+                raise FileExistsError(f"Kein freier Name für {pdf_path.name} in {target_dir}")
+            os.rename(pdf_path, target)
+        except OSError as e:
+            print(f"Fehler beim Verschieben von {pdf_path}: {e}")
+            stats["failed"] += 1
+            continue
+        stats["moved"] += 1
+        if target.name != pdf_path.name:
+            stats["renamed"] += 1
+        done.append((pdf_path, target))
+        left_dirs.add(pdf_path.parent)
+        if on_progress and number % 1000 == 0:
+            on_progress(number, len(moves))
+
+    category_roots = {base_dir / pathlib.Path(directory) for directory in category_map.values()}
+    _remove_empty_dirs(left_dirs, category_roots)
+    _relocate_catalog(base_dir, done)
+    _relocate_index(base_dir, done)
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def _remove_empty_dirs(directories, keep):
+    """Entfernt leere Ordner von unten nach oben, nie einen Kategorieordner selbst."""
+    for directory in sorted(directories, key=lambda d: len(d.parts), reverse=True):
+        while directory not in keep and directory.parent != directory:
+            try:
+                directory.rmdir()
+            except OSError:
+                break  # nicht leer
+            directory = directory.parent
+
+
+def _relocate_catalog(base_dir, moves):
+    from document_catalog import CATALOG_FILE_NAME, DocumentCatalog
+
+    if not moves or not (base_dir / CATALOG_FILE_NAME).exists():
+        return
+    try:
+        with DocumentCatalog(base_dir) as catalog:
+            catalog.relocate(moves)
+    except Exception as e:
+        print(f"Katalog konnte nicht angepasst werden (document_catalog.py rebuild hilft): {e}")
+
+
+def _relocate_index(base_dir, moves):
+    from category_index import INDEX_FILE_NAME
+
+    if not moves or not (base_dir / INDEX_FILE_NAME).exists():
+        return
+    import category_index
+    try:
+        category_index.relocate_keys(base_dir, moves)
+    except Exception as e:
+        print(f"Kategorie-Index konnte nicht angepasst werden (wird beim nächsten Lauf neu aufgebaut): {e}")
+
+
+def _load_config(args):
+    """(category_map, layout) aus --job oder --config; --layout ersetzt das konfigurierte Muster."""
+    if args.job:
+        from pdf_processor import load_job_spec
+        job = load_job_spec(args.job)
+        category_map = job["category_map"]
+        category_map = json.loads(category_map) if isinstance(category_map, str) else category_map
+        layout = job.get("shard_layout")
+    else:
+        from configuration import ConfigManager, assemble_prompt, shard_layouts
+        config = ConfigManager(args.config).get_current_config()
+        category_map = assemble_prompt(config)[1]
+        layout = shard_layouts(config)
+    if args.layout is not None:
+        layout = args.layout
+    return category_map, OutputLayout(layout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ablagestruktur der Kategorieordner verwalten.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Einsortierte Dateien in die konfigurierte Struktur verschieben")
+    migrate_parser.add_argument("pdf_dir")
+    source = migrate_parser.add_mutually_exclusive_group()
+    source.add_argument("--config", default="config.json", help="Kategorien und shard_layout aus config.json")
+    source.add_argument("--job", help="Kategorien und shard_layout aus einer Job-Spezifikation")
+    migrate_parser.add_argument("--layout", default=None,
+                                help="Muster für alle Kategorien, z.B. '{category}/{yyyy}/{mm}' ('{category}' = flach)")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Nur zählen, nichts verschieben")
+    args = parser.parse_args(argv)
+
+    try:
+        category_map, layout = _load_config(args)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Fehler: {e}")
+        return 2
+    stats = migrate(args.pdf_dir, category_map, layout, args.dry_run,
+                    on_progress=lambda done, total: print(f"{done}/{total} Dateien verschoben"))
+    if args.dry_run:
+        print(f"{stats['moved']} Dateien würden verschoben, {stats['unchanged']} liegen bereits richtig.")
+    else:
+        print(f"{stats['moved']} Dateien verschoben ({stats['renamed']} wegen Namenskollision umbenannt), "
+              f"{stats['unchanged']} unverändert, {stats['failed']} Fehler, {stats['seconds']} s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
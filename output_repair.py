@@ -0,0 +1,177 @@
+import re
+import difflib
+import datetime
+
+# --- OUTPUT REPAIR ---
+# Deterministische Reparatur knapp verfehlter LLM-Antworten vor der Validierung:
+# Datumsformate normalisieren, Backticks/Anführungszeichen und Erklärzeilen entfernen,
+# Kategorien unscharf gegen die Category Map abgleichen und ein fehlendes Datum aus
+# der Textebene der PDF übernehmen. Jede Reparatur wird als kurze Meldung zurückgegeben.
+
+PLACEHOLDER_DATE = "19700101"
+
+# Ab diesem Ähnlichkeitswert (difflib) gilt eine Kategorie als gemeint.
+CATEGORY_CUTOFF = 0.8
+
+_GERMAN_MONTHS = {
+    "januar": 1, "jan": 1, "februar": 2, "feb": 2, "märz": 3, "maerz": 3, "mär": 3, "mrz": 3,
+    "april": 4, "apr": 4, "mai": 5, "juni": 6, "jun": 6, "juli": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sept": 9, "sep": 9, "oktober": 10, "okt": 10, "november": 11, "nov": 11,
+    "dezember": 12, "dez": 12,
+}
+
+_WRAPPER_CHARS = "`'\"*“”„‘’«» \t"
+
+# Datum am Anfang des Dateinamens: YYYY-MM-DD, YYYY.MM.DD, YYYY/MM/DD, YYYY_MM_DD ...
+_LEADING_ISO_RE = re.compile(r"^(\d{4})[-./_ ](\d{1,2})[-./_ ](\d{1,2})(?!\d)[-_.\s]*")
+# ... oder DD.MM.YYYY, DD-MM-YYYY, DD/MM/YYYY
+_LEADING_DMY_RE = re.compile(r"^(\d{1,2})[-./](\d{1,2})[-./](\d{4})(?!\d)[-_.\s]*")
+# YYYYMMDD gefolgt von etwas anderem als '_' (z.B. '20240115 lohnausweis')
+_LEADING_COMPACT_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})(?!\d)[-.\s]+")
+
+_ISO_RE = re.compile(r"(?<!\d)(\d{4})[-./](\d{1,2})[-./](\d{1,2})(?!\d)")
+_DMY_RE = re.compile(r"(?<!\d)(\d{1,2})\.\s?(\d{1,2})\.\s?(\d{4})(?!\d)|(?<!\d)(\d{1,2})[-/](\d{1,2})[-/](\d{4})(?!\d)")
+_DMY_TEXT_RE = re.compile(r"(?<!\d)(\d{1,2})\.?\s+([A-Za-zÄÖÜäöü]{3,9})\.?\s+(\d{4})(?!\d)")
+
+
+def _to_date(year, month, day):
+    """YYYYMMDD für ein plausibles Kalenderdatum, sonst None."""
+    try:
+        date = datetime.date(int(year), int(month), int(day))
+    except (TypeError, ValueError):
+        return None
+    if not 1970 <= date.year <= datetime.date.today().year + 1:
+        return None
+    return date.strftime("%Y%m%d")
+
+
+def find_document_date(text):
+    """Erstes plausibles Datum im Text (z.B. der Textebene der ersten Seite) als YYYYMMDD oder None.
+
+    Erkennt 2024-01-15, 15.01.2024, 15/01/2024 und '15. Januar 2024'.
+    """
+    if not text:
+        return None
+    candidates = []
+    for match in _ISO_RE.finditer(text):
+        candidates.append((match.start(), _to_date(*match.groups())))
+    for match in _DMY_RE.finditer(text):
+        day, month, year = match.groups()[:3] if match.group(1) else match.groups()[3:]
+        candidates.append((match.start(), _to_date(year, month, day)))
+    for match in _DMY_TEXT_RE.finditer(text):
+        month = _GERMAN_MONTHS.get(match.group(2).lower())
+        if month:
+            candidates.append((match.start(), _to_date(match.group(3), month, match.group(1))))
+    for _, date in sorted(candidates, key=lambda candidate: candidate[0]):
+        if date:
+            return date
+    return None
+
+
+def _strip_wrappers(model_output, repairs):
+    """Entfernt Code-Fences, Backticks/Anführungszeichen und Erklärzeilen um die eigentliche Antwort."""
+    lines = [line.strip() for line in model_output.strip().splitlines()]
+    lines = [line for line in lines if line and not line.startswith("```")]
+    if not lines:
+        return model_output
+    answer = next((line for line in lines if "|" in line), lines[0])
+    if len(lines) > 1:
+        repairs.append("Zusatzzeilen entfernt")
+    stripped = answer.strip(_WRAPPER_CHARS)
+    # Präfixe wie 'Output: ' oder 'Antwort: ' vor dem Datum
+    stripped = re.sub(r"^[A-Za-zÄÖÜäöü ]{2,20}:\s*(?=\d)", "", stripped)
+    if stripped != answer:
+        repairs.append("Umschließende Zeichen entfernt")
+    return stripped
+
+
+def _repair_date(name_part, text_date, repairs):
+    """Bringt das Datum am Anfang des Namens in die Form YYYYMMDD_."""
+    for pattern, order in ((_LEADING_ISO_RE, "ymd"), (_LEADING_DMY_RE, "dmy"), (_LEADING_COMPACT_RE, "ymd")):
+        match = pattern.match(name_part)
+        if not match:
+            continue
+        year, month, day = match.groups() if order == "ymd" else reversed(match.groups())
+        date = _to_date(year, month, day)
+        if date:
+            rest = name_part[match.end():]
+            repairs.append(f"Datum '{match.group(0).strip(' -_.')}' -> {date}")
+            name_part = f"{date}_{rest}"
+            break
+
+    if re.match(r"^\d{8}_", name_part):
+        if name_part.startswith(PLACEHOLDER_DATE + "_") and text_date:
+            repairs.append(f"Platzhalterdatum durch Datum aus der Textebene ersetzt ({text_date})")
+            name_part = text_date + name_part[len(PLACEHOLDER_DATE):]
+        return name_part
+
+    # Kein Datum am Anfang: ein Datum im Namen nach vorne ziehen, sonst die Textebene verwenden.
+    for pattern in (_ISO_RE, _DMY_RE):
+        match = pattern.search(name_part)
+        if not match:
+            continue
+        groups = [g for g in match.groups() if g is not None]
+        date = _to_date(*groups) if pattern is _ISO_RE else _to_date(groups[2], groups[1], groups[0])
+        if date:
+            rest = (name_part[:match.start()] + name_part[match.end():]).strip(" -_.")
+            repairs.append(f"Datum aus dem Namen nach vorne gezogen ({date})")
+            return f"{date}_{rest}"
+    if text_date and name_part:
+        repairs.append(f"Fehlendes Datum aus der Textebene ergänzt ({text_date})")
+        return f"{text_date}_{name_part.lstrip(' -_.')}"
+    return name_part
+
+
+def _normalize_category(name):
+    return re.sub(r"[^0-9A-Z]", "", name.upper())
+
+
+def match_category(category_name, category_names):
+    """Ordnet einen Kategorienamen der Category Map zu (Groß-/Kleinschreibung, Leerzeichen, Tippfehler).
+
+    Gibt den exakten Schlüssel oder None zurück.
+    """
+    if category_name in category_names:
+        return category_name
+    normalized = {_normalize_category(name): name for name in category_names}
+    wanted = _normalize_category(category_name)
+    if wanted in normalized:
+        return normalized[wanted]
+    close = difflib.get_close_matches(wanted, list(normalized), n=2, cutoff=CATEGORY_CUTOFF)
+    if len(close) == 1 or (len(close) == 2 and
+                           difflib.SequenceMatcher(None, wanted, close[0]).ratio() >
+                           difflib.SequenceMatcher(None, wanted, close[1]).ratio()):
+        return normalized[close[0]]
+    return None
+
+
+def repair_model_output(model_output, category_names, text_date=None):
+    """Repariert eine LLM-Antwort im Format 'YYYYMMDD_beschreibung|KATEGORIE'.
+
+    category_names: gültige Kategorienamen (Schlüssel der Category Map).
+    text_date: optional ein Datum aus der Textebene (YYYYMMDD) für fehlende Datumsangaben.
+    Gibt (reparierte Antwort, [Reparaturmeldungen]) zurück; ohne Reparatur ist die Liste leer
+    und die Antwort unverändert.
+    """
+    repairs = []
+    output = _strip_wrappers(model_output, repairs)
+    if "|" not in output:
+        return (output, repairs) if repairs else (model_output, [])
+
+    name_part, category_name = (part.strip(_WRAPPER_CHARS) for part in output.split("|", 1))
+    # Erklärungen hinter der Kategorie, z.B. 'STEUER (Lohnausweis)' oder 'STEUER - weil ...'
+    if category_name not in category_names:
+        category_head = re.split(r"\s*\(|\s+[-–]\s+|[:;,]\s*|\.(?:\s|$)|\s{2,}", category_name,
+                                 maxsplit=1)[0].strip(_WRAPPER_CHARS)
+        if category_head and category_head != category_name:
+            repairs.append("Zusatztext nach der Kategorie entfernt")
+            category_name = category_head
+
+    name_part = _repair_date(name_part, text_date, repairs)
+
+    matched = match_category(category_name, category_names)
+    if matched is not None and matched != category_name:
+        repairs.append(f"Kategorie '{category_name}' -> {matched}")
+        category_name = matched
+
+    return f"{name_part}|{category_name}", repairs
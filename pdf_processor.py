@@ -1,27 +1,39 @@
 import os
 import pathlib
-import io
-import base64
 import sys
 import json
-import fitz # PyMuPDF
-from PIL import Image
-from openai import OpenAI
 import re
-import shutil
-import random 
 import hashlib
+import multiprocessing
+import argparse
+import contextlib
+import signal
+import threading
+import queue
+import time
+from render_pool import RenderPool, peak_rss_bytes
+from pdf_scanner import PdfScanner
+from job_control import ProcessingJob, RunCheckpoint
+from run_journal import RunJournal, recover_journals, STATE_HASHED, STATE_INFERRED, STATE_FAILED
+from placement_plan import PlanWriter, place_file
+from output_repair import repair_model_output
+from preflight import quarantine_file, VERDICT_EMPTY, VERDICT_ERROR, VERDICT_CRASHED, QUARANTINE_VERDICTS, QUARANTINE_DIR_NAME
+from output_layout import OutputLayout, DirectoryCache
+from run_profiler import RunProfiler, resolve_profile_dir, stage
+from event_protocol import (
+    EventWriter, EVENT_START, EVENT_RESULT, EVENT_PROGRESS, EVENT_STATE, EVENT_SUMMARY, EVENT_READY
+)
+
+# openai wird erst bei Bedarf importiert: die GUIs und die Render-Worker
+# (spawn importiert dieses Modul erneut) sollen nicht auf httpx & Co. warten.
 
 # --- DYNAMIC CONFIGURATION ---
 # Moved to process_pdfs function arguments
 
-# --- HELPER FUNCTIONS (unchanged) ---
+# Obergrenze für die Antwort des Modells (Dateiname|Kategorie); evaluation.py vergleicht Alternativen.
+DEFAULT_MAX_TOKENS = 150
 
-def pil_image_to_base64(img: Image.Image, img_format: str = "JPEG") -> str:
-    """Konvertiert ein PIL Image-Objekt in einen Base64-String."""
-    buffered = io.BytesIO()
-    img.save(buffered, format=img_format)
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+# --- HELPER FUNCTIONS (unchanged) ---
 
 def clean_filename(filename: str) -> str:
     """Ersetzt Sonderzeichen durch Unterstriche und normalisiert."""
@@ -40,25 +52,30 @@ def generate_checksum(file_path: pathlib.Path) -> str:
             hasher.update(chunk)
     return hasher.hexdigest()[:10]
 
-def analyze_image_with_lm_studio(client, model_name, base64_image: str, prompt: str, original_filename: str) -> str:
+def _chat_request(model_name, base64_image, prompt, max_tokens=DEFAULT_MAX_TOKENS):
+    """Parameter der Chat-Completion für ein Bild plus Prompt (synchroner und asynchroner Client)."""
+    return dict(
+        model=model_name,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+                ],
+            }
+        ],
+        max_tokens=max_tokens,
+        temperature=0.1,
+    )
+
+def analyze_image_with_lm_studio(client, model_name, base64_image: str, prompt: str, original_filename: str,
+                                 max_tokens: int = DEFAULT_MAX_TOKENS) -> str:
     """Sendet die Base64-kodierte Bilddaten und den Prompt an das lokale LLM."""
     # sys.stdout.buffer.write(f"\n--- DEBUG: Initiating LLM call for: {original_filename} ---\n".encode('utf-8', 'replace'))
     # sys.stdout.flush()
     try:
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
-                    ],
-                }
-            ],
-            max_tokens=150,
-            temperature=0.1, 
-        )
+        response = client.chat.completions.create(**_chat_request(model_name, base64_image, prompt, max_tokens))
         llm_output = response.choices[0].message.content.strip()
         # sys.stdout.buffer.write(f"\n--- DEBUG: LLM Raw Output for {original_filename} ---\n".encode('utf-8', 'replace'))
         # sys.stdout.buffer.write(llm_output.encode('utf-8', 'replace'))
@@ -73,44 +90,369 @@ def analyze_image_with_lm_studio(client, model_name, base64_image: str, prompt:
         # sys.stdout.flush()
         return error_message
 
-def process_pdfs(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json, progress_callback=None):
+async def analyze_image_async(client, model_name, base64_image: str, prompt: str, original_filename: str,
+                              max_tokens: int = DEFAULT_MAX_TOKENS) -> str:
+    """Wie analyze_image_with_lm_studio, mit einem AsyncOpenAI-Client (aiter_process_pdfs)."""
+    try:
+        response = await client.chat.completions.create(**_chat_request(model_name, base64_image, prompt, max_tokens))
+        return response.choices[0].message.content.strip()
+    except Exception as e:  # CancelledError ist keine Exception und bricht den Aufruf ab
+        return f"LLM API Error: {e}"
+
+class ProcessingResult:
+    """Ergebnis einer Datei, wie es iter_process_pdfs und aiter_process_pdfs liefern.
+
+    Die Felder entsprechen dem Dict für progress_callback bzw. dem result-Ereignis (to_dict()).
     """
-    Main processing function.
-    progress_callback(data): data is a dict with keys:
-        'original_filename', 'checksum', 'new_filename', 'status', 'target_folder', 'error_message'
+    __slots__ = ("original_filename", "checksum", "new_filename", "status", "target_folder", "error_message",
+                 "source_path", "model", "repairs", "classifier", "preflight", "preview", "timings",
+                 "total_files", "scan_complete")
+
+    def __init__(self, original_filename="", checksum="", new_filename="", status="", target_folder="",
+                 error_message="", source_path="", model=None, repairs=(), classifier=None, preflight=None,
+                 preview=None, timings=None, total_files=0, scan_complete=False):
+        self.original_filename = original_filename
+        self.checksum = checksum
+        self.new_filename = new_filename
+        self.status = status  # "Success (<Kategorie>)", "Planned (<Kategorie>)" oder "Error"
+        self.target_folder = target_folder
+        self.error_message = error_message
+        self.source_path = source_path
+        self.model = model  # Modell, dessen Antwort verwendet wurde
+        self.repairs = list(repairs or ())
+        self.classifier = classifier  # Vorhersage des Kategorie-Index oder None
+        self.preflight = preflight  # Befund der Vorprüfung, None bei gesunden Dateien
+        self.preview = preview  # Vorschaubild im Render-Cache oder None
+        self.timings = dict(timings or {})  # Dauer je Schritt in ms
+        self.total_files = total_files  # bisher gefundene Dateien
+        self.scan_complete = scan_complete
+
+    @property
+    def ok(self):
+        return self.status != "Error"
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __repr__(self):
+        return (f"ProcessingResult({self.original_filename!r}, status={self.status!r}, "
+                f"new_filename={self.new_filename!r}, target_folder={self.target_folder!r})")
+
+# Prompt, wenn der Kategorie-Index die Kategorie bereits vergeben hat: nur noch der Dateiname.
+DESCRIPTION_PROMPT = (
+    "Your only task is to output a single line of text: `YYYYMMDD_description`. Do not add any explanation or extra text.\n\n"
+    "- **Date:** Start with the document's date. If no date is found, use `19700101`.\n"
+    "- **Description:** A short, clean description using keywords from the document (e.g., company, subject, person). "
+    "Use underscores `_` instead of spaces.\n\n"
+    "The document has already been filed under the category `{category}`.\n"
+    "Original Filename Hint: `{original_filename}`"
+)
+
+def _with_category(model_output, category):
+    """Hängt die vom Index vergebene Kategorie an die Antwort auf DESCRIPTION_PROMPT an."""
+    lines = [line.strip() for line in model_output.splitlines() if line.strip() and not line.strip().startswith("```")]
+    answer = next((line for line in lines if line.strip("`'\"")[:1].isdigit()), lines[0] if lines else "")
+    return f"{answer.split('|', 1)[0].strip()}|{category}"
+
+class PdfProcessor:
+    """Hält OpenAI-Client, Category Map und Render-Pool über mehrere Dateien hinweg warm.
+
+    Wird von process_pdfs für einen Batch-Lauf und vom Watch-Daemon für
+    einzeln eintreffende Dateien verwendet.
+    journal (RunJournal): optional; protokolliert die Zustandsübergänge jeder Datei.
+    plan_writer (PlanWriter): optional; Plan-Modus, Zielorte werden nur geplant statt kopiert.
+    memory_budget_mb: Obergrenze für gleichzeitig gehaltene Dokumente und Bilder (0 = unbegrenzt).
+    model_name: ein Modell oder eine Modell-Kaskade (Liste, günstigstes zuerst). Ein Modell der
+        Kaskade kommt nur zum Zug, wenn die Ausgabe des vorherigen nicht verwertbar ist oder 'OTHER' lautet.
+    classifier: Einstellungen des Kategorie-Index (siehe category_index.DEFAULT_SETTINGS); der Index
+        wird beim ersten Aufruf von process_files aus den Kategorieordnern aufgebaut.
+    render_pool / client: optional mit anderen Prozessoren geteilt (job_scheduler); ein übergebener
+        Render-Pool wird von close() nicht geschlossen.
+    quarantine_dir: Ordner unter output_base_dir für Dateien, die die Vorprüfung nicht bestehen
+        (leer = nur melden, nicht verschieben). max_pdf_size_mb gilt nur für einen eigenen Render-Pool.
+    render_cache_mb / render_cache_dir: Render-Cache eines eigenen Render-Pools (siehe render_cache, 0 = aus).
+    catalog (DocumentCatalog): optional; jede einsortierte Datei wird mit Text und Modellantwort aufgenommen.
+    shard_layout: Ablagestruktur unter den Kategorieordnern (siehe output_layout), z.B. "{category}/{yyyy}/{mm}"
+        oder {Kategoriename: Muster}; leer = flach. Angelegte Zielordner merkt sich directories.
+    max_tokens: Obergrenze für die Antwort des Modells je Aufruf.
     """
-    PDF_DIR = pathlib.Path(pdf_dir_str)
-    
-    try:
-        CATEGORY_MAP = json.loads(category_map_json)
-    except json.JSONDecodeError as e:
-        print(f"Fehler: Ungültiges JSON für Category Map: {e}")
-        return
+    def __init__(self, output_base_dir, target_url, model_name, assembled_prompt, category_map, render_workers=0,
+                 journal=None, plan_writer=None, memory_budget_mb=0, classifier=None, render_pool=None, client=None,
+                 quarantine_dir=QUARANTINE_DIR_NAME, max_pdf_size_mb=0, render_cache_mb=0, render_cache_dir=None,
+                 shard_layout=None, max_tokens=DEFAULT_MAX_TOKENS):
+        self.output_base_dir = pathlib.Path(output_base_dir)
+        self.max_tokens = max_tokens
+        self.layout = OutputLayout(shard_layout)
+        self.directories = DirectoryCache()
+        self.journal = journal
+        self.plan_writer = plan_writer
+        self.quarantine_dir = quarantine_dir
+        self.catalog = None
+        self.classifier = dict(classifier or {})
+        self.category_index = None
+        self.index_build_stats = None
+        self._index_signature = None
+        self._embedder = None
+        self.model_name = model_name
+        self.assembled_prompt = assembled_prompt
+        self.category_map = category_map
+        # Initialisiere den OpenAI-Client für LM Studio
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(base_url=target_url, api_key="lm-studio")
+        self.client = client
+        self._owns_render_pool = render_pool is None
+        if render_pool is None:
+            render_pool = RenderPool(render_workers, memory_budget_bytes=int(memory_budget_mb or 0) * 1024 * 1024,
+                                     max_file_bytes=int(max_pdf_size_mb or 0) * 1024 * 1024,
+                                     cache_mb=render_cache_mb, cache_dir=render_cache_dir)
+        self.render_pool = render_pool
 
-    MAX_RETRIES = 5 
+    def __enter__(self):
+        return self
 
-    # Initialisiere den OpenAI-Client für LM Studio
-    try:
-        client = OpenAI(base_url=target_url, api_key="lm-studio") 
-    except Exception as e:
-        print(f"Fehler bei der Initialisierung des OpenAI-Clients: {e}")
-        return
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-    OUTPUT_BASE_DIR = PDF_DIR
-    OUTPUT_BASE_DIR.mkdir(exist_ok=True)
+    def close(self):
+        self.save_index()
+        if self._owns_render_pool:
+            self.render_pool.close()
 
-    if not PDF_DIR.is_dir():
-        print(f"Fehler: '{PDF_DIR}' ist kein gültiges Verzeichnis.")
-        return
+    @property
+    def model_name(self):
+        return self.models[0]
 
-    print(f"Starte Dateiumbenennung und -verschiebung mit Modell '{model_name}' in: {PDF_DIR}")
-    print(f"Zielordner werden basierend auf Kategorien erstellt unter: {OUTPUT_BASE_DIR}")
+    @model_name.setter
+    def model_name(self, model_name):
+        self.models = [model_name] if isinstance(model_name, str) else [m for m in model_name if m]
+        if not self.models:
+            raise ValueError("Es wurde kein Modell angegeben.")
+        self.reset_stats()
 
-    processed_files_count = 0
-    pdf_files = list(PDF_DIR.glob("*.pdf"))
-    total_files = len(pdf_files)
+    def reset_stats(self):
+        # Pro Stufe der Kaskade: Aufrufe, gelöste Dateien und summierte LLM-Dauer.
+        self.tier_stats = [{"model": model, "calls": 0, "resolved": 0, "llm_ms": 0.0} for model in self.models]
+        # Reparierte Antworten und davon solche, die ohne Reparatur verworfen oder eskaliert worden wären.
+        self.repair_stats = {"repaired": 0, "reruns_avoided": 0, "repairs": 0}
+        # Kategorie-Index: Abfragen, direkt vergebene Kategorien und Übereinstimmung mit dem LLM,
+        # getrennt für alle Vorhersagen und für die, die der Index vergeben hätte (confident).
+        self.classifier_stats = {"queries": 0, "embed_ms": 0.0, "query_ms": 0.0, "assigned": 0,
+                                 "compared": 0, "agreed": 0, "confident_compared": 0, "confident_agreed": 0}
+        # Vorprüfung: Anzahl Problemdateien je Befund (encrypted, corrupt, empty, oversized).
+        self.preflight_stats = {}
 
-    for pdf_path in pdf_files:
+    @property
+    def classifier_mode(self):
+        return self.classifier.get("mode", "off")
+
+    def classifier_summary(self):
+        """Aufbau- und Abfragestatistik des Kategorie-Index (None, wenn er nicht aktiv ist)."""
+        if self.classifier_mode not in ("shadow", "assign"):
+            return None
+        stats = dict(self.classifier_stats)
+        queries = stats["queries"]
+        stats["avg_embed_ms"] = round(stats.pop("embed_ms") / queries, 1) if queries else 0.0
+        stats["avg_query_ms"] = round(stats.pop("query_ms") / queries, 2) if queries else 0.0
+        stats["agreement"] = round(stats["agreed"] / stats["compared"], 3) if stats["compared"] else None
+        stats["confident_agreement"] = (round(stats["confident_agreed"] / stats["confident_compared"], 3)
+                                        if stats["confident_compared"] else None)
+        return {"mode": self.classifier_mode, "index": self.index_build_stats, **stats}
+
+    def ensure_index(self):
+        """Baut den Kategorie-Index auf, falls er aktiv ist und sich Zielordner, Kategorien oder
+        Einstellungen seit dem letzten Aufbau geändert haben."""
+        if self.classifier_mode not in ("shadow", "assign"):
+            return
+        signature = json.dumps([str(self.output_base_dir), self.category_map, self.classifier], sort_keys=True)
+        if signature == self._index_signature:
+            return
+        self.save_index()
+        self._index_signature = signature
+        self.category_index = None
+        import category_index
+        settings = {**category_index.DEFAULT_SETTINGS, **self.classifier}
+        try:
+            if self._embedder is None or getattr(self._embedder, "model", "") != settings["embedding_model"]:
+                self._embedder = category_index.create_embedder(self.client, settings, self.client.base_url)
+            self.category_index, self.index_build_stats = category_index.build_index(
+                self.output_base_dir, self.category_map, self._embedder, self.render_pool.first_page_texts)
+        except Exception as e:
+            print(f"Kategorie-Index konnte nicht aufgebaut werden, Klassifikation nur per LLM: {e}")
+            return
+        stats = self.index_build_stats
+        print(f"Kategorie-Index ({self.classifier_mode}): {stats['indexed']} Dokumente, davon {stats['embedded']} "
+              f"neu eingebettet, in {stats['build_ms']:.0f} ms ({stats['embedder']})")
+
+    def save_index(self):
+        if self.category_index is None or not self.category_index.dirty:
+            return
+        import category_index
+        try:
+            self.category_index.save(self.output_base_dir / category_index.INDEX_FILE_NAME)
+        except OSError as e:
+            print(f"Kategorie-Index konnte nicht gespeichert werden: {e}")
+
+    def _predict_category(self, rendered):
+        """Bettet die Textebene ein und fragt den Index ab. Gibt (Prediction oder None, Vektor oder None) zurück."""
+        if self.category_index is None or not rendered.text.strip():
+            return None, None
+        started = time.perf_counter()
+        try:
+            vector = self._embedder.embed([rendered.text])[0]
+        except Exception as e:
+            print(f"  Einbettung fehlgeschlagen, Klassifikation per LLM: {e}")
+            return None, None
+        embedded = time.perf_counter()
+        settings = self.classifier
+        prediction = self.category_index.query(vector, settings.get("k", 5), settings.get("min_similarity", 0.75),
+                                               settings.get("min_agreement", 1.0))
+        self.classifier_stats["queries"] += 1
+        self.classifier_stats["embed_ms"] += (embedded - started) * 1000
+        self.classifier_stats["query_ms"] += (time.perf_counter() - embedded) * 1000
+        return prediction, vector
+
+    def _record_prediction(self, prediction, category_name):
+        """Vergleicht eine nicht angewendete Vorhersage mit der Kategorie des LLM."""
+        stats = self.classifier_stats
+        stats["compared"] += 1
+        stats["agreed"] += prediction.category == category_name
+        if prediction.confident:
+            stats["confident_compared"] += 1
+            stats["confident_agreed"] += prediction.category == category_name
+
+    def _quarantine(self, rendered):
+        """Zählt den Befund und verschiebt die Datei in die Quarantäne (nicht im Plan-Modus).
+
+        Nur eindeutige Befunde (QUARANTINE_VERDICTS) werden verschoben; ist die Prüfung selbst
+        gescheitert (error, crashed), bleibt die Datei liegen.
+        Gibt den Anzeigenamen des Quarantäne-Ordners zurück, leer wenn die Datei bleibt.
+        """
+        self.preflight_stats[rendered.preflight] = self.preflight_stats.get(rendered.preflight, 0) + 1
+        print(f"  Vorprüfung: {rendered.preflight} ({rendered.error})")
+        if (not self.quarantine_dir or self.plan_writer is not None
+                or rendered.preflight not in QUARANTINE_VERDICTS):
+            return ""
+        try:
+            target = quarantine_file(rendered.pdf_path, self.output_base_dir, self.quarantine_dir,
+                                     rendered.preflight, rendered.error)
+        except OSError as e:
+            print(f"  Quarantäne fehlgeschlagen: {e}")
+            return ""
+        print(f"  In Quarantäne verschoben: {target}")
+        return f"{self.quarantine_dir}/{rendered.preflight}"
+
+    def tier_summary(self):
+        """Statistik je Stufe der Kaskade, inkl. durchschnittlicher Latenz pro Aufruf."""
+        return [
+            {**stats, "llm_ms": round(stats["llm_ms"], 1),
+             "avg_llm_ms": round(stats["llm_ms"] / stats["calls"], 1) if stats["calls"] else 0.0}
+            for stats in self.tier_stats
+        ]
+
+    def _evaluate_model_output(self, model_output, text_date=None):
+        """Schritte 4 und 5: repariert, zerlegt und prüft die Modellausgabe.
+
+        Gibt (new_filename_base, category_name, error_message, escalation_reason, repairs) zurück.
+        escalation_reason ist gesetzt, wenn ein größeres Modell es erneut versuchen sollte;
+        repairs enthält die Meldungen der lokalen Reparatur (siehe output_repair).
+        """
+        if model_output.startswith("LLM API Error:"):
+            return "", "", model_output, "API-Fehler", []
+
+        # 4a. Knapp verfehlte Antworten lokal reparieren statt das Modell erneut zu fragen
+        repaired_output, repairs = repair_model_output(model_output, list(self.category_map), text_date)
+        if not repairs:
+            return self._check_model_output(model_output) + ([],)
+        result = self._check_model_output(repaired_output)
+        self.repair_stats["repaired"] += 1
+        self.repair_stats["repairs"] += len(repairs)
+        if result[3] is None and self._check_model_output(model_output)[3] is not None:
+            self.repair_stats["reruns_avoided"] += 1
+        return result + (repairs,)
+
+    def _check_model_output(self, model_output):
+        # 4. Parse LLM output
+        parts = model_output.split('|', 1)
+        if len(parts) != 2:
+            return "", "", "Parsing error: Output does not contain the expected '|' separator.", "kein '|'"
+        name_part = parts[0].strip()
+        category_name = parts[1].strip() # Keep original case for map lookup
+        new_filename_base = clean_filename(name_part)
+
+        # 5. Validate filename format
+        if not re.match(r'^\d{8}_.+', new_filename_base):
+            return new_filename_base, category_name, "Invalid filename format (expected YYYYMMDD_...)", "Dateinamenformat"
+
+        # Validate the category against the map keys
+        if category_name not in self.category_map:
+            return new_filename_base, category_name, "", f"ungültige Kategorie '{category_name}'"
+        if category_name == 'OTHER':
+            return new_filename_base, category_name, "", "Kategorie OTHER"
+        return new_filename_base, category_name, "", None
+
+    def process_files(self, pdf_files, progress_callback=None, job=None):
+        """Verarbeitet die Dateien der Reihe nach. Gibt die Anzahl analysierter Dateien zurück.
+
+        job (ProcessingJob): optional; Pause und Abbruch greifen zwischen zwei Dateien.
+        """
+        processed_files_count = 0
+        for data, analyzed in self.iter_results(pdf_files, job):
+            if analyzed:
+                processed_files_count += 1
+            if progress_callback:
+                progress_callback(data)
+        return processed_files_count
+
+    def iter_results(self, pdf_files, job=None):
+        """Wie process_files, liefert aber je Datei (Ergebnis-Dict, analysiert), sobald sie fertig ist."""
+        for rendered in self.iter_rendered(pdf_files, job):
+            results = []
+            analyzed = self.process_rendered(rendered, results.append)
+            for data in results:
+                yield data, analyzed
+
+    def iter_rendered(self, pdf_files, job=None):
+        """Baut bei Bedarf den Kategorie-Index auf und liefert die Dateien gerendert aus dem Render-Pool."""
+        self.ensure_index()
+        if job is not None:
+            pdf_files = _gated_by_job(pdf_files, job)
+        # 2. PDF Conversion läuft parallel im Render-Pool, die übrigen Schritte beim Aufrufer.
+        for rendered in self.render_pool.imap(pdf_files):
+            # Bereits gerenderte, aber noch nicht analysierte Dateien werden bei einem
+            # Abbruch verworfen; sie stehen nicht im Checkpoint und kommen beim nächsten Lauf dran.
+            if job is not None and not job.wait_if_paused():
+                return
+            yield rendered
+
+    def process_rendered(self, rendered, progress_callback=None):
+        """Führt die Schritte 1-8 für eine gerenderte PDF aus. Gibt True zurück, wenn die Datei analysiert wurde."""
+        steps = self.process_steps(rendered, progress_callback)
+        try:
+            request = next(steps)
+            while True:
+                with stage("llm"):
+                    model_output = analyze_image_with_lm_studio(self.client, *request, max_tokens=self.max_tokens)
+                request = steps.send(model_output)
+        except StopIteration as stop:
+            return stop.value
+
+    def process_steps(self, rendered, progress_callback=None):
+        """Die Schritte von process_rendered als Generator, ohne selbst das LLM aufzurufen.
+
+        Liefert je LLM-Aufruf (model_name, base64_image, prompt, original_filename) und erwartet die
+        Antwort per send(); der Rückgabewert (StopIteration.value) ist der von process_rendered.
+        So nutzen process_rendered (OpenAI) und aiter_process_pdfs (AsyncOpenAI) dieselben Schritte.
+        """
+        CATEGORY_MAP = self.category_map
+        OUTPUT_BASE_DIR = self.output_base_dir
+
+        started = time.perf_counter()
+        pdf_path = rendered.pdf_path
         original_filename = pdf_path.name
         pdf_stem = pdf_path.stem 
         checksum = "N/A"
@@ -118,201 +460,835 @@ def process_pdfs(pdf_dir_str, target_url, model_name, assembled_prompt, category
         status = "Error"
         error_message = ""
         target_folder_display = ""
-        doc = None
         model_output = ""
-        name_part = ""
         category_name = ""
         new_filename_base = ""
+        resolved_model = ""
+        repairs = []
+        classification = None
+        timings = {"render_ms": round(rendered.render_seconds * 1000, 1)}
 
-        print(f"\nProcessing file: {original_filename}...")
-        
-        # 1. Generate Checksum
-        try:
-            checksum = generate_checksum(pdf_path)
-        except Exception as e:
-            error_message = f"Checksum error: {e}"
+        def report(new_filename, status, target_folder, error_message):
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if self.journal is not None and status == "Error":
+                self.journal.record(pdf_path, STATE_FAILED, error=error_message)
             if progress_callback:
                 progress_callback({
                     "original_filename": original_filename,
                     "checksum": checksum,
-                    "new_filename": "",
-                    "status": "Error",
-                    "target_folder": "",
-                    "error_message": error_message
+                    "new_filename": new_filename,
+                    "status": status,
+                    "target_folder": target_folder,
+                    "error_message": error_message,
+                    "source_path": str(pdf_path),
+                    "model": resolved_model,
+                    "repairs": repairs,
+                    "classifier": classification,
+                    "preflight": rendered.preflight,
+                    "preview": rendered.preview,
+                    "timings": timings
                 })
-            continue
 
-        # 2. PDF Conversion
+        print(f"\nProcessing file: {original_filename}...")
+
+        # 0. Preflight: defekte, verschlüsselte, leere oder zu große Dateien nicht weiter verarbeiten
+        if rendered.preflight is None and rendered.error is None and rendered.page_count == 0:
+            rendered.preflight, rendered.error = VERDICT_EMPTY, "Keine Seiten"
+        if rendered.preflight is not None:
+            target_folder_display = self._quarantine(rendered)
+            report("", "Error", target_folder_display, f"Preflight ({rendered.preflight}): {rendered.error}")
+            return False
+
+        # 1. Generate Checksum (der Render-Worker hat die Datei bereits gehasht)
+        stage_started = time.perf_counter()
         try:
-            doc = fitz.open(pdf_path)
-            if doc.page_count == 0:
-                doc.close()
-                continue
-            page = doc.load_page(0)
-            zoom = 1.5 
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            img_data = pix.tobytes(output="jpeg", jpg_quality=85)
-            image = Image.open(io.BytesIO(img_data))
-            base64_img = pil_image_to_base64(image, img_format="JPEG")
-            del image
+            checksum = rendered.digest[:10] if rendered.digest else generate_checksum(pdf_path)
         except Exception as e:
-            if doc: doc.close()
-            error_message = f"PDF conversion error: {e}"
-            if progress_callback:
-                progress_callback({
-                    "original_filename": original_filename,
-                    "checksum": checksum,
-                    "new_filename": "",
-                    "status": "Error",
-                    "target_folder": "",
-                    "error_message": error_message
-                })
-            continue
+            report("", "Error", "", f"Checksum error: {e}")
+            return False
+        timings["checksum_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+        if self.journal is not None:
+            self.journal.record(pdf_path, STATE_HASHED, checksum=checksum)
 
-        # 3. LLM Call
-        dynamic_prompt = assembled_prompt.format(original_filename=pdf_stem)
-        model_output = analyze_image_with_lm_studio(client, model_name, base64_img, dynamic_prompt, original_filename)
-        
-        if model_output.startswith("LLM API Error:"):
-            if doc: doc.close()
-            error_message = model_output
-            if progress_callback:
-                progress_callback({
-                    "original_filename": original_filename,
-                    "checksum": checksum,
-                    "new_filename": "",
-                    "status": "Error",
-                    "target_folder": "",
-                    "error_message": error_message
-                })
-            continue
+        # 2. PDF Conversion (Ergebnis aus dem Render-Pool)
+        if rendered.error is not None:
+            report("", "Error", "", f"PDF conversion error: {rendered.error}")
+            return False
+        base64_img = rendered.base64_image
 
-        # 4. Parse LLM output
-        try:
-            parts = model_output.split('|', 1)
-            if len(parts) == 2:
-                name_part = parts[0].strip()
-                category_name = parts[1].strip() # Keep original case for map lookup
-                
-                new_filename_base = clean_filename(name_part)
-                
-                # Validate the category against the map keys
-                if category_name not in CATEGORY_MAP:
-                    warning_msg = f"Model returned invalid category: '{category_name}'. Defaulting to 'OTHER'."
-                    print(f"  Warning for {original_filename}: {warning_msg}")
-                    category_name = 'OTHER' # Fallback
-            else:
-                raise ValueError("Output does not contain the expected '|' separator.")
-        except ValueError as ve:
-            if doc: doc.close()
-            error_message = f"Parsing error: {ve}"
-            if progress_callback:
-                progress_callback({
-                    "original_filename": original_filename,
-                    "checksum": checksum,
-                    "new_filename": "",
-                    "status": "Error",
-                    "target_folder": "",
-                    "error_message": error_message
-                })
-            continue
+        # 2b. Kategorie aus den nächsten Nachbarn bereits einsortierter Dokumente
+        stage_started = time.perf_counter()
+        with stage("classify"):
+            prediction, document_vector = self._predict_category(rendered)
+        assigned_category = None
+        if prediction is not None:
+            timings["classify_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+            if prediction.confident and self.classifier_mode == "assign" and prediction.category in CATEGORY_MAP:
+                assigned_category = prediction.category
+                self.classifier_stats["assigned"] += 1
+                print(f"  Kategorie aus dem Index: {assigned_category} (Übereinstimmung {prediction.agreement:.0%}, "
+                      f"Ähnlichkeit {prediction.similarity:.2f})")
+            classification = {"category": prediction.category, "agreement": prediction.agreement,
+                              "similarity": prediction.similarity, "assigned": assigned_category is not None}
 
-        # 5. Validate filename format
-        if not re.match(r'^\d{8}_.+', new_filename_base):
-            if doc: doc.close()
-            error_message = "Invalid filename format (expected YYYYMMDD_...)"
-            if progress_callback:
-                progress_callback({
-                    "original_filename": original_filename,
-                    "checksum": checksum,
-                    "new_filename": new_filename_base,
-                    "status": "Error",
-                    "target_folder": "",
-                    "error_message": error_message
-                })
-            continue
+        # 3. LLM Call (Modell-Kaskade), 4. Parse und 5. Validate
+        stage_started = time.perf_counter()
+        if assigned_category is not None:
+            dynamic_prompt = DESCRIPTION_PROMPT.format(category=assigned_category, original_filename=pdf_stem)
+        else:
+            dynamic_prompt = self.assembled_prompt.format(original_filename=pdf_stem)
+        for tier, model_name in enumerate(self.models):
+            call_started = time.perf_counter()
+            model_output = yield model_name, base64_img, dynamic_prompt, original_filename
+            if assigned_category is not None and not model_output.startswith("LLM API Error:"):
+                model_output = _with_category(model_output, assigned_category)
+            self.tier_stats[tier]["calls"] += 1
+            self.tier_stats[tier]["llm_ms"] += (time.perf_counter() - call_started) * 1000
+            with stage("parse"):
+                new_filename_base, category_name, error_message, escalation_reason, repairs = \
+                    self._evaluate_model_output(model_output, rendered.text_date)
+            for repair in repairs:
+                print(f"  Reparatur {original_filename} ({model_name}): {repair}")
+            if escalation_reason is None or tier == len(self.models) - 1:
+                break
+            print(f"  {original_filename}: {model_name} -> {escalation_reason}, eskaliere an {self.models[tier + 1]}")
+        # Das Bild wird nicht mehr gebraucht; nicht bis nach dem Kopieren festhalten.
+        rendered.base64_image = base64_img = None
+        timings["llm_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+        resolved_model = model_name
+
+        if error_message:
+            report(new_filename_base if error_message.startswith("Invalid filename") else "", "Error", "", error_message)
+            return False
+        if category_name not in CATEGORY_MAP:
+            warning_msg = f"Model returned invalid category: '{category_name}'. Defaulting to 'OTHER'."
+            print(f"  Warning for {original_filename}: {warning_msg}")
+            category_name = 'OTHER' # Fallback
+        self.tier_stats[tier]["resolved"] += 1
+        if prediction is not None and assigned_category is None:
+            self._record_prediction(prediction, category_name)
 
         final_filename_stem = f"{new_filename_base}_{checksum}"
+        if self.journal is not None:
+            self.journal.record(pdf_path, STATE_INFERRED, name=final_filename_stem, category=category_name)
 
-        # 6. Determine target folder from CATEGORY_MAP
+        # 6. Determine target folder from CATEGORY_MAP (und Unterordner laut Ablagestruktur)
+        stage_started = time.perf_counter()
         target_dir_name = CATEGORY_MAP.get(category_name, CATEGORY_MAP.get('OTHER', 'OTHER'))
-        TARGET_SUB_DIR = pathlib.Path(target_dir_name)
+        TARGET_SUB_DIR = self.layout.target_subdir(category_name, target_dir_name, final_filename_stem)
         TARGET_FULL_DIR = OUTPUT_BASE_DIR / TARGET_SUB_DIR
-        
+        target_folder_display = TARGET_SUB_DIR.as_posix() if self.layout.sharded else TARGET_SUB_DIR.name
+
+        if self.plan_writer is not None:
+            # Plan-Modus: nichts anlegen oder kopieren, nur den Zielort festhalten.
+            self.plan_writer.add(pdf_path, checksum, final_filename_stem, category_name, TARGET_SUB_DIR.as_posix(),
+                                 model_output, rendered.text)
+            timings["place_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+            report(final_filename_stem, f"Planned ({category_name})", target_folder_display, "")
+            if document_vector is not None:
+                self.category_index.add(document_vector, category_name)
+            return True
+
         try:
-            TARGET_FULL_DIR.mkdir(parents=True, exist_ok=True)
-            target_folder_display = TARGET_SUB_DIR.name
+            self.directories.ensure(TARGET_FULL_DIR)
         except OSError as e:
-            if doc: doc.close()
-            error_message = f"Dir creation error: {e}"
-            if progress_callback:
-                progress_callback({
-                    "original_filename": original_filename,
-                    "checksum": checksum,
-                    "new_filename": final_filename_stem,
-                    "status": "Error",
-                    "target_folder": "",
-                    "error_message": error_message
-                })
-            continue
+            report(final_filename_stem, "Error", "", f"Dir creation error: {e}")
+            return False
 
         # 7. Set status
         status = f"Success ({category_name})"
 
-        # 8. Save with collision protection
-        current_filename_stem_for_save = final_filename_stem
-        saved = False
-        for attempt in range(MAX_RETRIES):
-            current_filename = f"{current_filename_stem_for_save}.pdf"
-            new_path = TARGET_FULL_DIR / current_filename
-            if not new_path.exists():
-                try:
-                    shutil.copy2(pdf_path, new_path)
-                    new_filename_stem = current_filename_stem_for_save
-                    saved = True
-                    break
-                except Exception as e:
-                    error_message = f"File copy error: {e}"
-                    status = "Error"
-                    break
+        # 8. Save with collision protection (temporäre Datei + atomares Umbenennen)
+        with stage("place"):
+            new_filename_stem, error_message = place_file(pdf_path, TARGET_FULL_DIR, final_filename_stem, self.journal,
+                                                          checksum)
+        if error_message:
+            status = "Error"
+            self.directories.forget(TARGET_FULL_DIR)
+        timings["place_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+
+        report(new_filename_stem, status, target_folder_display, error_message)
+        if self.catalog is not None and not error_message:
+            try:
+                with stage("catalog"):
+                    self.catalog.add(TARGET_FULL_DIR / f"{new_filename_stem}.pdf", checksum, original_filename,
+                                     category_name, model_output, rendered.text)
+            except Exception as e:
+                print(f"  Katalog-Eintrag fehlgeschlagen: {e}")
+        if document_vector is not None and not error_message:
+            # Das einsortierte Dokument dient ab sofort als Beispiel für die folgenden Dateien.
+            from category_index import file_key
+            key = file_key(TARGET_FULL_DIR / f"{new_filename_stem}.pdf", OUTPUT_BASE_DIR)
+            self.category_index.add(document_vector, category_name, key)
+        return True
+
+def retry_later(data):
+    """Ergebnis ohne Aussage über die Datei (LLM nicht erreichbar, Vorprüfung gescheitert): nicht
+    als erledigt markieren, ein späterer Lauf versucht es erneut."""
+    return data["error_message"].startswith("LLM API Error:") or data.get("preflight") in (VERDICT_ERROR, VERDICT_CRASHED)
+
+def _gated_by_job(pdf_files, job):
+    """Reicht keine neuen Dateien an den Render-Pool weiter, solange der Job pausiert oder abgebrochen ist."""
+    for pdf_path in pdf_files:
+        if not job.wait_if_paused():
+            return
+        yield pdf_path
+
+def process_pdfs(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json, progress_callback=None,
+                 render_workers=0, recursive=False, include_patterns=None, exclude_patterns=None,
+                 job=None, resume=True, plan_file=None, memory_budget_mb=0, processor=None, classifier=None,
+                 quarantine_dir=QUARANTINE_DIR_NAME, max_pdf_size_mb=0, catalog=True, render_cache_mb=0,
+                 render_cache_dir=None, shard_layout=None, profile=False):
+    """
+    Main processing function.
+    progress_callback(data): data is a dict with keys:
+        'original_filename', 'checksum', 'new_filename', 'status', 'target_folder', 'error_message',
+        'source_path', 'model', 'repairs' (Meldungen der lokalen Reparatur), 'timings' (Dauer je Schritt in ms),
+        'preflight' (Befund der Vorprüfung, None bei gesunden Dateien),
+        'total_files' (bisher gefundene Dateien), 'scan_complete' (Suche abgeschlossen)
+    Gibt die Anzahl analysierter Dateien zurück (None bei Konfigurationsfehlern).
+    model_name: Modellname oder geordnete Liste (Kaskade, günstigstes Modell zuerst); 'model' im
+        Ergebnis nennt das Modell, dessen Antwort verwendet wurde.
+    render_workers: Anzahl Render-Prozesse für PyMuPDF (0 = ein Prozess pro CPU-Kern).
+    recursive / include_patterns / exclude_patterns: steuern die Dateisuche (siehe pdf_scanner).
+    job: ProcessingJob zum Pausieren/Abbrechen aus einem anderen Thread.
+    resume: Dateien überspringen, die ein abgebrochener Lauf laut Checkpoint bereits erledigt hat.
+    plan_file: Plan-Modus; statt zu kopieren wird ein Plan geschrieben, den placement_plan.apply_plan
+        später ohne LLM-Aufrufe ausführt. Der Checkpoint wird dabei nicht verwendet.
+    memory_budget_mb: Speicherbudget für gerenderte Bilder und geöffnete Dokumente (0 = unbegrenzt).
+    classifier: Einstellungen des Kategorie-Index aus bereits einsortierten Dokumenten
+        (configuration.classifier_settings); 'classifier' im Ergebnis nennt dessen Vorhersage.
+    quarantine_dir: Ordner unter pdf_dir, in den Dateien verschoben werden, die die Vorprüfung nicht
+        bestehen (defekt, verschlüsselt, ohne Seiten, größer als max_pdf_size_mb); leer = nur melden.
+        Jede solche Datei erscheint als Ergebnis mit Status 'Error' und 'preflight'.
+    catalog: einsortierte Dateien in den Volltextkatalog im pdf_dir aufnehmen (document_catalog).
+    render_cache_mb: Obergrenze des Render-Caches in MB (0 = aus); render_cache_dir: dessen Ordner
+        (leer = Benutzer-Cache). Wiederholungsläufe lesen gerenderte Seiten von dort, 'preview' im
+        Ergebnis ist der Pfad des Bildes für Vorschaubilder.
+    shard_layout: Ablagestruktur der Kategorieordner (siehe output_layout), leer = flach. Bestehende
+        Ablagen ordnet 'output_layout.py migrate' um.
+    profile: Lauf mit dem eingebauten Stack-Sampler profilieren (siehe run_profiler); True schreibt
+        <run>.collapsed und <run>.speedscope.json nach .pdf_rename_profiles unter pdf_dir, ein Pfad
+        in diesen Ordner.
+    processor: optional ein warmer PdfProcessor (Serve-Modus); er wird für diesen Lauf umkonfiguriert,
+        aber nicht geschlossen. render_workers und memory_budget_mb gelten dann nicht.
+    """
+    results = iter_process_pdfs(
+        pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json, render_workers=render_workers,
+        recursive=recursive, include_patterns=include_patterns, exclude_patterns=exclude_patterns, job=job,
+        resume=resume, plan_file=plan_file, memory_budget_mb=memory_budget_mb, processor=processor,
+        classifier=classifier, quarantine_dir=quarantine_dir, max_pdf_size_mb=max_pdf_size_mb, catalog=catalog,
+        render_cache_mb=render_cache_mb, render_cache_dir=render_cache_dir, shard_layout=shard_layout,
+        profile=profile)
+    try:
+        while True:
+            result = next(results)
+            if progress_callback:
+                progress_callback(result.to_dict())
+    except StopIteration as stop:
+        return stop.value
+    except ProcessingSetupError as e:
+        print(f"Fehler: {e}")
+        return None
+
+def iter_process_pdfs(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json, **options):
+    """Generator-API: verarbeitet wie process_pdfs und liefert je Datei ein ProcessingResult, sobald sie fertig ist.
+
+    options: wie process_pdfs (ohne progress_callback). Der Rückgabewert des Generators (StopIteration.value)
+    ist die Anzahl analysierter Dateien. Wird der Generator vorzeitig geschlossen (close(), break), endet der
+    Lauf nach der aktuellen Datei wie ein Abbruch; der nächste Lauf setzt dort fort.
+    Wirft ProcessingSetupError beim ersten next(), wenn der Lauf nicht beginnen kann.
+    """
+    with _processing_run(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json, **options) as run:
+        with contextlib.closing(run.processor.iter_results(run.pending_files(), run.job)) as results:
+            for data, analyzed in results:
+                yield run.record(data, analyzed)
+    return run.analyzed
+
+async def aiter_process_pdfs(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json,
+                             concurrency=4, async_client=None, **options):
+    """asyncio-API: `async for result in aiter_process_pdfs(...)` liefert ProcessingResult in Fertigstellungsreihenfolge.
+
+    Die LLM-Aufrufe laufen mit AsyncOpenAI auf der Event-Loop des Aufrufers, bis zu `concurrency` Dateien
+    gleichzeitig. Render-Pool, Dateisystem, Journal und Index laufen in je einem eigenen Thread, damit die
+    Loop frei bleibt; die Schritte je Datei sind dieselben wie bei process_pdfs (PdfProcessor.process_steps).
+    Abbruch: den Task abbrechen oder die Schleife verlassen (mit contextlib.aclosing, damit sofort
+    aufgeräumt wird). Offene LLM-Anfragen werden abgebrochen, ihre Dateien nicht als erledigt markiert;
+    der nächste Lauf holt sie nach.
+    async_client: optional ein AsyncOpenAI-Client des Aufrufers (wird nicht geschlossen).
+    options: wie process_pdfs (ohne progress_callback).
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    # Ein Thread für alle Schritte außer LLM und Rendern: sie greifen auf Journal, Katalog,
+    # Index und Zähler des Prozessors zu und laufen wie im synchronen Pfad nacheinander.
+    steps_thread = ThreadPoolExecutor(1, thread_name_prefix="pdf-steps")
+    render_thread = ThreadPoolExecutor(1, thread_name_prefix="pdf-render")
+    own_client = async_client is None
+    if own_client:
+        from openai import AsyncOpenAI
+        async_client = AsyncOpenAI(base_url=target_url, api_key="lm-studio")
+    run_context = _processing_run(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json, **options)
+
+    finished_on_cancel = []
+
+    async def process_one(processor, rendered):
+        results = []
+        steps = processor.process_steps(rendered, results.append)
+        step = loop.run_in_executor(steps_thread, _advance_steps, steps, None)
+        try:
+            while True:
+                done, value = await asyncio.shield(step)
+                if done:
+                    return [(data, value) for data in results]
+                model_output = await analyze_image_async(async_client, *value, max_tokens=processor.max_tokens)
+                step = loop.run_in_executor(steps_thread, _advance_steps, steps, model_output)
+        except asyncio.CancelledError:
+            # Ein bereits laufender Schritt (z.B. das Einsortieren) wird nicht unterbrochen; ist die
+            # Datei danach fertig, wird sie beim Aufräumen noch im Checkpoint abgehakt.
+            done, value = await step
+            if done:
+                finished_on_cancel.extend((data, value) for data in results)
             else:
-                rand_suffix = random.randint(100, 999) 
-                current_filename_stem_for_save = f"{final_filename_stem}_{rand_suffix}"
-                if attempt == MAX_RETRIES - 1:
-                    error_message = f"Max retries ({MAX_RETRIES}) reached for saving."
-                    status = "Error"
-        
-        processed_files_count += 1
-        if doc:
-            doc.close()
-
-        if progress_callback:
-            progress_callback({
-                "original_filename": original_filename,
-                "checksum": checksum,
-                "new_filename": new_filename_stem if saved else "",
-                "status": status,
-                "target_folder": target_folder_display,
-                "error_message": error_message
-            })
-
-    print(f"\nVerarbeitung abgeschlossen. {processed_files_count} Dateien wurden analysiert.")
+                steps_thread.submit(steps.close)
+            raise
 
-if __name__ == "__main__":
-    if len(sys.argv) < 6:
-        print("Fehler: Unzureichende Argumente. Erwartet: pdf_dir, target_url, model_name, assembled_prompt, category_map_json")
-        sys.exit(1)
+    try:
+        run = await loop.run_in_executor(steps_thread, run_context.__enter__)
+    except BaseException:
+        steps_thread.shutdown(wait=False)
+        render_thread.shutdown(wait=False)
+        if own_client:
+            await async_client.close()
+        raise
+
+    files = run.processor.iter_rendered(run.pending_files(), run.job)
+    tasks = set()
+    fetch = None
+    exhausted = False
+    exc_info = (None, None, None)
+    try:
+        while True:
+            if fetch is None and not exhausted and len(tasks) < max(1, concurrency):
+                fetch = loop.run_in_executor(render_thread, next, files, None)
+            waiting = tasks | ({fetch} if fetch is not None else set())
+            if not waiting:
+                break
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if fetch in done:
+                rendered, fetch = fetch.result(), None
+                if rendered is None:
+                    exhausted = True
+                else:
+                    tasks.add(asyncio.ensure_future(process_one(run.processor, rendered)))
+            for task in done & tasks:
+                tasks.discard(task)
+                for data, analyzed in task.result():
+                    yield await loop.run_in_executor(steps_thread, run.record, data, analyzed)
+    except BaseException:
+        exc_info = sys.exc_info()
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:  # schon fertig, aber nicht mehr ausgeliefert
+            if not task.cancelled() and task.exception() is None:
+                finished_on_cancel.extend(task.result())
+        for data, analyzed in finished_on_cancel:
+            await loop.run_in_executor(steps_thread, run.record, data, analyzed)
+        if fetch is not None:
+            await asyncio.gather(fetch, return_exceptions=True)
+        await loop.run_in_executor(render_thread, files.close)
+        await loop.run_in_executor(steps_thread, run_context.__exit__, *exc_info)
+        steps_thread.shutdown(wait=False)
+        render_thread.shutdown(wait=False)
+        if own_client:
+            await async_client.close()
+
+def _advance_steps(steps, value):
+    """Führt process_steps bis zum nächsten LLM-Aufruf aus: (False, Anfrage) oder am Ende (True, analysiert)."""
+    try:
+        return False, steps.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+class ProcessingSetupError(Exception):
+    """Der Lauf kann nicht beginnen (ungültige Category Map oder Ablagestruktur, kein Verzeichnis, Client-Fehler)."""
+
+class _ProcessingRun:
+    """Zustand eines Laufs für iter_process_pdfs/aiter_process_pdfs: Checkpoint, Dateisuche und Zähler."""
+
+    def __init__(self, processor, scanner, checkpoint, plan_file, job):
+        self.processor = processor
+        self.scanner = scanner
+        self.checkpoint = checkpoint
+        self.plan_file = plan_file
+        self.job = job
+        self.analyzed = 0
+        self.skipped = 0
+
+    def pending_files(self):
+        for pdf_path in self.scanner:
+            if self.checkpoint.done and self.checkpoint.is_done(pdf_path):
+                self.skipped += 1
+                continue
+            yield pdf_path
+
+    def record(self, data, analyzed):
+        """Hakt die Datei im Checkpoint ab und ergänzt den Fortschritt; gibt das ProcessingResult zurück."""
+        if analyzed:
+            self.analyzed += 1
+        # LLM-Fehler (z.B. Server nicht erreichbar) werden beim Fortsetzen erneut versucht.
+        if not self.plan_file and not retry_later(data):
+            self.checkpoint.mark_done(data["source_path"])
+        data["total_files"] = self.scanner.discovered - self.skipped
+        data["scan_complete"] = self.scanner.complete
+        return ProcessingResult.from_dict(data)
+
+@contextlib.contextmanager
+def _processing_run(pdf_dir_str, target_url, model_name, assembled_prompt, category_map_json,
+                    render_workers=0, recursive=False, include_patterns=None, exclude_patterns=None,
+                    job=None, resume=True, plan_file=None, memory_budget_mb=0, processor=None, classifier=None,
+                    quarantine_dir=QUARANTINE_DIR_NAME, max_pdf_size_mb=0, catalog=True, render_cache_mb=0,
+                    render_cache_dir=None, shard_layout=None, profile=False):
+    """Vorbereitung und Abschluss eines Laufs (siehe process_pdfs); liefert einen _ProcessingRun."""
+    PDF_DIR = pathlib.Path(pdf_dir_str)
+    
+    try:
+        CATEGORY_MAP = json.loads(category_map_json)
+    except json.JSONDecodeError as e:
+        raise ProcessingSetupError(f"Ungültiges JSON für Category Map: {e}") from e
+    try:
+        layout = OutputLayout(shard_layout)
+    except ValueError as e:
+        raise ProcessingSetupError(str(e)) from e
+
+    OUTPUT_BASE_DIR = PDF_DIR
+    OUTPUT_BASE_DIR.mkdir(exist_ok=True)
+
+    if not PDF_DIR.is_dir():
+        raise ProcessingSetupError(f"'{PDF_DIR}' ist kein gültiges Verzeichnis.")
+
+    # Halbfertige Platzierungen eines abgestürzten Laufs abschließen oder aufräumen.
+    rolled_forward, cleaned_up = recover_journals(OUTPUT_BASE_DIR)
+    if rolled_forward or cleaned_up:
+        print(f"Journal-Wiederherstellung: {rolled_forward} Dateien abgeschlossen, {cleaned_up} unvollständige Dateien entfernt.")
+
+    if processor is None:
+        try:
+            processor = PdfProcessor(OUTPUT_BASE_DIR, target_url, model_name, assembled_prompt, CATEGORY_MAP, render_workers,
+                                     memory_budget_mb=memory_budget_mb, classifier=classifier,
+                                     quarantine_dir=quarantine_dir, max_pdf_size_mb=max_pdf_size_mb,
+                                     render_cache_mb=render_cache_mb, render_cache_dir=render_cache_dir,
+                                     shard_layout=shard_layout)
+        except Exception as e:
+            raise ProcessingSetupError(f"Initialisierung des OpenAI-Clients fehlgeschlagen: {e}") from e
+        processor_context = processor
+    else:
+        processor.output_base_dir = OUTPUT_BASE_DIR
+        processor.model_name = model_name
+        processor.assembled_prompt = assembled_prompt
+        processor.category_map = CATEGORY_MAP
+        processor.classifier = dict(classifier or {})
+        processor.quarantine_dir = quarantine_dir
+        processor.layout = layout
+        processor.directories.clear()
+        processor.render_pool.max_file_bytes = int(max_pdf_size_mb or 0) * 1024 * 1024
+        processor.render_pool.configure_cache(render_cache_mb, render_cache_dir)
+        processor_context = contextlib.nullcontext(processor)
+
+    print(f"Starte Dateiumbenennung und -verschiebung mit Modell '{model_name}' in: {PDF_DIR}")
+    if plan_file:
+        print(f"Plan-Modus: Es wird nichts kopiert, der Plan wird geschrieben nach: {plan_file}")
+    print(f"Zielordner werden basierend auf Kategorien erstellt unter: {OUTPUT_BASE_DIR}")
+    print(f"Render-Prozesse: {processor.render_pool.workers}")
+    if memory_budget_mb:
+        print(f"Speicherbudget: {memory_budget_mb} MB")
+
+    # Die Verarbeitung beginnt mit der ersten gefundenen Datei, während die Suche weiterläuft.
+    # Kategorie-Zielordner liegen unter PDF_DIR und werden bei rekursiver Suche ausgelassen.
+    scanner = PdfScanner(PDF_DIR, recursive, include_patterns, exclude_patterns,
+                         exclude_dirs=scan_exclude_dirs(CATEGORY_MAP, quarantine_dir))
+
+    checkpoint = RunCheckpoint(PDF_DIR)
+    if plan_file:
+        checkpoint.done = set()
+    elif not resume:
+        checkpoint.clear()
+    elif checkpoint.done:
+        print(f"Setze abgebrochenen Lauf fort: {len(checkpoint.done)} Dateien sind bereits erledigt.")
+    run = _ProcessingRun(processor, scanner, checkpoint, plan_file, job)
+
+    profile_dir = resolve_profile_dir(profile, OUTPUT_BASE_DIR)
+    profiler = RunProfiler(profile_dir) if profile_dir else None
+    if profiler is not None:
+        profiler.start()
+    try:
+        if plan_file:
+            with processor_context, PlanWriter(plan_file, OUTPUT_BASE_DIR) as plan_writer:
+                processor.plan_writer = plan_writer
+                yield run
+            print(f"\nPlan mit {plan_writer.entries} Einträgen geschrieben: {plan_file}")
+            return
+        with processor_context, RunJournal(OUTPUT_BASE_DIR) as journal:
+            processor.journal = journal
+            processor.catalog = open_catalog(OUTPUT_BASE_DIR) if catalog else None
+            yield run
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        checkpoint.close()
+        if processor.catalog is not None:
+            processor.catalog.close()
+        processor.journal = processor.plan_writer = processor.catalog = None
+        processor.save_index()
+        _print_preflight_summary(processor)
+        _print_render_cache_summary(processor.render_pool)
+        _print_tier_summary(processor)
+        _print_repair_summary(processor)
+        _print_classifier_summary(processor)
+        _print_peak_memory(processor.render_pool)
+        if profiler is not None:
+            _write_profile(profiler)
+
+    if job is not None and job.cancelled:
+        print(f"\nVerarbeitung abgebrochen. {run.analyzed} Dateien wurden analysiert; "
+              f"der nächste Lauf setzt bei der nächsten unverarbeiteten Datei fort.")
+        return
+    checkpoint.clear()
+    if run.skipped:
+        print(f"{run.skipped} Dateien aus dem abgebrochenen Lauf übersprungen.")
+    print(f"\nVerarbeitung abgeschlossen. {run.analyzed} Dateien wurden analysiert.")
+
+def open_catalog(base_dir, **options):
+    """Öffnet den Dokumentkatalog in base_dir; None (mit Meldung), wenn das nicht möglich ist."""
+    from document_catalog import DocumentCatalog
+    try:
+        return DocumentCatalog(base_dir, **options)
+    except Exception as e:
+        print(f"Dokumentkatalog nicht verfügbar, Dateien werden nicht aufgenommen: {e}")
+        return None
+
+def scan_exclude_dirs(category_map, quarantine_dir=QUARANTINE_DIR_NAME):
+    """Ordner direkt unter pdf_dir, die die Dateisuche auslässt: Kategorie-Zielordner und Quarantäne."""
+    excluded = {pathlib.Path(d).parts[0] for d in category_map.values() if pathlib.Path(d).parts}
+    if quarantine_dir and pathlib.Path(quarantine_dir).parts:
+        excluded.add(pathlib.Path(quarantine_dir).parts[0])
+    return excluded
+
+def _write_profile(profiler):
+    try:
+        collapsed_path, speedscope_path = profiler.write()
+    except OSError as e:
+        print(f"Profil konnte nicht geschrieben werden: {e}")
+        return
+    print(f"Profil ({profiler.sampler.samples} Samples, {profiler.seconds:.1f} s): {collapsed_path} "
+          f"und {speedscope_path.name}")
+
+def _print_preflight_summary(processor):
+    if processor.preflight_stats:
+        findings = ", ".join(f"{count} {verdict}" for verdict, count in sorted(processor.preflight_stats.items()))
+        print(f"Vorprüfung: {sum(processor.preflight_stats.values())} Problemdateien ({findings})")
+
+def _print_render_cache_summary(render_pool):
+    stats = render_pool.cache_stats()
+    if stats and stats["hits"] + stats["misses"]:
+        print(f"Render-Cache: {stats['hits']} Treffer, {stats['misses']} neu gerendert "
+              f"({stats['written_mb']:.1f} MB geschrieben, {stats['evicted']} Einträge verdrängt)")
+
+def _print_tier_summary(processor):
+    if len(processor.models) < 2:
+        return
+    print("Modell-Kaskade:")
+    for tier, stats in enumerate(processor.tier_summary(), 1):
+        print(f"  Stufe {tier} ({stats['model']}): {stats['resolved']} Dateien gelöst, "
+              f"{stats['calls']} Aufrufe, Ø {stats['avg_llm_ms']:.0f} ms")
+
+def _print_repair_summary(processor):
+    stats = processor.repair_stats
+    if stats["repaired"]:
+        print(f"Lokale Reparatur: {stats['repaired']} Antworten repariert ({stats['repairs']} Korrekturen), "
+              f"{stats['reruns_avoided']} davon wären sonst verworfen oder eskaliert worden.")
+
+def _print_classifier_summary(processor):
+    stats = processor.classifier_summary()
+    if not stats or not stats["queries"]:
+        return
+    message = (f"Kategorie-Index: {stats['queries']} Abfragen (Ø {stats['avg_embed_ms']:.1f} ms Einbettung, "
+               f"{stats['avg_query_ms']:.2f} ms Suche), {stats['assigned']} Kategorien direkt vergeben")
+    if stats["confident_agreement"] is not None:
+        message += (f", Übereinstimmung mit dem LLM bei sicheren Vorhersagen: {stats['confident_agreement']:.0%} "
+                    f"({stats['confident_compared']} Dateien)")
+    if stats["agreement"] is not None:
+        message += f", insgesamt: {stats['agreement']:.0%} ({stats['compared']} Dateien)"
+    print(message)
+
+def _print_peak_memory(render_pool):
+    main_rss, worker_rss = peak_rss_bytes()
+    if main_rss is None:
+        return
+    message = f"Maximaler Speicherverbrauch (RSS): {main_rss / 1048576:.1f} MB"
+    if worker_rss:
+        message += f", Render-Worker: {worker_rss / 1048576:.1f} MB"
+    if render_pool.memory_budget_bytes:
+        message += f", Bilder/Dokumente unterwegs: max. {render_pool.peak_in_flight_bytes / 1048576:.1f} MB"
+    print(message)
+
+def load_job_spec(source):
+    """Liest eine Job-Spezifikation (JSON) aus einer Datei oder, bei "-", aus der ersten Zeile von stdin.
+
+    Pflichtfelder: pdf_dir, target_url, model_name, assembled_prompt, category_map (Objekt oder JSON-String).
+    Optional: render_workers, recursive, include_patterns, exclude_patterns, resume, plan_file, memory_budget_mb,
+    classifier, quarantine_dir, max_pdf_size_mb, catalog, render_cache_mb, render_cache_dir, shard_layout.
+    """
+    if source == "-":
+        job = json.loads(sys.stdin.readline())
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            job = json.load(f)
+    return validate_job_spec(job)
+
+def validate_job_spec(job):
+    if not isinstance(job, dict):
+        raise ValueError("Job-Spezifikation muss ein JSON-Objekt sein.")
+    missing = [key for key in ("pdf_dir", "target_url", "model_name", "assembled_prompt", "category_map") if key not in job]
+    if missing:
+        raise ValueError(f"Job-Spezifikation unvollständig, es fehlt: {', '.join(missing)}")
+    OutputLayout(job.get("shard_layout"))
+    return job
+
+def _read_control_commands(stream, processing_job):
+    """Liest Steuerkommandos ('pause', 'resume', 'cancel'), eines pro Zeile, bis EOF."""
+    for line in stream:
+        if line.strip() and not processing_job.handle_command(line):
+            print(f"Unbekanntes Kommando: {line.strip()}")
+
+def run_job(job, writer, processing_job=None, processor=None):
+    """Führt eine Job-Spezifikation aus und meldet start/result/progress/state/summary über den EventWriter.
+
+    processor: optional ein warmer PdfProcessor, der über mehrere Jobs hinweg erhalten bleibt.
+    """
+    category_map = job["category_map"]
+    category_map_json = category_map if isinstance(category_map, str) else json.dumps(category_map)
+    counters = {"processed": 0, "succeeded": 0, "errors": 0}
+    started = time.perf_counter()
+
+    writer.emit(EVENT_START, pdf_dir=job["pdf_dir"], model_name=job["model_name"],
+                render_workers=job.get("render_workers", 0), pid=os.getpid())
+
+    def event_callback(data):
+        counters["processed"] += 1
+        if data.get("status") == "Error":
+            counters["errors"] += 1
+        else:
+            counters["succeeded"] += 1
+        writer.emit(EVENT_RESULT, **data)
+        writer.emit(EVENT_PROGRESS, processed=counters["processed"], total=data.get("total_files", 0),
+                    scan_complete=data.get("scan_complete", False))
+
+    own_processor = processor is None
+    analyzed = None
+    try:
+        if own_processor:
+            processor = _create_processor(job)
+    except Exception as e:
+        print(f"Fehler bei der Initialisierung des OpenAI-Clients: {e}")
+    else:
+        analyzed = _run_job_with_processor(job, processor, category_map_json, event_callback, processing_job)
+    finally:
+        if own_processor and processor is not None:
+            processor.close()
+
+    cancelled = processing_job is not None and processing_job.cancelled
+    main_rss, worker_rss = peak_rss_bytes()
+    extra = processor_summary(processor) if processor is not None else {}
+    writer.emit(EVENT_SUMMARY, ok=analyzed is not None, analyzed=analyzed or 0, cancelled=cancelled,
+                elapsed_s=round(time.perf_counter() - started, 3), peak_rss_bytes=main_rss,
+                peak_worker_rss_bytes=worker_rss, **extra, **counters)
+    return analyzed is not None
+
+def processor_summary(processor):
+    """Statistik eines Prozessors für das summary-Ereignis (Reparaturen, Kategorie-Index, Kaskade)."""
+    summary = {"repairs": dict(processor.repair_stats), "preflight": dict(processor.preflight_stats)}
+    if processor.render_pool.cache_stats() is not None:
+        summary["render_cache"] = processor.render_pool.cache_stats()
+    if processor.classifier_summary() is not None:
+        summary["classifier"] = processor.classifier_summary()
+    if len(processor.models) > 1:
+        summary["tiers"] = processor.tier_summary()
+    return summary
+
+def _create_processor(job):
+    return PdfProcessor(job["pdf_dir"], job["target_url"], job["model_name"], job["assembled_prompt"],
+                        {}, job.get("render_workers", 0), memory_budget_mb=job.get("memory_budget_mb", 0),
+                        classifier=job.get("classifier"), quarantine_dir=job.get("quarantine_dir", QUARANTINE_DIR_NAME),
+                        max_pdf_size_mb=job.get("max_pdf_size_mb", 0), render_cache_mb=job.get("render_cache_mb", 0),
+                        render_cache_dir=job.get("render_cache_dir"), shard_layout=job.get("shard_layout"))
+
+def _run_job_with_processor(job, processor, category_map_json, progress_callback, processing_job):
+    return process_pdfs(
+        job["pdf_dir"],
+        job["target_url"],
+        job["model_name"],
+        job["assembled_prompt"],
+        category_map_json,
+        progress_callback=progress_callback,
+        render_workers=job.get("render_workers", 0),
+        recursive=job.get("recursive", False),
+        include_patterns=job.get("include_patterns"),
+        exclude_patterns=job.get("exclude_patterns"),
+        job=processing_job,
+        resume=job.get("resume", True),
+        plan_file=job.get("plan_file"),
+        memory_budget_mb=job.get("memory_budget_mb", 0),
+        processor=processor,
+        classifier=job.get("classifier"),
+        quarantine_dir=job.get("quarantine_dir", QUARANTINE_DIR_NAME),
+        max_pdf_size_mb=job.get("max_pdf_size_mb", 0),
+        catalog=job.get("catalog", True),
+        render_cache_mb=job.get("render_cache_mb", 0),
+        render_cache_dir=job.get("render_cache_dir"),
+        shard_layout=job.get("shard_layout"),
+        profile=job.get("profile", False)
+    )
+
+def serve(stream, writer, profile=None):
+    """Langlebiger Worker: liest Jobs (eine JSON-Zeile je Job) und Steuerkommandos von stream.
+
+    OpenAI-Client (HTTP-Verbindungen) und Render-Pool bleiben zwischen den Jobs warm und
+    werden nur neu erstellt, wenn sich target_url, render_workers oder memory_budget_mb ändern.
+    Nach jedem Job folgt ein "ready"-Ereignis. 'shutdown' oder EOF beenden den Worker.
+    profile: Vorgabe für Jobs ohne eigenen "profile"-Eintrag (--profile).
+    """
+    jobs = queue.Queue()
+    current_job = [None]
+
+    def read_input():
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    jobs.put(json.loads(line))
+                except json.JSONDecodeError as e:
+                    print(f"Ungültige Job-Zeile: {e}")
+            elif line.lower() == "shutdown":
+                break
+            elif current_job[0] is None or not current_job[0].handle_command(line):
+                print(f"Kommando ignoriert: {line}")
+        if current_job[0] is not None:
+            current_job[0].cancel()
+        jobs.put(None)
+
+    def stop(*_args):
+        if current_job[0] is not None:
+            current_job[0].cancel()
+        jobs.put(None)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    threading.Thread(target=read_input, name="serve-input", daemon=True).start()
+
+    processor, processor_key = None, None
+    writer.emit(EVENT_READY, pid=os.getpid())
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            try:
+                validate_job_spec(job)
+                if profile is not None:
+                    job.setdefault("profile", profile)
+                key = (job["target_url"], job.get("render_workers", 0), job.get("memory_budget_mb", 0))
+                if key != processor_key:
+                    if processor is not None:
+                        processor.close()
+                    processor, processor_key = None, None
+                    processor = _create_processor(job)
+                    processor_key = key
+            except Exception as e:
+                print(f"Job abgelehnt: {e}")
+                writer.emit(EVENT_SUMMARY, ok=False, analyzed=0, cancelled=False, elapsed_s=0,
+                            processed=0, succeeded=0, errors=0, error=str(e))
+                writer.emit(EVENT_READY, pid=os.getpid())
+                continue
+
+            current_job[0] = ProcessingJob(on_state_change=lambda state: writer.emit(EVENT_STATE, state=state))
+            try:
+                run_job(job, writer, current_job[0], processor)
+            finally:
+                current_job[0] = None
+            writer.emit(EVENT_READY, pid=os.getpid())
+    finally:
+        if processor is not None:
+            processor.close()
+    return 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv and argv[0].startswith("--"):
+        parser = argparse.ArgumentParser(description="PDFs analysieren, umbenennen und einsortieren.")
+        mode = parser.add_mutually_exclusive_group(required=True)
+        mode.add_argument("--job",
+                          help="Job-Spezifikation als JSON-Datei oder '-' für die erste Zeile von stdin; "
+                               "Ereignisse als JSON-Zeilen auf stdout, weitere stdin-Zeilen sind Steuerkommandos "
+                               "(pause, resume, cancel)")
+        mode.add_argument("--serve", action="store_true",
+                          help="Langlebiger Worker: Jobs als JSON-Zeilen auf stdin, dazwischen Steuerkommandos; "
+                               "Client und Render-Pool bleiben zwischen den Jobs warm")
+        parser.add_argument("--profile", nargs="?", const=True, default=None, metavar="DIR",
+                            help="Jeden Lauf profilieren (Stack-Sampler) und <run>.collapsed/.speedscope.json "
+                                 "schreiben, nach DIR bzw. .pdf_rename_profiles im pdf_dir")
+        args = parser.parse_args(argv)
+
+        writer = EventWriter(sys.stdout)
+        if args.serve:
+            with contextlib.redirect_stdout(sys.stderr):
+                return serve(sys.stdin, writer, args.profile)
+        try:
+            job = load_job_spec(args.job)
+        except (OSError, ValueError) as e:
+            print(f"Fehler beim Laden der Job-Spezifikation: {e}", file=sys.stderr)
+            return 1
+        if args.profile is not None:
+            job.setdefault("profile", args.profile)
+
+        processing_job = ProcessingJob(on_state_change=lambda state: writer.emit(EVENT_STATE, state=state))
+        signal.signal(signal.SIGINT, lambda *_: processing_job.cancel())
+        signal.signal(signal.SIGTERM, lambda *_: processing_job.cancel())
+        threading.Thread(target=_read_control_commands, args=(sys.stdin, processing_job),
+                         name="control-commands", daemon=True).start()
+
+        # stdout gehört in diesem Modus dem Ereignisstrom.
+        with contextlib.redirect_stdout(sys.stderr):
+            return 0 if run_job(job, writer, processing_job) else 1
+
+    if len(argv) < 5:
+        print("Fehler: Unzureichende Argumente. Erwartet: pdf_dir, target_url, model_name, assembled_prompt, category_map_json [render_workers]")
+        print("       oder: --job <job.json|->")
+        return 1
 
     def cli_callback(data):
         # Simple CLI output formatting
         print(f"{data['original_filename']} -> {data['status']} | {data['error_message']}")
 
     process_pdfs(
-        sys.argv[1],
-        sys.argv[2],
-        sys.argv[3],
-        sys.argv[4],
-        sys.argv[5],
-        progress_callback=cli_callback
+        argv[0],
+        argv[1],
+        argv[2],
+        argv[3],
+        argv[4],
+        progress_callback=cli_callback,
+        render_workers=int(argv[5]) if len(argv) > 5 else 0
     )
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import os
+import queue
+import pathlib
+import fnmatch
+import threading
+
+# --- STREAMING DIRECTORY ENUMERATION ---
+# Ersetzt list(PDF_DIR.glob("*.pdf")): Dateien werden geliefert, sobald sie gefunden
+# werden, optional rekursiv, mit Include/Exclude-Mustern und ohne Beachtung der
+# Groß-/Kleinschreibung der Endung (.pdf / .PDF).
+
+DEFAULT_EXTENSIONS = (".pdf",)
+
+
+def _matches_any(rel_path, patterns):
+    """Prüft einen relativen Pfad (mit '/') und den Dateinamen gegen Glob-Muster, case-insensitiv."""
+    rel_lower = rel_path.lower()
+    name_lower = rel_lower.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(rel_lower, p.lower()) or fnmatch.fnmatchcase(name_lower, p.lower())
+               for p in patterns)
+
+
+def iter_pdf_files(root, recursive=False, include_patterns=None, exclude_patterns=None,
+                   extensions=DEFAULT_EXTENSIONS, exclude_dirs=()):
+    """Generator über alle passenden Dateien unter root (os.scandir-basiert).
+
+    exclude_dirs: Verzeichnisnamen direkt unter root, die nicht durchsucht werden
+    (z.B. die Kategorie-Zielordner, die selbst unter PDF_DIR liegen).
+    Versteckte Dateien und Verzeichnisse (Punkt am Anfang) werden übersprungen.
+    """
+    root = pathlib.Path(root)
+    include_patterns = list(include_patterns or [])
+    exclude_patterns = list(exclude_patterns or [])
+    extensions = tuple(ext.lower() for ext in extensions)
+    excluded_top_dirs = {d.lower() for d in exclude_dirs}
+
+    stack = [(root, "")]
+    while stack:
+        directory, rel_dir = stack.pop()
+        # Dateien direkt aus dem scandir-Iterator liefern (nicht erst das ganze Verzeichnis
+        # einlesen); nur die Unterverzeichnisse werden für danach gesammelt.
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    rel_path = f"{rel_dir}{entry.name}"
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and not (rel_dir == "" and entry.name.lower() in excluded_top_dirs):
+                                if not (exclude_patterns and _matches_any(rel_path, exclude_patterns)):
+                                    subdirs.append((pathlib.Path(entry.path), rel_path + "/"))
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if not entry.name.lower().endswith(extensions):
+                        continue
+                    if include_patterns and not _matches_any(rel_path, include_patterns):
+                        continue
+                    if exclude_patterns and _matches_any(rel_path, exclude_patterns):
+                        continue
+                    yield pathlib.Path(entry.path)
+        except OSError as e:
+            print(f"Warnung: Verzeichnis '{directory}' kann nicht gelesen werden: {e}")
+        # In Verzeichnisreihenfolge weiter absteigen.
+        stack.extend(reversed(subdirs))
+
+
+class PdfScanner:
+    """Enumeriert in einem Hintergrund-Thread, während die Verarbeitung schon läuft.
+
+    `discovered` ist die laufende Gesamtzahl gefundener Dateien (für die
+    Fortschrittsanzeige), `complete` wird True, sobald die Suche beendet ist.
+    Ein Scanner kann nur einmal iteriert werden.
+    """
+
+    _DONE = object()
+
+    def __init__(self, root, recursive=False, include_patterns=None, exclude_patterns=None,
+                 extensions=DEFAULT_EXTENSIONS, exclude_dirs=()):
+        self._args = (root, recursive, include_patterns, exclude_patterns, extensions, exclude_dirs)
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self.discovered = 0
+        self.complete = False
+
+    def _run(self):
+        try:
+            for pdf_path in iter_pdf_files(*self._args):
+                if self._stop.is_set():
+                    break
+                self.discovered += 1
+                self._queue.put(pdf_path)
+        finally:
+            self.complete = True
+            self._queue.put(self._DONE)
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._run, name="pdf-scanner", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._DONE:
+                    return
+                yield item
+        finally:
+            self._stop.set()
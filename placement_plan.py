@@ -0,0 +1,212 @@
+import sys
+import json
+import time
+import random
+import pathlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from run_journal import RunJournal, atomic_copy, recover_journals, STATE_FAILED
+
+# --- PLAN / APPLY ---
+# Im Plan-Modus schreibt process_pdfs nur auf, wohin jede Datei kopiert würde.
+# Die Plan-Datei (JSON Lines) kann vor dem Anwenden bearbeitet werden:
+#   {"v": 1, "base_dir": "/pfad/zum/archiv", "created": ...}                      <- Kopfzeile
+#   {"source": "...", "checksum": "...", "new_filename": "...", "category": "...", "target_dir": "STEUER",
+#    "model_output": "...", "text": "..."}
+# target_dir ist relativ zu base_dir. apply_plan führt den Plan ohne LLM-Aufrufe aus.
+# model_output und text (optional) übernimmt apply_plan in den Dokumentkatalog.
+
+PLAN_VERSION = 1
+MAX_RETRIES = 5
+
+
+def place_file(pdf_path, target_dir, filename_stem, journal=None, checksum=None):
+    """Kopiert pdf_path als '<filename_stem>.pdf' nach target_dir (mit Kollisionsschutz).
+
+    Gibt (gespeicherter Dateiname ohne Endung, Fehlermeldung) zurück; bei Erfolg ist
+    die Fehlermeldung leer, bei einem Fehler der Dateiname.
+    """
+    target_dir = pathlib.Path(target_dir)
+    current_filename_stem_for_save = filename_stem
+    for attempt in range(MAX_RETRIES):
+        new_path = target_dir / f"{current_filename_stem_for_save}.pdf"
+        if not new_path.exists():
+            try:
+                atomic_copy(pdf_path, new_path, journal=journal, checksum=checksum)
+                return current_filename_stem_for_save, ""
+            except FileExistsError:
+                pass  # zwischen Prüfung und Umbenennen belegt -> neuer Suffix
+            except Exception as e:
+                return "", f"File copy error: {e}"
+        rand_suffix = random.randint(100, 999)
+        current_filename_stem_for_save = f"{filename_stem}_{rand_suffix}"
+    return "", f"Max retries ({MAX_RETRIES}) reached for saving."
+
+
+class PlanWriter:
+    """Schreibt Planeinträge zeilenweise, damit ein abgebrochener Lauf einen gültigen Teilplan hinterlässt."""
+
+    def __init__(self, plan_path, base_dir):
+        self.path = pathlib.Path(plan_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write({"v": PLAN_VERSION, "base_dir": str(pathlib.Path(base_dir).resolve()), "created": time.time()})
+        self.entries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def add(self, source, checksum, new_filename, category, target_dir, model_output=None, text=""):
+        record = {"source": str(pathlib.Path(source).resolve()), "checksum": checksum, "new_filename": new_filename,
+                  "category": category, "target_dir": str(target_dir)}
+        if model_output:
+            record["model_output"] = model_output
+        if text:
+            record["text"] = text
+        self._write(record)
+        self.entries += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_plan(plan_path):
+    """Liest eine Plan-Datei. Gibt (base_dir, Einträge) zurück; wirft ValueError bei ungültigem Inhalt."""
+    base_dir = None
+    entries = []
+    with open(plan_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Zeile {line_number}: ungültiges JSON ({e})")
+            if "base_dir" in record:
+                if record.get("v", PLAN_VERSION) > PLAN_VERSION:
+                    raise ValueError(f"Plan-Version {record['v']} wird nicht unterstützt.")
+                base_dir = pathlib.Path(record["base_dir"])
+                continue
+            missing = [key for key in ("source", "new_filename", "target_dir") if not record.get(key)]
+            if missing:
+                raise ValueError(f"Zeile {line_number}: fehlende Felder {', '.join(missing)}")
+            entries.append(record)
+    if base_dir is None:
+        raise ValueError("Kopfzeile mit base_dir fehlt.")
+    return base_dir, entries
+
+
+def apply_plan(plan_path, io_workers=8, verify_checksums=True, progress_callback=None, catalog=True):
+    """Führt einen Plan aus, ohne das LLM erneut zu befragen.
+
+    Die Einträge werden nach Zielordner gruppiert; jeder Ordner wird genau einmal
+    angelegt, die Kopien laufen in io_workers Threads. Hat sich eine Quelldatei seit
+    der Planung verändert (andere Checksumme), wird sie übersprungen.
+    progress_callback(data) erhält dieselben Felder wie bei process_pdfs.
+    catalog: platzierte Dateien in den Dokumentkatalog unter base_dir aufnehmen.
+    Gibt die Anzahl platzierter Dateien zurück (None, wenn der Plan ungültig ist).
+    """
+    from pdf_processor import generate_checksum, open_catalog  # erst hier: pdf_processor importiert dieses Modul
+
+    try:
+        base_dir, entries = load_plan(plan_path)
+    except (OSError, ValueError) as e:
+        print(f"Fehler beim Lesen des Plans '{plan_path}': {e}")
+        return None
+
+    rolled_forward, cleaned_up = recover_journals(base_dir)
+    if rolled_forward or cleaned_up:
+        print(f"Journal-Wiederherstellung: {rolled_forward} Dateien abgeschlossen, {cleaned_up} unvollständige Dateien entfernt.")
+
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry["target_dir"], []).append(entry)
+    print(f"Wende Plan an: {len(entries)} Dateien in {len(groups)} Zielordnern unter {base_dir}")
+
+    def place(entry, target_full_dir, dir_error, journal):
+        started = time.perf_counter()
+        pdf_path = pathlib.Path(entry["source"])
+        checksum = entry.get("checksum", "")
+        new_filename, error_message = "", dir_error
+        if not error_message:
+            try:
+                if verify_checksums and checksum and generate_checksum(pdf_path) != checksum:
+                    error_message = "Source changed since planning (checksum mismatch)."
+            except OSError as e:
+                error_message = f"Checksum error: {e}"
+        if not error_message:
+            new_filename, error_message = place_file(pdf_path, target_full_dir, entry["new_filename"], journal, checksum)
+        if error_message:
+            journal.record(pdf_path, STATE_FAILED, error=error_message)
+        return {
+            "original_filename": pdf_path.name,
+            "checksum": checksum,
+            "new_filename": new_filename,
+            "status": "Error" if error_message else f"Success ({entry.get('category', '')})",
+            "target_folder": pathlib.PurePath(entry["target_dir"]).as_posix() if not dir_error else "",
+            "error_message": error_message,
+            "source_path": str(pdf_path),
+            "timings": {"place_ms": round((time.perf_counter() - started) * 1000, 1)},
+        }
+
+    placed_count = 0
+    document_catalog = open_catalog(base_dir) if catalog else None
+    with RunJournal(base_dir) as journal, ThreadPoolExecutor(max_workers=max(1, io_workers)) as pool:
+        futures = []
+        for target_dir, group in groups.items():
+            target_full_dir = base_dir / target_dir
+            dir_error = ""
+            try:
+                target_full_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                dir_error = f"Dir creation error: {e}"
+            futures.extend((entry, target_full_dir, pool.submit(place, entry, target_full_dir, dir_error, journal))
+                           for entry in group)
+        for entry, target_full_dir, future in futures:
+            data = future.result()
+            if not data["error_message"]:
+                placed_count += 1
+            if progress_callback:
+                progress_callback(data)
+            if document_catalog is not None and not data["error_message"]:
+                # Im Hauptthread: die SQLite-Verbindung gehört diesem Thread.
+                try:
+                    document_catalog.add(target_full_dir / f"{data['new_filename']}.pdf", data["checksum"],
+                                         data["original_filename"], entry.get("category"),
+                                         entry.get("model_output"), entry.get("text", ""))
+                except Exception as e:
+                    print(f"  Katalog-Eintrag fehlgeschlagen: {e}")
+    if document_catalog is not None:
+        document_catalog.close()
+
+    print(f"\nPlan angewendet. {placed_count} von {len(entries)} Dateien wurden platziert.")
+    return placed_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wendet eine mit process_pdfs erstellte Plan-Datei an.")
+    parser.add_argument("plan_file", help="Pfad zur Plan-Datei (JSON Lines)")
+    parser.add_argument("--io-workers", type=int, default=8, help="Anzahl paralleler Kopiervorgänge")
+    parser.add_argument("--no-verify", action="store_true", help="Checksummen der Quelldateien nicht erneut prüfen")
+    parser.add_argument("--no-catalog", action="store_true", help="Platzierte Dateien nicht in den Dokumentkatalog aufnehmen")
+    args = parser.parse_args(argv)
+
+    def cli_callback(data):
+        print(f"{data['original_filename']} -> {data['new_filename'] or '-'} | {data['status']} | {data['error_message']}")
+
+    placed = apply_plan(args.plan_file, args.io_workers, not args.no_verify, cli_callback, catalog=not args.no_catalog)
+    return 1 if placed is None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import shutil
+import pathlib
+
+# --- PREFLIGHT ---
+# Schnelle Vorprüfung vor Hash, Rendering und LLM: Größe und PDF-Header im Hauptprozess,
+# danach nur Xref, Verschlüsselung und Seitenbaum (fitz.open ohne Seite zu laden) in den
+# Render-Workern. Problemdateien werden mit Grund in einen Quarantäne-Ordner verschoben
+# und als Ergebnis gemeldet; die teuren Schritte sehen nur gesunde Dateien.
+
+VERDICT_OK = "ok"
+VERDICT_ENCRYPTED = "encrypted"
+VERDICT_CORRUPT = "corrupt"
+VERDICT_EMPTY = "empty"
+VERDICT_OVERSIZED = "oversized"
+# Keine Aussage über die Datei: die Prüfung selbst ist gescheitert (Worker startet nicht, Pool
+# abgestürzt, ...) bzw. MuPDF stürzt auch in einem eigenen Prozess beim Öffnen ab. Solche Dateien
+# werden als Fehler gemeldet, bleiben aber liegen und kommen beim nächsten Lauf erneut dran.
+VERDICT_ERROR = "error"
+VERDICT_CRASHED = "crashed"
+# Nur diese Befunde von stat_verdict/check_pdf führen zur Quarantäne.
+QUARANTINE_VERDICTS = frozenset((VERDICT_ENCRYPTED, VERDICT_CORRUPT, VERDICT_EMPTY, VERDICT_OVERSIZED))
+
+QUARANTINE_DIR_NAME = "QUARANTINE"
+QUARANTINE_LOG_NAME = "quarantine.jsonl"
+
+# Innerhalb dieser ersten Bytes muss '%PDF-' stehen (Adobe toleriert Vorspann bis 1 KiB).
+HEADER_SCAN_BYTES = 1024
+
+
+def stat_verdict(pdf_path, max_file_bytes=0):
+    """Prüfung ohne PDF-Parser: (verdict, detail) für leere, zu große oder nicht-PDF-Dateien, sonst None."""
+    try:
+        size = os.path.getsize(pdf_path)
+        if size == 0:
+            return VERDICT_EMPTY, "0 Bytes"
+        if max_file_bytes and size > max_file_bytes:
+            return VERDICT_OVERSIZED, f"{size / 1048576:.1f} MB > {max_file_bytes / 1048576:.0f} MB"
+        with open(pdf_path, "rb") as f:
+            if b"%PDF-" not in f.read(HEADER_SCAN_BYTES):
+                return VERDICT_CORRUPT, "Kein PDF-Header"
+    except OSError as e:
+        return VERDICT_CORRUPT, f"Nicht lesbar: {e}"
+    return None
+
+
+def check_pdf(pdf_path):
+    """Öffnet nur Xref und Trailer (läuft im Render-Worker). Gibt (verdict, detail, page_count) zurück."""
+    import fitz  # PyMuPDF
+
+    try:
+        doc = fitz.open(pdf_path, filetype="pdf")
+    except Exception as e:
+        return VERDICT_CORRUPT, str(e) or type(e).__name__, 0
+    try:
+        if doc.needs_pass:
+            return VERDICT_ENCRYPTED, "Passwort erforderlich", 0
+        page_count = doc.page_count
+        if page_count == 0:
+            return VERDICT_EMPTY, "Keine Seiten", 0
+        return VERDICT_OK, "", page_count
+    except Exception as e:
+        return VERDICT_CORRUPT, str(e) or type(e).__name__, 0
+    finally:
+        doc.close()
+
+
+def quarantine_file(pdf_path, base_dir, quarantine_dir, verdict, detail):
+    """Verschiebt eine Problemdatei nach base_dir/quarantine_dir/verdict/ und protokolliert den Grund.
+
+    Ein vorhandener Name wird nicht überschrieben (Suffix _1, _2, ...). Gibt den neuen Pfad zurück;
+    wirft OSError, wenn die Datei nicht verschoben werden kann.
+    """
+    pdf_path = pathlib.Path(pdf_path)
+    root = pathlib.Path(base_dir) / quarantine_dir
+    target_dir = root / verdict
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / pdf_path.name
+    counter = 1
+    while target.exists():
+        target = target_dir / f"{pdf_path.stem}_{counter}{pdf_path.suffix}"
+        counter += 1
+    shutil.move(str(pdf_path), str(target))
+    entry = {"t": round(time.time(), 3), "src": str(pdf_path), "target": str(target),
+             "verdict": verdict, "detail": detail}
+    with open(root / QUARANTINE_LOG_NAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return target
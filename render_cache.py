@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import hashlib
+import pathlib
+
+# --- RENDER CACHE ---
+# Gerenderte erste Seiten (JPEG) mit Seitenzahl und Textebene auf der Festplatte, geschlüsselt nach
+# SHA256 des Dateiinhalts und Render-Profil (Zoom, JPEG-Qualität). Ein erneuter Lauf, etwa nach einer
+# geänderten Kategorie-Beschreibung, liest die Bilder von hier statt neu zu rastern; die GUIs zeigen
+# daraus Vorschaubilder an. Die Render-Worker lesen und schreiben direkt, der Hauptprozess hält die
+# Größe per LRU (Änderungszeit = letzter Zugriff) unter der Obergrenze.
+
+CACHE_VERSION = 2  # 2: JPEG in der angeforderten Qualität (vorher von Pillow mit 75 neu kodiert)
+DEFAULT_CACHE_MB = 1024
+IMAGE_SUFFIX = ".jpg"
+META_SUFFIX = ".json"
+# Aufgeräumt wird, sobald seit dem letzten Mal so viel der Obergrenze neu geschrieben wurde ...
+TRIM_AFTER_FRACTION = 0.1
+# ... und zwar bis auf diesen Anteil der Obergrenze, damit nicht jeder Eintrag eine Runde auslöst.
+TRIM_TARGET_FRACTION = 0.9
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def default_cache_dir():
+    """Benutzer-Cache-Ordner: %LOCALAPPDATA% unter Windows, sonst $XDG_CACHE_HOME bzw. ~/.cache."""
+    if sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        base = pathlib.Path(os.environ["LOCALAPPDATA"])
+    elif sys.platform == "darwin":
+        base = pathlib.Path.home() / "Library" / "Caches"
+    else:
+        base = pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache")
+    return base / "pdf_rename" / "render"
+
+
+def resolve_cache_dir(cache_dir=None):
+    return pathlib.Path(cache_dir) if cache_dir else default_cache_dir()
+
+
+def file_digest(pdf_path):
+    """SHA256 (hex) des Dateiinhalts; die ersten 10 Zeichen sind die Checksumme im Dateinamen."""
+    hasher = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def render_profile(zoom, jpg_quality):
+    """Teil des Schlüssels, der vom Rendern abhängt (erste Seite, Zoom, Qualität, Cache-Format)."""
+    return f"p0-z{float(zoom):g}-q{int(jpg_quality)}-v{CACHE_VERSION}"
+
+
+def entry_path(cache_dir, digest, profile):
+    """Pfad des Bildes eines Eintrags; die Metadaten liegen daneben mit META_SUFFIX."""
+    return pathlib.Path(cache_dir) / profile / digest[:2] / f"{digest}{IMAGE_SUFFIX}"
+
+
+def load_entry(cache_dir, digest, profile):
+    """Liest einen Eintrag als (page_count, jpeg_bytes, text, image_path) oder None.
+
+    Ein Treffer setzt die Änderungszeit des Bildes auf jetzt (LRU). Unvollständige oder gerade
+    verdrängte Einträge gelten als nicht vorhanden.
+    """
+    image_path = entry_path(cache_dir, digest, profile)
+    try:
+        meta = json.loads(image_path.with_suffix(META_SUFFIX).read_text(encoding="utf-8"))
+        jpeg_bytes = image_path.read_bytes()
+        os.utime(image_path)
+    except (OSError, ValueError):
+        return None
+    return int(meta.get("page_count", 0)), jpeg_bytes, meta.get("text", ""), image_path
+
+
+def store_entry(cache_dir, digest, profile, page_count, jpeg_bytes, text):
+    """Schreibt einen Eintrag atomar (erst Metadaten, dann Bild). Gibt die geschriebenen Bytes zurück, 0 bei Fehler."""
+    image_path = entry_path(cache_dir, digest, profile)
+    meta = json.dumps({"page_count": page_count, "text": text}, ensure_ascii=False).encode("utf-8")
+    try:
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        for path, data in ((image_path.with_suffix(META_SUFFIX), meta), (image_path, jpeg_bytes)):
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+    except OSError:
+        return 0
+    return len(meta) + len(jpeg_bytes)
+
+
+def _entries(cache_dir):
+    """(mtime, bytes, image_path) aller Einträge unter cache_dir."""
+    entries = []
+    for profile_dir in _subdirs(pathlib.Path(cache_dir)):
+        for shard_dir in _subdirs(profile_dir):
+            try:
+                scan = os.scandir(shard_dir)
+            except OSError:
+                continue
+            with scan:
+                for item in scan:
+                    if not item.name.endswith(IMAGE_SUFFIX):
+                        continue
+                    try:
+                        st = item.stat()
+                        meta_size = os.path.getsize(item.path[:-len(IMAGE_SUFFIX)] + META_SUFFIX)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size + meta_size, pathlib.Path(item.path)))
+    return entries
+
+
+def _subdirs(path):
+    try:
+        with os.scandir(path) as scan:
+            return [pathlib.Path(item.path) for item in scan if item.is_dir()]
+    except OSError:
+        return []
+
+
+def _remove_entry(image_path):
+    for path in (image_path, image_path.with_suffix(META_SUFFIX)):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def cache_usage(cache_dir):
+    """(Einträge, Bytes) im Cache."""
+    entries = _entries(cache_dir)
+    return len(entries), sum(size for _, size, _ in entries)
+
+
+def trim_cache(cache_dir, max_bytes, target_fraction=TRIM_TARGET_FRACTION):
+    """Verdrängt die am längsten nicht benutzten Einträge, bis höchstens target_fraction * max_bytes belegt sind.
+
+    Nur wenn max_bytes überschritten ist. Gibt (entfernte Einträge, freigegebene Bytes) zurück.
+    """
+    entries = _entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0, 0
+    target = max_bytes * target_fraction
+    removed = freed = 0
+    for _, size, image_path in sorted(entries, key=lambda entry: entry[0]):
+        if total - freed <= target:
+            break
+        _remove_entry(image_path)
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def clear_cache(cache_dir):
+    """Entfernt alle Einträge. Gibt (Einträge, Bytes) zurück."""
+    entries = _entries(cache_dir)
+    for _, _, image_path in entries:
+        _remove_entry(image_path)
+    return len(entries), sum(size for _, size, _ in entries)
+
+
+class RenderCache:
+    """Cache-Verwaltung im Hauptprozess: Ort, Obergrenze, Treffer-Statistik und Aufräumen.
+
+    Die Worker erhalten nur den Ordner (cache_dir) und greifen mit load_entry/store_entry zu;
+    record() zählt ihre Ergebnisse und räumt nach jeweils TRIM_AFTER_FRACTION neu geschriebener
+    Obergrenze auf; zwischen zwei Runden kann die Obergrenze um diesen Anteil überschritten werden.
+    """
+
+    def __init__(self, cache_dir=None, max_mb=DEFAULT_CACHE_MB):
+        self.cache_dir = resolve_cache_dir(cache_dir)
+        self.max_bytes = max(0, int(max_mb or 0)) * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.written_bytes = 0
+        self.evicted = 0
+        self._written_since_trim = 0
+        self._trimmed = False
+
+    def record(self, cache_hit, written_bytes):
+        if cache_hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.written_bytes += written_bytes
+        self._written_since_trim += written_bytes
+        if not self._trimmed or self._written_since_trim >= self.max_bytes * TRIM_AFTER_FRACTION:
+            self.trim()
+
+    def trim(self):
+        self._trimmed = True
+        self._written_since_trim = 0
+        try:
+            removed, _ = trim_cache(self.cache_dir, self.max_bytes)
+        except OSError as e:
+            print(f"Render-Cache konnte nicht aufgeräumt werden: {e}")
+            return
+        self.evicted += removed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "written_mb": round(self.written_bytes / 1048576, 1),
+                "evicted": self.evicted, "dir": str(self.cache_dir)}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render-Cache anzeigen, verkleinern oder leeren.")
+    parser.add_argument("--config", default="config.json", help="Konfigurationsdatei (render_cache_dir, render_cache_mb)")
+    parser.add_argument("--dir", default="", help="Cache-Ordner (Standard: render_cache_dir bzw. Benutzer-Cache)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Einträge und Größe anzeigen")
+    trim_parser = subparsers.add_parser("trim", help="Auf eine Obergrenze verkleinern (LRU)")
+    trim_parser.add_argument("--max-mb", type=int, default=None,
+                             help="Obergrenze in MB (Standard: render_cache_mb aus der Konfiguration)")
+    subparsers.add_parser("clear", help="Alle Einträge entfernen")
+    args = parser.parse_args(argv)
+
+    from configuration import ConfigManager
+    config = ConfigManager(args.config).get_current_config()
+    cache_dir = resolve_cache_dir(args.dir or config.get("render_cache_dir"))
+
+    if args.command == "stats":
+        entries, size = cache_usage(cache_dir)
+        print(f"{cache_dir}: {entries} Einträge, {size / 1048576:.1f} MB")
+    elif args.command == "trim":
+        max_mb = config.get("render_cache_mb", DEFAULT_CACHE_MB) if args.max_mb is None else args.max_mb
+        removed, freed = trim_cache(cache_dir, max_mb * 1024 * 1024)
+        print(f"{removed} Einträge entfernt ({freed / 1048576:.1f} MB)")
+    else:
+        removed, freed = clear_cache(cache_dir)
+        print(f"{removed} Einträge entfernt ({freed / 1048576:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
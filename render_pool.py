@@ -0,0 +1,455 @@
+import os
+import sys
+import time
+import base64
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from preflight import check_pdf, stat_verdict, VERDICT_OK, VERDICT_ERROR, VERDICT_CRASHED
+from render_cache import RenderCache, file_digest, render_profile, entry_path, load_entry, store_entry
+import run_profiler
+from run_profiler import stage
+
+# --- RENDER WORKERS ---
+# PyMuPDF-Rendering und JPEG-Kodierung laufen in separaten Prozessen, damit
+# alle CPU-Kerne genutzt werden und ein abstürzendes MuPDF den Lauf nicht beendet.
+
+# "spawn" auf allen Plattformen (wie unter Windows): fork aus einem Prozess mit
+# laufenden Threads (Scanner, stdin-Steuerung, GUI) kann im Kind blockieren.
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+DEFAULT_ZOOM = 1.5
+DEFAULT_JPG_QUALITY = 85
+# Annahme für die Größe eines gerenderten Bildes, solange noch keines gemessen wurde.
+INITIAL_PAYLOAD_ESTIMATE = 1024 * 1024
+# Die Textebene der ersten Seite wird nur bis zu dieser Länge an den Hauptprozess übergeben.
+MAX_TEXT_CHARS = 4000
+
+
+class RenderResult:
+    """Ergebnis eines Render-Auftrags (im Hauptprozess)."""
+    __slots__ = ("pdf_path", "page_count", "base64_image", "error", "render_seconds", "text_date", "text",
+                 "preflight", "digest", "preview", "cache_hit")
+
+    def __init__(self, pdf_path, page_count=0, base64_image=None, error=None, render_seconds=0.0, text_date=None,
+                 text="", preflight=None, digest=None, preview=None, cache_hit=False):
+        self.pdf_path = pdf_path
+        self.page_count = page_count
+        self.base64_image = base64_image
+        self.error = error
+        self.render_seconds = render_seconds
+        self.text_date = text_date  # erstes Datum in der Textebene der ersten Seite (YYYYMMDD) oder None
+        self.text = text  # Textebene der ersten Seite (gekürzt), leer bei gescannten Dokumenten
+        self.preflight = preflight  # Befund der Vorprüfung (siehe preflight), None bei gesunden Dateien
+        self.digest = digest  # SHA256 (hex) des Dateiinhalts, im Worker berechnet
+        self.preview = preview  # Pfad des Bildes im Render-Cache (Vorschaubild), None ohne Cache
+        self.cache_hit = cache_hit  # Bild stammt aus dem Render-Cache
+
+    @classmethod
+    def from_task(cls, pdf_path, data):
+        """Ergebnis aus dem Rückgabewert von _render_task."""
+        return cls(pdf_path, data["page_count"], data["base64_image"], render_seconds=data["seconds"],
+                   text_date=data["text_date"], text=data["text"], digest=data["digest"], preview=data["preview"],
+                   cache_hit=data["cache_hit"])
+
+
+def render_first_page(pdf_path, zoom=DEFAULT_ZOOM, jpg_quality=DEFAULT_JPG_QUALITY):
+    """Rendert die erste Seite eines PDFs und gibt (page_count, base64_jpeg, page_text) zurück.
+
+    Läuft im Worker-Prozess; nimmt einen Dateipfad oder die PDF-Bytes entgegen.
+    page_text ist die Textebene der Seite (höchstens MAX_TEXT_CHARS Zeichen), leer bei
+    gescannten Dokumenten ohne Text.
+    """
+    page_count, jpeg_bytes, page_text = _render_jpeg(pdf_path, zoom, jpg_quality)
+    return page_count, _encode(jpeg_bytes), page_text
+
+
+def _encode(jpeg_bytes):
+    return base64.b64encode(jpeg_bytes).decode("utf-8") if jpeg_bytes else None
+
+
+def _render_jpeg(pdf_path, zoom, jpg_quality):
+    """Wie render_first_page, aber mit den JPEG-Bytes statt Base64."""
+    import fitz  # PyMuPDF
+
+    if isinstance(pdf_path, (bytes, bytearray)):
+        doc = fitz.open(stream=pdf_path, filetype="pdf")
+    else:
+        doc = fitz.open(pdf_path)
+    try:
+        if doc.page_count == 0:
+            return 0, None, ""
+        page = doc.load_page(0)
+        page_text = _page_text(page)
+        mat = fitz.Matrix(zoom, zoom)
+        pix = page.get_pixmap(matrix=mat, alpha=False)
+        # MuPDFs JPEG direkt verwenden: ein erneutes Kodieren mit Pillow würde jpg_quality überschreiben.
+        img_data = pix.tobytes(output="jpeg", jpg_quality=jpg_quality)
+        page_count = doc.page_count
+    finally:
+        doc.close()
+    return page_count, img_data, page_text
+
+
+def _page_text(page):
+    try:
+        return page.get_text("text")[:MAX_TEXT_CHARS]
+    except Exception:
+        return ""
+
+
+def first_page_text(pdf_path):
+    """Nur die Textebene der ersten Seite, ohne zu rendern (für den Aufbau des Kategorie-Index)."""
+    import fitz  # PyMuPDF
+
+    try:
+        with fitz.open(pdf_path) as doc:
+            return _page_text(doc.load_page(0)) if doc.page_count else ""
+    except Exception:
+        return ""
+
+
+def _init_worker():
+    """stdout der Worker auf stderr umleiten (auch auf fd-Ebene für MuPDF-Meldungen),
+    damit nichts in den JSON-Ereignisstrom des Hauptprozesses gerät."""
+    try:
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), 1)
+    except (AttributeError, OSError, ValueError):
+        pass
+    sys.stdout = sys.stderr
+
+
+def _render_task(pdf_path, zoom, jpg_quality, cache_dir=None, profile_interval=None):
+    """Worker-Einstiegspunkt: hasht die Datei, rendert (oder liest aus dem Render-Cache) und misst die Zeit.
+
+    text_date ist das erste Datum der Textebene (YYYYMMDD) für output_repair. Der Hash (digest)
+    dient als Cache-Schlüssel und erspart dem Hauptprozess das erneute Lesen für die Checksumme.
+    Mit profile_interval sampelt der Worker den Auftrag und gibt die Stacks unter "profile" zurück.
+    """
+    from output_repair import find_document_date
+
+    if profile_interval:
+        run_profiler.worker_begin(profile_interval)
+    else:
+        run_profiler.worker_stop()
+    started = time.perf_counter()
+    with stage("hash"):
+        digest = file_digest(pdf_path)
+    profile = render_profile(zoom, jpg_quality)
+    with stage("cache"):
+        entry = load_entry(cache_dir, digest, profile) if cache_dir else None
+    preview = None
+    written = 0
+    if entry is not None:
+        page_count, jpeg_bytes, page_text, preview = entry
+    else:
+        with stage("render"):
+            page_count, jpeg_bytes, page_text = _render_jpeg(pdf_path, zoom, jpg_quality)
+        if cache_dir and jpeg_bytes:
+            with stage("cache"):
+                written = store_entry(cache_dir, digest, profile, page_count, jpeg_bytes, page_text)
+            if written:
+                preview = entry_path(cache_dir, digest, profile)
+    with stage("encode"):
+        base64_image = _encode(jpeg_bytes)
+    return {"page_count": page_count, "base64_image": base64_image, "seconds": time.perf_counter() - started,
+            "text_date": find_document_date(page_text), "text": page_text, "digest": digest,
+            "preview": str(preview) if preview else None, "cache_hit": entry is not None, "cache_written": written,
+            "profile": run_profiler.worker_end() if profile_interval else None}
+
+
+def _worker_starts():
+    """Startet ein Einweg-Prozess überhaupt (spawn, Bootstrap, Import dieses Moduls)?"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=_MP_CONTEXT, initializer=_init_worker) as executor:
+        try:
+            executor.submit(os.getpid).result()
+        except Exception:
+            return False
+    return True
+
+
+def peak_rss_bytes():
+    """Maximaler Speicherverbrauch (RSS) des Hauptprozesses und des größten beendeten Render-Workers.
+
+    Gibt (main, workers) in Bytes zurück; None, wo das Betriebssystem keine Angabe liefert.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    # ru_maxrss ist unter Linux in KiB, unter macOS in Bytes angegeben.
+    unit = 1 if sys.platform == "darwin" else 1024
+    main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return main, workers or None
+
+
+def resolve_worker_count(render_workers):
+    """0 oder None bedeutet: ein Worker pro CPU-Kern."""
+    try:
+        render_workers = int(render_workers or 0)
+    except (TypeError, ValueError):
+        render_workers = 0
+    if render_workers <= 0:
+        render_workers = os.cpu_count() or 1
+    return render_workers
+
+
+class RenderPool:
+    """Prozess-Pool für das Rendern der ersten PDF-Seite.
+
+    Stürzt ein Worker ab (z.B. MuPDF-Segfault bei einer defekten Datei), wird der
+    Pool neu gestartet und die betroffenen Dateien einzeln in einem isolierten
+    Prozess wiederholt. Nur die tatsächlich defekte Datei wird als Fehler gemeldet.
+
+    memory_budget_bytes begrenzt die Bytes, die gleichzeitig unterwegs sind: geöffnete
+    Dokumente in den Workern (Dateigröße) und fertige, noch nicht verarbeitete Bilder.
+    0 bedeutet unbegrenzt (nur die Anzahl ist durch prefetch begrenzt).
+
+    preflight: imap prüft jede Datei vorab (preflight.check_pdf) und rendert nur gesunde;
+    Dateien über max_file_bytes (0 = unbegrenzt) werden gar nicht erst geöffnet.
+
+    cache_mb > 0 aktiviert den Render-Cache (render_cache) in cache_dir (leer = Benutzer-Cache):
+    bereits gerenderte Dateien mit gleichem Inhalt und Profil werden nicht erneut gerastert.
+    """
+
+    def __init__(self, render_workers=0, zoom=DEFAULT_ZOOM, jpg_quality=DEFAULT_JPG_QUALITY, memory_budget_bytes=0,
+                 max_file_bytes=0, preflight=True, cache_mb=0, cache_dir=None):
+        self.workers = resolve_worker_count(render_workers)
+        self.zoom = zoom
+        self.jpg_quality = jpg_quality
+        self.memory_budget_bytes = max(0, int(memory_budget_bytes or 0))
+        self.max_file_bytes = max(0, int(max_file_bytes or 0))
+        self.preflight = preflight
+        self.peak_in_flight_bytes = 0
+        self.cache = None
+        self.configure_cache(cache_mb, cache_dir)
+        self._payload_estimate = INITIAL_PAYLOAD_ESTIMATE
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def configure_cache(self, cache_mb, cache_dir=None):
+        """Render-Cache ein-, um- oder (cache_mb = 0) ausschalten; die Statistik beginnt neu."""
+        self.cache = RenderCache(cache_dir, cache_mb) if int(cache_mb or 0) > 0 else None
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_MP_CONTEXT,
+                                                 initializer=_init_worker)
+        return self._executor
+
+    def _restart(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _task_args(self, pdf_path):
+        cache_dir = str(self.cache.cache_dir) if self.cache is not None else None
+        return str(pdf_path), self.zoom, self.jpg_quality, cache_dir, run_profiler.worker_interval()
+
+    def _submit(self, pdf_path):
+        try:
+            return self._get_executor().submit(_render_task, *self._task_args(pdf_path))
+        except BrokenProcessPool:
+            self._restart()
+            return self._get_executor().submit(_render_task, *self._task_args(pdf_path))
+
+    def _finish(self, pdf_path, data):
+        if data.get("profile"):
+            run_profiler.merge_worker_stacks(data["profile"])
+        if self.cache is not None:
+            self.cache.record(data["cache_hit"], data["cache_written"])
+        return RenderResult.from_task(pdf_path, data)
+
+    def _preflight(self, pdf_paths):
+        """Vorprüfung mit einem Vorlauf von `workers` Dateien: liefert je Eingabe den Pfad einer
+        gesunden Datei oder ein RenderResult mit Befund (preflight) und Grund (error)."""
+        window = deque()
+        paths = iter(pdf_paths)
+        exhausted = False
+        while True:
+            while not exhausted and len(window) < self.workers:
+                try:
+                    pdf_path = next(paths)
+                except StopIteration:
+                    exhausted = True
+                    break
+                verdict = stat_verdict(pdf_path, self.max_file_bytes)
+                if verdict is None:
+                    try:
+                        verdict = self._get_executor().submit(check_pdf, str(pdf_path))
+                    except BrokenProcessPool:
+                        self._restart()
+                        verdict = None  # wird isoliert geprüft
+                window.append((pdf_path, verdict))
+            if not window:
+                return
+            pdf_path, check = window.popleft()
+            if check is None:
+                check = self._check_isolated(pdf_path)
+            elif not isinstance(check, tuple):
+                try:
+                    check = check.result()
+                except (BrokenProcessPool, CancelledError) as e:
+                    # Offene Prüfungen des abgestürzten Pools werden isoliert wiederholt.
+                    if isinstance(e, BrokenProcessPool):
+                        self._restart()
+                    for i, (path, pending_check) in enumerate(window):
+                        if not isinstance(pending_check, tuple):
+                            window[i] = (path, None)
+                    check = self._check_isolated(pdf_path)
+                except Exception as e:
+                    check = (VERDICT_ERROR, f"Vorprüfung fehlgeschlagen: {e}")
+            verdict, detail = check[:2]
+            if verdict == VERDICT_OK:
+                yield pdf_path
+            else:
+                yield RenderResult(pdf_path, error=detail, preflight=verdict)
+
+    def _check_isolated(self, pdf_path):
+        """Wiederholt die Prüfung in einem Einweg-Prozess, nachdem der Pool abgestürzt ist.
+
+        Stürzt auch dieser ab, ist es VERDICT_CRASHED, sofern ein Einweg-Prozess überhaupt
+        starten kann; sonst (und bei anderen Fehlern) VERDICT_ERROR. Beides ist kein Befund
+        über den Inhalt der Datei.
+        """
+        with ProcessPoolExecutor(max_workers=1, mp_context=_MP_CONTEXT, initializer=_init_worker) as executor:
+            try:
+                return executor.submit(check_pdf, str(pdf_path)).result()
+            except BrokenProcessPool:
+                pass
+            except Exception as e:
+                return VERDICT_ERROR, f"Vorprüfung fehlgeschlagen: {e}", 0
+        if not _worker_starts():
+            return VERDICT_ERROR, "Render-Prozess startet nicht", 0
+        return VERDICT_CRASHED, "MuPDF beim Öffnen abgestürzt (zweimal)", 0
+
+    def first_page_texts(self, pdf_paths):
+        """Textebene der ersten Seite für viele Dateien, parallel in den Render-Workern.
+
+        Nicht lesbare Dateien liefern einen leeren Text; ein abgestürzter Worker startet den Pool neu.
+        """
+        pdf_paths = [str(p) for p in pdf_paths]
+        try:
+            return list(self._get_executor().map(first_page_text, pdf_paths, chunksize=16))
+        except BrokenProcessPool:
+            self._restart()
+            return [self._text_isolated(p) for p in pdf_paths]
+
+    def _text_isolated(self, pdf_path):
+        with ProcessPoolExecutor(max_workers=1, mp_context=_MP_CONTEXT, initializer=_init_worker) as executor:
+            try:
+                return executor.submit(first_page_text, pdf_path).result()
+            except Exception:
+                return ""
+
+    def _render_isolated(self, pdf_path):
+        """Wiederholt einen Auftrag in einem eigenen Einweg-Prozess."""
+        with ProcessPoolExecutor(max_workers=1, mp_context=_MP_CONTEXT, initializer=_init_worker) as executor:
+            try:
+                return self._finish(pdf_path, executor.submit(_render_task, *self._task_args(pdf_path)).result())
+            except BrokenProcessPool:
+                return RenderResult(pdf_path, error="Render-Prozess abgestürzt (defekte PDF?)")
+            except Exception as e:
+                return RenderResult(pdf_path, error=str(e))
+
+    def _task_cost(self, pdf_path, future=None):
+        """Geschätzter Speicherbedarf eines Auftrags in Bytes."""
+        if isinstance(future, RenderResult):
+            return 0
+        if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+            base64_image = future.result()["base64_image"]
+            return len(base64_image) if base64_image else 0
+        try:
+            file_size = os.path.getsize(pdf_path)
+        except OSError:
+            file_size = 0
+        return file_size + self._payload_estimate
+
+    def _fits_budget(self, pending, next_path):
+        if not self.memory_budget_bytes:
+            return True
+        in_flight = sum(self._task_cost(p, f) for p, f in pending)
+        self.peak_in_flight_bytes = max(self.peak_in_flight_bytes, in_flight)
+        return in_flight + self._task_cost(next_path) <= self.memory_budget_bytes
+
+    def imap(self, pdf_paths, prefetch=None):
+        """Rendert die Dateien parallel und liefert RenderResult in Eingabereihenfolge.
+
+        Es werden höchstens `prefetch` Aufträge gleichzeitig eingereicht, damit
+        gerenderte Bilder sich nicht unbegrenzt im Speicher ansammeln. Mit einem
+        Speicherbudget wird zusätzlich erst dann nachgelegt, wenn der geschätzte
+        Bedarf des nächsten Auftrags noch ins Budget passt; ein Auftrag läuft immer.
+        Das zuletzt gelieferte Bild gilt als freigegeben, sobald das nächste angefordert wird.
+        Mit preflight liefert jede Datei, die die Vorprüfung nicht besteht, ein RenderResult mit
+        gesetztem preflight, ohne gerendert zu werden.
+        """
+        if prefetch is None:
+            prefetch = self.workers * 2
+        prefetch = max(1, prefetch)
+
+        pending = deque()
+        suspects = set()
+        paths = self._preflight(pdf_paths) if self.preflight else iter(pdf_paths)
+        exhausted = False
+        next_path = None
+
+        while True:
+            while not exhausted and len(pending) < prefetch:
+                if next_path is None:
+                    try:
+                        next_path = next(paths)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                if isinstance(next_path, RenderResult):
+                    pending.append((next_path.pdf_path, next_path))  # Vorprüfung nicht bestanden
+                    next_path = None
+                    continue
+                if pending and not self._fits_budget(pending, next_path):
+                    break  # Gegendruck: erst wieder nachlegen, wenn Bilder verarbeitet sind
+                pending.append((next_path, self._submit(next_path)))
+                next_path = None
+            if not pending:
+                return
+
+            pdf_path, future = pending.popleft()
+            if isinstance(future, RenderResult):
+                yield future
+                continue
+            if pdf_path in suspects:
+                suspects.discard(pdf_path)
+                yield self._render_isolated(pdf_path)
+                continue
+            try:
+                rendered = self._finish(pdf_path, future.result())
+                if rendered.base64_image:
+                    self._payload_estimate = max(self._payload_estimate // 2, len(rendered.base64_image))
+                yield rendered
+            except BrokenProcessPool:
+                # Welcher Auftrag den Absturz verursacht hat, ist unbekannt:
+                # alle noch offenen Aufträge werden isoliert wiederholt.
+                self._restart()
+                suspects.update(p for p, _ in pending)
+                yield self._render_isolated(pdf_path)
+            except CancelledError:
+                # Pool wurde wegen eines Absturzes in der Vorprüfung neu gestartet.
+                suspects.update(p for p, _ in pending)
+                yield self._render_isolated(pdf_path)
+            except Exception as e:
+                yield RenderResult(pdf_path, error=str(e))
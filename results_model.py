@@ -0,0 +1,197 @@
+import html
+from array import array
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex, QTimer, QUrl
+from PyQt6.QtGui import QColor, QIcon, QPixmap
+
+# Result fields shown in the table, in column order, with their headers.
+RESULT_COLUMNS = ["original_filename", "checksum", "new_filename", "status", "target_folder", "error_message"]
+RESULT_HEADERS = ["Original Filename", "Checksum", "New Filename", "Status", "Target Folder", "Error Message"]
+
+# Columns with few distinct values are dictionary-encoded.
+_CATEGORICAL_COLUMNS = {"status", "target_folder"}
+
+# First-page previews come from the render cache ("preview" in a result); they are shown as an
+# icon in the first column and, larger, in its tooltip. Scaled pixmaps are kept for this many rows.
+THUMBNAIL_HEIGHT = 20
+TOOLTIP_PREVIEW_WIDTH = 240
+_THUMBNAIL_CACHE_SIZE = 256
+
+
+class _StringColumn:
+    """Plain column: one Python string per row."""
+    def __init__(self):
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def __getitem__(self, row):
+        return self.values[row]
+
+    def clear(self):
+        self.values = []
+
+
+class _CategoricalColumn:
+    """Dictionary-encoded column: a compact array of codes plus the distinct strings."""
+    def __init__(self):
+        self.codes = array("I")
+        self.labels = []
+        self._lookup = {}
+
+    def append(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.labels)
+            self.labels.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, row):
+        return self.labels[self.codes[row]]
+
+    def clear(self):
+        self.codes = array("I")
+        self.labels = []
+        self._lookup = {}
+
+
+class ResultStore:
+    """Columnar storage for processing results."""
+    def __init__(self):
+        self.columns = [
+            _CategoricalColumn() if key in _CATEGORICAL_COLUMNS else _StringColumn()
+            for key in RESULT_COLUMNS
+        ]
+        self.previews = _StringColumn()
+        self.row_count = 0
+
+    def append(self, result):
+        for column, key in zip(self.columns, RESULT_COLUMNS):
+            column.append(str(result.get(key, "")))
+        self.previews.append(result.get("preview") or "")
+        self.row_count += 1
+
+    def value(self, row, column):
+        return self.columns[column][row]
+
+    def preview(self, row):
+        return self.previews[row]
+
+    def clear(self):
+        for column in self.columns:
+            column.clear()
+        self.previews.clear()
+        self.row_count = 0
+
+
+class ResultsTableModel(QAbstractTableModel):
+    """Table model over a ResultStore.
+
+    Results passed to append_results() are buffered and inserted in one
+    beginInsertRows/endInsertRows block per timer tick, so the view does not
+    relayout once per file.
+    """
+    def __init__(self, parent=None, flush_interval_ms=150):
+        super().__init__(parent)
+        self.store = ResultStore()
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(flush_interval_ms)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.timeout.connect(self.flush)
+        self._thumbnails = OrderedDict()
+
+    def append_results(self, results):
+        self._pending.extend(results)
+        if self._pending and not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush(self):
+        """Inserts all buffered results now."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        first_row = self.store.row_count
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(pending) - 1)
+        for result in pending:
+            self.store.append(result)
+        self.endInsertRows()
+
+    def clear(self):
+        self._flush_timer.stop()
+        self._pending = []
+        self.beginResetModel()
+        self.store.clear()
+        self._thumbnails.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.store.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(RESULT_COLUMNS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.store.value(index.row(), index.column())
+        if role == Qt.ItemDataRole.ForegroundRole and index.column() == RESULT_COLUMNS.index("status"):
+            if self.store.value(index.row(), index.column()) == "Error":
+                return QColor("#c00000")
+        if index.column() == 0 and role in (Qt.ItemDataRole.DecorationRole, Qt.ItemDataRole.ToolTipRole):
+            preview = self.store.preview(index.row())
+            if not preview:
+                return None
+            if role == Qt.ItemDataRole.DecorationRole:
+                return self._thumbnail(preview)
+            # Rich-text tooltip; Qt loads and scales the image itself.
+            return (f'<img src="{html.escape(QUrl.fromLocalFile(preview).toString())}" '
+                    f'width="{TOOLTIP_PREVIEW_WIDTH}">')
+        return None
+
+    def _thumbnail(self, path):
+        """Scaled icon for a cached preview image; None once the cache has evicted the file."""
+        if path in self._thumbnails:
+            self._thumbnails.move_to_end(path)
+            return self._thumbnails[path]
+        pixmap = QPixmap(path)
+        icon = None if pixmap.isNull() else QIcon(pixmap.scaledToHeight(
+            THUMBNAIL_HEIGHT, Qt.TransformationMode.SmoothTransformation))
+        self._thumbnails[path] = icon
+        if len(self._thumbnails) > _THUMBNAIL_CACHE_SIZE:
+            self._thumbnails.popitem(last=False)
+        return icon
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return RESULT_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+
+class ResultsFilterProxyModel(QSortFilterProxyModel):
+    """Sorting plus an 'errors only' switch and a free-text filter over all columns."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.errors_only = False
+        self.text_filter = ""
+        self._status_column = RESULT_COLUMNS.index("status")
+
+    def set_errors_only(self, enabled):
+        self.errors_only = bool(enabled)
+        self.invalidateFilter()
+
+    def set_text_filter(self, text):
+        self.text_filter = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        store = self.sourceModel().store
+        if self.errors_only and store.value(source_row, self._status_column) != "Error":
+            return False
+        if self.text_filter:
+            return any(self.text_filter in store.value(source_row, column).lower()
+                       for column in range(len(RESULT_COLUMNS)))
+        return True
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import pathlib
+import threading
+
+from render_cache import file_digest
+
+# --- RUN JOURNAL ---
+# Append-only Journal pro Lauf mit den Zustandsübergängen jeder Datei
+# (hashed -> inferred -> placing -> placed | failed). Dateien werden unter einem
+# temporären Namen im Zielordner geschrieben und atomar umbenannt. Beim nächsten
+# Start werden halbfertige Platzierungen eines abgestürzten Laufs vervollständigt
+# oder aufgeräumt.
+
+JOURNAL_DIR_NAME = ".pdf_rename_journal"
+PARTIAL_SUFFIX = ".partial"
+
+STATE_HASHED = "hashed"
+STATE_INFERRED = "inferred"
+STATE_PLACING = "placing"
+STATE_PLACED = "placed"
+STATE_FAILED = "failed"
+
+if sys.platform == "win32":
+    import msvcrt
+
+    # msvcrt sperrt ab der aktuellen Position; im Modus "a" steht sie am (wandernden) Dateiende.
+    # Deshalb immer das erste Byte sperren und entsperren.
+    def _try_lock(f):
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+else:
+    import fcntl
+
+    def _try_lock(f):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+
+
+def _fsync_dir(directory):
+    """Macht ein Umbenennen im Verzeichnis dauerhaft (nur POSIX)."""
+    if sys.platform == "win32":
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _link_no_replace(tmp_path, final_path):
+    """Benennt tmp_path atomar in final_path um, ohne eine vorhandene Datei zu überschreiben.
+
+    Wirft FileExistsError, wenn final_path bereits existiert.
+    """
+    if sys.platform == "win32":
+        os.rename(tmp_path, final_path)  # schlägt unter Windows fehl, wenn das Ziel existiert
+        return
+    try:
+        os.link(tmp_path, final_path)
+    except FileExistsError:
+        raise
+    except OSError:
+        # Dateisysteme ohne Hardlinks (z.B. manche SMB-/FAT-Mounts)
+        if os.path.exists(final_path):
+            raise FileExistsError(final_path)
+        os.rename(tmp_path, final_path)
+        return
+    os.unlink(tmp_path)
+
+
+def atomic_copy(src_path, final_path, fsync=True, journal=None, checksum=None):
+    """Kopiert src_path über eine temporäre Datei im Zielordner nach final_path.
+
+    Es entsteht nie eine halbe Datei unter dem endgültigen Namen. Wirft
+    FileExistsError, wenn final_path schon belegt ist (die temporäre Datei wird
+    dann entfernt). checksum (wie im Dateinamen) landet im Journal, damit die
+    Wiederherstellung eine temporäre Kopie prüfen kann.
+    """
+    final_path = pathlib.Path(final_path)
+    tmp_path = final_path.with_name(f".{final_path.name}.{os.getpid()}.{random.randint(0, 99999):05d}{PARTIAL_SUFFIX}")
+    if journal is not None:
+        fields = {"checksum": checksum} if checksum else {}
+        journal.record(src_path, STATE_PLACING, durable=True, tmp=str(tmp_path), target=str(final_path), **fields)
+    try:
+        shutil.copy2(src_path, tmp_path)
+        if fsync:
+            with open(tmp_path, "rb+") as f:
+                os.fsync(f.fileno())
+        _link_no_replace(tmp_path, final_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(final_path.parent)
+    if journal is not None:
+        journal.record(src_path, STATE_PLACED, target=str(final_path))
+
+
+class RunJournal:
+    """Append-only JSON-Lines-Journal eines Laufs.
+
+    Einträge werden gepuffert und gemeinsam geschrieben (Group Commit). Nur vor
+    dem Schreiben einer Zieldatei ('placing') wird mit fsync synchronisiert;
+    alle anderen Übergänge können bei einem Absturz verloren gehen, ohne dass die
+    Wiederherstellung falsch entscheidet. Nach einem sauberen Lauf wird das
+    Journal gelöscht.
+    """
+
+    def __init__(self, base_dir, fsync=True, flush_interval=2.0):
+        self.dir = pathlib.Path(base_dir) / JOURNAL_DIR_NAME
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Rechnername im Dateinamen: Worker mehrerer Rechner schreiben in dasselbe Verzeichnis (work_queue).
+        host = "".join(c if c.isalnum() or c in "-_" else "_" for c in socket.gethostname())
+        self.path = self.dir / f"run-{time.strftime('%Y%m%d-%H%M%S')}-{host}-{os.getpid()}.jsonl"
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self._file = open(self.path, "a", encoding="utf-8")
+        _try_lock(self._file)  # markiert das Journal als "lebt noch" für parallele Wiederherstellungen
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()  # apply_plan schreibt aus mehreren Threads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(clean=exc_type is None)
+
+    def record(self, src_path, state, durable=False, **fields):
+        entry = {"t": round(time.time(), 3), "src": str(src_path), "state": state}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            if durable or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked(durable)
+
+    def flush(self, durable=False):
+        with self._lock:
+            self._flush_locked(durable)
+
+    def _flush_locked(self, durable):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+        self._file.flush()
+        if durable and self.fsync:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self, clean=True):
+        """clean=True: Lauf ist vollständig durchgelaufen, das Journal wird nicht mehr gebraucht."""
+        if self._file is None:
+            return
+        self.flush()
+        _unlock(self._file)
+        self._file.close()
+        self._file = None
+        if clean:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+
+
+def _load_journal(path):
+    """Liest ein Journal und gibt pro Quelldatei den letzten Eintrag zurück (mit der zuletzt
+    verzeichneten Checksumme, auch wenn sie in einem früheren Eintrag stand)."""
+    last_entries = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # abgeschnittene letzte Zeile nach einem Absturz
+            previous = last_entries.get(entry.get("src"))
+            if previous is not None and previous.get("checksum") and not entry.get("checksum"):
+                entry["checksum"] = previous["checksum"]
+            last_entries[entry.get("src")] = entry
+    return last_entries
+
+
+def _copy_complete(tmp_path, entry):
+    """Prüft eine temporäre Kopie gegen die verzeichnete Checksumme (Präfix des SHA256). Ohne
+    Checksumme im Journal müssen Größe und Inhalt mit der Quelle übereinstimmen."""
+    expected = entry.get("checksum")
+    try:
+        if not expected:
+            if tmp_path.stat().st_size != os.stat(entry["src"]).st_size:
+                return False
+            expected = file_digest(entry["src"])
+        return file_digest(tmp_path).startswith(expected)
+    except OSError:
+        return False
+
+
+def recover_journals(base_dir, exclude=None):
+    """Schließt halbfertige Platzierungen abgebrochener Läufe ab.
+
+    Für jede Datei, deren letzter Zustand 'placing' ist:
+      - Zieldatei vorhanden, temporäre Datei weg  -> war fertig (roll forward)
+      - temporäre Datei vollständig (Checksumme stimmt) -> wird umbenannt (roll forward)
+      - sonst -> temporäre Datei wird gelöscht (cleanup)
+    Journale laufender Prozesse (gesperrt) werden übersprungen.
+    Gibt (rolled_forward, cleaned_up) zurück.
+    """
+    journal_dir = pathlib.Path(base_dir) / JOURNAL_DIR_NAME
+    if not journal_dir.is_dir():
+        return 0, 0
+    rolled_forward = cleaned_up = 0
+    for path in sorted(journal_dir.glob("run-*.jsonl")):
+        if exclude is not None and path == exclude:
+            continue
+        with open(path, "a", encoding="utf-8") as lock_file:
+            if not _try_lock(lock_file):
+                continue
+            for entry in _load_journal(path).values():
+                if entry.get("state") != STATE_PLACING:
+                    continue
+                tmp_path = pathlib.Path(entry["tmp"])
+                final_path = pathlib.Path(entry["target"])
+                if not tmp_path.exists():
+                    if final_path.exists():
+                        rolled_forward += 1
+                    continue
+                if _copy_complete(tmp_path, entry):
+                    try:
+                        _link_no_replace(tmp_path, final_path)
+                        rolled_forward += 1
+                        print(f"Wiederhergestellt: {final_path}")
+                        continue
+                    except OSError:
+                        pass
+                try:
+                    tmp_path.unlink()
+                    cleaned_up += 1
+                    print(f"Unvollständige Datei entfernt: {tmp_path}")
+                except OSError:
+                    pass
+            _unlock(lock_file)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    return rolled_forward, cleaned_up
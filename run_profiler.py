@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import pathlib
+import threading
+import contextlib
+
+# --- RUN PROFILER ---
+# Eingebauter Stack-Sampler für einen Verarbeitungslauf: ein Hintergrund-Thread liest alle
+# INTERVAL Sekunden die Python-Stacks aller Threads (sys._current_frames) und zählt sie,
+# zusammen mit der aktuellen Phase (stage), die der Code mit `with stage("place"):` setzt.
+# Die Render-Worker sampeln während eines Auftrags selbst und geben ihre Stacks mit dem
+# Ergebnis zurück (render_pool), so dass auch die Zeit in MuPDF-Aufrufen zugeordnet wird.
+# Ergebnis je Lauf: <name>.collapsed (Brendan-Gregg-Format, für flamegraph.pl/inferno)
+# und <name>.speedscope.json (https://www.speedscope.app).
+#
+# Ohne aktiven Profiler kostet stage() nur einen Funktionsaufruf und liefert einen
+# gemeinsamen, leeren Kontextmanager.
+
+DEFAULT_INTERVAL = 0.005
+PROFILE_DIR_NAME = ".pdf_rename_profiles"
+WORKER_THREAD_NAME = "render-worker"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+_NULL_STAGE = contextlib.nullcontext()
+_active = None  # laufender RunProfiler (Hauptprozess) bzw. Sampler (Worker)
+_stages = {}  # Thread-ID -> Liste der offenen Phasen
+
+
+class _Stage:
+    __slots__ = ("name", "stack")
+
+    def __init__(self, name):
+        self.name = name
+        self.stack = None
+
+    def __enter__(self):
+        self.stack = _stages.setdefault(threading.get_ident(), [])
+        self.stack.append(self.name)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stack.pop()
+
+
+def stage(name):
+    """Markiert einen Abschnitt für den Profiler (z.B. "llm", "place"); ohne Profiler wirkungslos."""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sammelt Stacks als {(Rahmen, ...): [Anzahl, ms]}; die Wurzel ist der Threadname, danach die Phasen.
+
+    threads: nur diese Thread-IDs sampeln (None = alle außer dem Sampler selbst).
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, threads=None):
+        self.interval = interval
+        self.threads = threads
+        self.stacks = {}
+        self.samples = 0
+        self.paused = False
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._labels = {}  # code -> Rahmenname (Cache)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="run-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed_ms, last = (now - last) * 1000, now
+            if not self.paused:
+                self.sample(elapsed_ms, exclude=own)
+
+    def sample(self, elapsed_ms, exclude=None):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude or (self.threads is not None and thread_id not in self.threads):
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _frame_label(code)
+                frames.append(label)
+                frame = frame.f_back
+            frames.reverse()
+            stages = tuple(f"stage:{name}" for name in _stages.get(thread_id, ()))
+            key = (names.get(thread_id, f"thread-{thread_id}"),) + stages + tuple(frames)
+            self.add(key, 1, elapsed_ms)
+        self.samples += 1
+
+    def add(self, key, count, ms):
+        with self.lock:
+            entry = self.stacks.get(key)
+            if entry is None:
+                self.stacks[key] = [count, ms]
+            else:
+                entry[0] += count
+                entry[1] += ms
+
+    def drain(self):
+        """Gibt die bisher gesammelten Stacks zurück und beginnt neu (Worker -> Hauptprozess)."""
+        with self.lock:
+            stacks, self.stacks = self.stacks, {}
+        return stacks
+
+
+class RunProfiler:
+    """Profiliert einen Lauf im Hauptprozess und schreibt am Ende die Profildateien.
+
+    output_dir: Zielordner; name: Dateiname ohne Endung (Standard: run-<Zeitstempel>-<pid>).
+    """
+
+    def __init__(self, output_dir, name=None, interval=DEFAULT_INTERVAL):
+        self.output_dir = pathlib.Path(output_dir)
+        self.name = name or f"run-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.sampler = StackSampler(interval)
+        self.started = None
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        global _active
+        self.started = time.perf_counter()
+        self.sampler.start()
+        _active = self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        self.sampler.stop()
+        self.seconds = time.perf_counter() - self.started
+
+    def merge(self, stacks):
+        """Übernimmt Stacks eines Render-Workers (Wurzel WORKER_THREAD_NAME statt des Threadnamens im Worker)."""
+        for key, (count, ms) in stacks.items():
+            self.sampler.add((WORKER_THREAD_NAME,) + tuple(key[1:]), count, ms)
+
+    def write(self):
+        """Schreibt <name>.collapsed und <name>.speedscope.json; gibt die Pfade zurück."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self.sampler.lock:
+            stacks = sorted(self.sampler.stacks.items())
+        collapsed_path = self.output_dir / f"{self.name}.collapsed"
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            for key, (count, _) in stacks:
+                f.write(";".join(part.replace(";", ",") for part in key) + f" {count}\n")
+        speedscope_path = self.output_dir / f"{self.name}.speedscope.json"
+        with open(speedscope_path, "w", encoding="utf-8") as f:
+            json.dump(_speedscope(self.name, stacks), f)
+        return collapsed_path, speedscope_path
+
+
+def _speedscope(name, stacks):
+    """Ein gewichtetes Sampling-Profil je Wurzel (Thread bzw. Render-Worker), Gewicht in ms."""
+    frames, frame_index, profiles = [], {}, {}
+    for key, (_, ms) in stacks:
+        indices = []
+        for label in key[1:]:
+            index = frame_index.get(label)
+            if index is None:
+                index = frame_index[label] = len(frames)
+                func, _, location = label.partition(" (")
+                file, _, line = location.rstrip(")").rpartition(":")
+                frames.append({"name": func, "file": file, "line": int(line)} if line.isdigit() else {"name": label})
+            indices.append(index)
+        profile = profiles.setdefault(key[0], {"samples": [], "weights": []})
+        profile["samples"].append(indices)
+        profile["weights"].append(round(ms, 3))
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "pdf_rename run_profiler",
+        "shared": {"frames": frames},
+        "profiles": [
+            {"type": "sampled", "name": root, "unit": "milliseconds", "startValue": 0,
+             "endValue": round(sum(profile["weights"]), 3), **profile}
+            for root, profile in sorted(profiles.items())
+        ],
+    }
+
+
+def worker_interval():
+    """Sampling-Intervall für die Render-Worker, solange im Hauptprozess ein Lauf profiliert wird, sonst None."""
+    profiler = _active
+    return profiler.sampler.interval if isinstance(profiler, RunProfiler) else None
+
+
+def merge_worker_stacks(stacks):
+    """Stacks eines Render-Workers an den laufenden Profiler übergeben (falls einer läuft)."""
+    profiler = _active
+    if stacks and isinstance(profiler, RunProfiler):
+        profiler.merge(stacks)
+
+
+def resolve_profile_dir(profile, base_dir):
+    """profile aus Job/Aufruf: True = PROFILE_DIR_NAME unter base_dir, Text = dieser Ordner, sonst None."""
+    if not profile:
+        return None
+    if profile is True or str(profile).lower() in ("1", "true", "yes"):
+        return pathlib.Path(base_dir) / PROFILE_DIR_NAME
+    return pathlib.Path(profile)
+
+
+# --- Render-Worker ---
+
+def worker_begin(interval):
+    """Im Render-Worker vor einem Auftrag: Sampler für den Worker-Hauptthread (einmalig) starten."""
+    global _active
+    if _active is None:
+        _active = StackSampler(interval, threads={threading.get_ident()})
+        _active.start()
+    _active.paused = False
+
+
+def worker_stop():
+    """Im Render-Worker, wenn nicht (mehr) profiliert wird: einen pausierten Sampler beenden."""
+    global _active
+    if _active is not None:
+        _active.stop()
+        _active = None
+
+
+def worker_end():
+    """Im Render-Worker nach einem Auftrag: Pause bis zum nächsten und gesammelte Stacks zurückgeben."""
+    if _active is None:
+        return None
+    _active.paused = True
+    return _active.drain()
@@ -0,0 +1,390 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import select
+import struct
+import pathlib
+import argparse
+import threading
+import multiprocessing
+
+from configuration import ConfigManager, assemble_prompt, classifier_settings, shard_layouts, run_models
+from pdf_processor import PdfProcessor, open_catalog, retry_later
+from run_journal import RunJournal, recover_journals
+
+# --- WATCH-FOLDER DAEMON ---
+# Beobachtet das Eingangsverzeichnis dauerhaft und verarbeitet neue PDFs einzeln,
+# sobald sie vollständig geschrieben sind. Client und Render-Pool bleiben warm.
+
+STATE_FILE_NAME = ".pdf_rename_watch_state.jsonl"
+LEGACY_STATE_FILE_NAME = ".pdf_rename_watch_state.json"
+STATUS_FILE_NAME = ".pdf_rename_watch_status.json"
+RESCAN_SECONDS = 60.0  # Verzeichnis regelmäßig neu einlesen: verlorene Ereignisse, zurückgestellte Dateien
+RETRY_SECONDS = 60.0  # Wartezeit, bevor eine Datei ohne verwertbares Ergebnis erneut versucht wird
+
+
+def _is_pdf_name(name):
+    return name.lower().endswith(".pdf") and not name.startswith(".")
+
+
+def _list_pdf_names(directory):
+    with os.scandir(directory) as it:
+        return [entry.name for entry in it if entry.is_file() and _is_pdf_name(entry.name)]
+
+
+def _write_json_atomic(path, data):
+    """Schreibt JSON über eine temporäre Datei, damit Leser nie eine halbe Datei sehen."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class PollingWatcher:
+    """Fallback: listet das Verzeichnis in festen Abständen auf."""
+    name = "polling"
+
+    def __init__(self, directory, poll_interval=2.0):
+        self.directory = pathlib.Path(directory)
+        self.poll_interval = poll_interval
+        self._last_poll = 0.0
+
+    def wait(self, timeout):
+        """Gibt die Namen aller PDFs zurück, höchstens alle poll_interval Sekunden."""
+        remaining = self._last_poll + self.poll_interval - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(timeout, remaining))
+            return []
+        self._last_poll = time.monotonic()
+        return _list_pdf_names(self.directory)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify über ctypes, ohne zusätzliche Abhängigkeit."""
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        self.directory = pathlib.Path(directory)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Wartet höchstens timeout Sekunden und gibt die Namen geänderter PDFs zurück.
+
+        Ist die Ereignis-Warteschlange des Kernels übergelaufen, fehlen Ereignisse: dann
+        werden alle PDFs im Verzeichnis zurückgegeben.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        overflow = False
+        offset = 0
+        while offset + self._EVENT_HEADER.size <= len(data):
+            _wd, mask, _cookie, length = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+            elif name and _is_pdf_name(name):
+                names.append(name)
+        if overflow:
+            print("inotify-Warteschlange übergelaufen, lese das Verzeichnis neu ein.")
+            return _list_pdf_names(self.directory)
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(directory, poll_interval=2.0, force_polling=False):
+    """inotify, wenn verfügbar; sonst (Windows, macOS, Netzlaufwerke) Polling."""
+    if not force_polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            print(f"inotify nicht verfügbar ({e}), verwende Polling.")
+    return PollingWatcher(directory, poll_interval)
+
+
+class WatchDaemon:
+    """Nimmt Dateien erst auf, wenn Größe und Änderungszeit settle_seconds lang stabil sind."""
+
+    def __init__(self, processor, inbox_dir, settle_seconds=2.0, poll_interval=2.0, force_polling=False,
+                 progress_callback=None, catalog=False):
+        self.processor = processor
+        self.inbox_dir = pathlib.Path(inbox_dir)
+        self.catalog = catalog
+        self.settle_seconds = settle_seconds
+        self.progress_callback = progress_callback
+        self.watcher = create_watcher(self.inbox_dir, poll_interval, force_polling)
+
+        self.state_path = self.inbox_dir / STATE_FILE_NAME
+        self.status_path = self.inbox_dir / STATUS_FILE_NAME
+        self.seen = self._load_state()
+        self.candidates = {}  # name -> (size, mtime_ns, stable_since)
+        self.queued = set()
+        self.retry_at = {}  # name -> monotonic-Zeit, ab der eine zurückgestellte Datei wieder aufgenommen wird
+        self._retry = False  # Ergebnis der aktuellen Datei erlaubt keine Aussage (retry_later)
+        self.work_queue = queue.Queue()
+        self.stop_event = threading.Event()
+
+        self.processed = 0
+        self.errors = 0
+        self.current_file = None
+        self.last_file = None
+        self.started_at = time.time()
+        self._status_lock = threading.Lock()
+
+    # --- Persistenz ---
+
+    def _load_state(self):
+        """Bereits verarbeitete Dateien (Name -> [Größe, mtime_ns]) aus früheren Läufen.
+
+        Die Zustandsdatei wird im Betrieb nur ergänzt (eine Zeile je Datei). Beim Start wird sie
+        auf die Dateien verdichtet, die noch im Eingangsverzeichnis liegen.
+        """
+        seen = {}
+        legacy_path = self.inbox_dir / LEGACY_STATE_FILE_NAME
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                seen.update(json.load(f).get("seen", {}))
+        except (OSError, json.JSONDecodeError, AttributeError):
+            pass
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        seen[record["name"]] = record["seen"]
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue  # z.B. abgebrochene letzte Zeile
+        except OSError:
+            pass
+        present = set(_list_pdf_names(self.inbox_dir))
+        seen = {name: signature for name, signature in seen.items() if name in present}
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for name, signature in seen.items():
+                f.write(json.dumps({"name": name, "seen": signature}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.state_path)
+        if legacy_path.exists():
+            legacy_path.unlink()
+        return seen
+
+    def _remember(self, name, st):
+        """Vermerkt eine verarbeitete Datei (eine angehängte Zeile statt die ganze Datei neu zu schreiben)."""
+        self.seen[name] = [st.st_size, st.st_mtime_ns]
+        with open(self.state_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"name": name, "seen": self.seen[name]}, ensure_ascii=False) + "\n")
+
+    def write_status(self, state="running"):
+        with self._status_lock:
+            _write_json_atomic(self.status_path, {
+                "state": state,
+                "pid": os.getpid(),
+                "watcher": self.watcher.name,
+                "inbox": str(self.inbox_dir),
+                "queue_length": self.work_queue.qsize(),
+                "settling": len(self.candidates),
+                "current_file": self.current_file,
+                "last_file": self.last_file,
+                "processed": self.processed,
+                "errors": self.errors,
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+            })
+
+    # --- Erkennung ---
+
+    def _is_new(self, name, st):
+        return self.seen.get(name) != [st.st_size, st.st_mtime_ns]
+
+    def _note_candidates(self, names):
+        now = time.monotonic()
+        for name in names:
+            if self.retry_at.get(name, 0.0) > now:
+                continue
+            self.retry_at.pop(name, None)
+            if name not in self.queued and name not in self.candidates:
+                self.candidates[name] = None
+
+    def _check_candidates(self):
+        """Reiht Kandidaten ein, deren Größe und mtime sich nicht mehr ändern."""
+        now = time.monotonic()
+        for name, previous in list(self.candidates.items()):
+            try:
+                st = os.stat(self.inbox_dir / name)
+            except FileNotFoundError:
+                del self.candidates[name]
+                continue
+            if not self._is_new(name, st):
+                del self.candidates[name]
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if previous is None or previous[:2] != signature:
+                self.candidates[name] = (*signature, now)
+            elif now - previous[2] >= self.settle_seconds:
+                # Auch 0-Byte-Dateien: die Vorprüfung meldet sie als leer (statt sie ewig liegen zu lassen).
+                del self.candidates[name]
+                self.queued.add(name)
+                self.work_queue.put(name)
+
+    def _handle_result(self, data):
+        if retry_later(data):
+            self._retry = True
+        if data.get("status") == "Error":
+            self.errors += 1
+        if self.progress_callback:
+            self.progress_callback(data)
+
+    # --- Verarbeitung ---
+
+    def _worker_loop(self):
+        if self.catalog:
+            # Im Worker-Thread öffnen: die SQLite-Verbindung gehört dem Thread, der sie öffnet.
+            # Dateien kommen einzeln: jeden Eintrag sofort schreiben, damit er gleich gefunden wird.
+            self.processor.catalog = open_catalog(self.inbox_dir, flush_rows=1)
+        try:
+            self._process_queue()
+        finally:
+            if self.processor.catalog is not None:
+                self.processor.catalog.close()
+                self.processor.catalog = None
+
+    def _process_queue(self):
+        while not self.stop_event.is_set():
+            try:
+                name = self.work_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            pdf_path = self.inbox_dir / name
+            self.current_file = name
+            self.write_status()
+            try:
+                st = os.stat(pdf_path)
+                self._retry = False
+                self.processor.process_files([pdf_path], self._handle_result)
+                if self._retry:
+                    # LLM nicht erreichbar oder Vorprüfung gescheitert: nicht als gesehen vermerken.
+                    self.retry_at[name] = time.monotonic() + RETRY_SECONDS
+                    print(f"{name} wird in {RETRY_SECONDS:.0f} s erneut versucht.")
+                else:
+                    self._remember(name, st)
+                self.processed += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.errors += 1
+                print(f"Fehler bei der Verarbeitung von {name}: {e}")
+            finally:
+                self.queued.discard(name)
+                self.current_file = None
+                self.last_file = name
+                self.write_status()
+
+    def run(self, tick=0.5):
+        """Läuft bis stop() aufgerufen wird; die aktuelle Datei wird noch fertig verarbeitet."""
+        print(f"Watch-Daemon gestartet ({self.watcher.name}) für: {self.inbox_dir}")
+        self._note_candidates(_list_pdf_names(self.inbox_dir))
+        last_rescan = time.monotonic()
+
+        worker = threading.Thread(target=self._worker_loop, name="watch-worker", daemon=True)
+        worker.start()
+        last_status = 0.0
+        try:
+            while not self.stop_event.is_set():
+                self._note_candidates(self.watcher.wait(tick if self.candidates else 1.0))
+                if time.monotonic() - last_rescan >= RESCAN_SECONDS:
+                    self._note_candidates(_list_pdf_names(self.inbox_dir))
+                    last_rescan = time.monotonic()
+                self._check_candidates()
+                if time.monotonic() - last_status >= 1.0:
+                    self.write_status()
+                    last_status = time.monotonic()
+        finally:
+            self.stop_event.set()
+            self.write_status("stopping")
+            worker.join()
+            self.watcher.close()
+            self.write_status("stopped")
+            print(f"Watch-Daemon beendet. {self.processed} Dateien verarbeitet.")
+
+    def stop(self, *_args):
+        self.stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Beobachtet das PDF-Verzeichnis und verarbeitet neue Dateien laufend.")
+    parser.add_argument("--config", default="config.json", help="Pfad zur Konfigurationsdatei")
+    parser.add_argument("--pdf-dir", help="Eingangsverzeichnis (Standard: pdf_dir aus der Konfiguration)")
+    parser.add_argument("--settle-seconds", type=float, default=2.0,
+                        help="So lange müssen Größe und Änderungszeit unverändert sein")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Intervall für den Polling-Fallback")
+    parser.add_argument("--polling", action="store_true", help="Polling statt inotify erzwingen")
+    args = parser.parse_args(argv)
+
+    config = ConfigManager(args.config).get_current_config()
+    inbox_dir = pathlib.Path(args.pdf_dir or config["pdf_dir"])
+    if not inbox_dir.is_dir():
+        print(f"Fehler: '{inbox_dir}' ist kein gültiges Verzeichnis.")
+        return 1
+    assembled_prompt, category_map = assemble_prompt(config)
+
+    def cli_callback(data):
+        print(f"{data['original_filename']} -> {data['status']} | {data['error_message']}")
+
+    rolled_forward, cleaned_up = recover_journals(inbox_dir)
+    if rolled_forward or cleaned_up:
+        print(f"Journal-Wiederherstellung: {rolled_forward} Dateien abgeschlossen, {cleaned_up} unvollständige Dateien entfernt.")
+
+    with RunJournal(inbox_dir) as journal, \
+            PdfProcessor(inbox_dir, config["target_url"], run_models(config), assembled_prompt,
+                         category_map, config.get("render_workers", 0), journal,
+                         memory_budget_mb=config.get("memory_budget_mb", 0),
+                         classifier=classifier_settings(config), quarantine_dir=config.get("quarantine_dir", "QUARANTINE"),
+                         max_pdf_size_mb=config.get("max_pdf_size_mb", 0),
+                         render_cache_mb=config.get("render_cache_mb", 0),
+                         render_cache_dir=config.get("render_cache_dir"),
+                         shard_layout=shard_layouts(config)) as processor:
+        daemon = WatchDaemon(processor, inbox_dir, args.settle_seconds, args.poll_interval, args.polling,
+                             progress_callback=cli_callback, catalog=config.get("catalog", True))
+        signal.signal(signal.SIGINT, daemon.stop)
+        signal.signal(signal.SIGTERM, daemon.stop)
+        daemon.run()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,541 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import sqlite3
+import pathlib
+import argparse
+import threading
+import contextlib
+import multiprocessing
+from collections import deque
+
+from pdf_scanner import iter_pdf_files
+from job_control import ProcessingJob
+from preflight import QUARANTINE_DIR_NAME
+from run_journal import RunJournal, recover_journals
+from event_protocol import EventWriter, EVENT_START, EVENT_RESULT, EVENT_PROGRESS, EVENT_SUMMARY
+
+# --- VERTEILTE VERARBEITUNG ---
+# Der Koordinator schreibt alle gefundenen PDFs in eine SQLite-Warteschlange im PDF-
+# Verzeichnis (gemeinsames Volume). Beliebig viele Worker auf diesem oder anderen Rechnern
+# holen sich Dateien mit einer Lease, führen Hash -> Render -> Inferenz -> Platzierung aus
+# und tragen das Ergebnis ein. Leases werden während der Arbeit verlängert; läuft eine ab
+# (Worker abgestürzt), kommt die Datei wieder in die Warteschlange. Kein Broker nötig.
+#
+#   python work_queue.py coordinate job.json      # Dateien einreihen (mehrfach aufrufbar)
+#   python work_queue.py work /pfad/zum/pdf_dir   # Worker, beliebig oft parallel
+#   python work_queue.py status /pfad/zum/pdf_dir
+
+QUEUE_FILE_NAME = ".pdf_rename_queue.sqlite"
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL = 2.0
+ENQUEUE_BATCH_SIZE = 200
+
+ENTRY_QUEUED = "queued"
+ENTRY_LEASED = "leased"
+ENTRY_DONE = "done"
+ENTRY_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_state ON files (state, id);
+"""
+
+
+def queue_path(location):
+    """Pfad der Warteschlange: die Datei selbst oder QUEUE_FILE_NAME in einem Verzeichnis."""
+    location = pathlib.Path(location)
+    return location / QUEUE_FILE_NAME if location.is_dir() else location
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """Dauerhafte Warteschlange in SQLite; jede Zustandsänderung ist eine eigene Transaktion.
+
+    Zeilen in files: Pfad relativ zum PDF-Verzeichnis, Größe und mtime beim Einreihen,
+    Zustand queued -> leased -> done | failed, Lease-Inhaber und -Ablauf (Unix-Zeit),
+    Anzahl Versuche und das Ergebnis als JSON. Der Rollback-Journal-Modus (kein WAL)
+    funktioniert auch auf Netzlaufwerken mit funktionierenden Dateisperren.
+    """
+
+    def __init__(self, path, timeout=60.0):
+        self.path = pathlib.Path(path)
+        self._conn = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()  # Lease-Verlängerung läuft in einem eigenen Thread
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE: die Schreibsperre wird sofort genommen, zwei Worker können
+        # also nicht dieselben Zeilen lesen und danach beide leasen.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # --- Metadaten ---
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, **values):
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value, ensure_ascii=False)) for key, value in values.items()])
+
+    # --- Koordinator ---
+
+    def enqueue(self, entries):
+        """Reiht (relativer Pfad, Größe, mtime_ns) ein. Gibt die Anzahl neuer oder geänderter Dateien zurück.
+
+        Unveränderte Dateien behalten ihren Zustand; eine geänderte Datei wird erneut eingereiht,
+        sofern sie nicht gerade bearbeitet wird.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO files (path, size, mtime_ns, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "state = 'queued', owner = NULL, lease_expires = NULL, attempts = 0, result = NULL, "
+                "updated = excluded.updated "
+                "WHERE files.state != 'leased' AND (files.size != excluded.size OR files.mtime_ns != excluded.mtime_ns)",
+                [(path, size, mtime_ns, now) for path, size, mtime_ns in entries])
+            return conn.total_changes - before
+
+    def retry_failed(self):
+        """Reiht alle fehlgeschlagenen Dateien mit zurückgesetztem Versuchszähler erneut ein."""
+        with self._transaction() as conn:
+            return conn.execute("UPDATE files SET state = 'queued', attempts = 0, result = NULL, updated = ? "
+                                "WHERE state = 'failed'", (time.time(),)).rowcount
+
+    # --- Worker ---
+
+    def claim(self, owner, limit, lease_seconds, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Least bis zu limit Dateien für owner. Gibt [(id, relativer Pfad)] zurück.
+
+        Abgelaufene Leases werden vorher zurückgesetzt; eine Datei, deren Lease
+        max_attempts-mal abgelaufen ist, gilt als fehlgeschlagen (z.B. bringt sie den Worker zum Absturz).
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE files SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "result = CASE WHEN attempts >= ? THEN ? ELSE result END, owner = NULL, lease_expires = NULL, "
+                "updated = ? WHERE state = 'leased' AND lease_expires < ?",
+                (max_attempts, max_attempts,
+                 json.dumps({"status": "Error", "error_message": f"Lease {max_attempts}-mal abgelaufen"}),
+                 now, now))
+            rows = conn.execute("SELECT id, path FROM files WHERE state = 'queued' ORDER BY id LIMIT ?",
+                                (int(limit),)).fetchall()
+            conn.executemany(
+                "UPDATE files SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = ?",
+                [(owner, now + lease_seconds, now, entry_id) for entry_id, _ in rows])
+        return rows
+
+    def renew(self, owner, entry_ids, lease_seconds):
+        """Verlängert die Leases von owner. Gibt die Anzahl noch gehaltener Leases zurück."""
+        if not entry_ids:
+            return 0
+        entry_ids = list(entry_ids)
+        placeholders = ",".join("?" * len(entry_ids))
+        with self._transaction() as conn:
+            return conn.execute(
+                f"UPDATE files SET lease_expires = ? WHERE owner = ? AND state = 'leased' AND id IN ({placeholders})",
+                [time.time() + lease_seconds, owner] + entry_ids).rowcount
+
+    def complete(self, entry_id, owner, state, result):
+        """Trägt das Ergebnis ein. False, wenn die Lease inzwischen verloren war."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE files SET state = ?, result = ?, owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (state, json.dumps(result, ensure_ascii=False), time.time(), entry_id, owner)).rowcount == 1
+
+    def release(self, entry_id, owner, result=None, count_attempt=True, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Gibt eine Datei zurück in die Warteschlange (z.B. bei LLM-API-Fehlern oder Abbruch).
+
+        count_attempt=False nimmt den Versuch zurück (Datei wurde gar nicht bearbeitet).
+        Nach max_attempts Versuchen wird die Datei mit result als fehlgeschlagen eingetragen.
+        """
+        params = {"undo": 0 if count_attempt else 1, "max": max_attempts, "now": time.time(),
+                  "result": json.dumps(result, ensure_ascii=False), "id": entry_id, "owner": owner}
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE files SET attempts = attempts - :undo, owner = NULL, lease_expires = NULL, updated = :now, "
+                "state = CASE WHEN attempts - :undo >= :max THEN 'failed' ELSE 'queued' END, "
+                "result = CASE WHEN attempts - :undo >= :max THEN :result ELSE result END "
+                "WHERE id = :id AND owner = :owner AND state = 'leased'", params)
+
+    def counts(self):
+        """Anzahl Dateien je Zustand."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall()
+        counts = {ENTRY_QUEUED: 0, ENTRY_LEASED: 0, ENTRY_DONE: 0, ENTRY_FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def workers(self):
+        """Aktuelle Lease-Inhaber mit der Anzahl gehaltener Dateien."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT owner, COUNT(*) FROM files WHERE state = 'leased' GROUP BY owner").fetchall())
+
+
+def _category_map(spec):
+    category_map = spec["category_map"]
+    return json.loads(category_map) if isinstance(category_map, str) else category_map
+
+
+def coordinate(spec, db_path=None, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+               wait=False, on_event=None):
+    """Reiht alle PDFs der Job-Spezifikation in die Warteschlange ein und speichert die Spezifikation.
+
+    Erneute Aufrufe reihen nur neue oder geänderte Dateien ein. wait=True wartet, bis die Worker
+    alle Dateien erledigt haben. Gibt die Zustandszählung der Warteschlange zurück.
+    """
+    from pdf_processor import validate_job_spec, scan_exclude_dirs
+    on_event = on_event or (lambda event, **fields: None)
+    validate_job_spec(spec)
+    if spec.get("plan_file"):
+        raise ValueError("Der Plan-Modus wird von der Warteschlange nicht unterstützt.")
+    pdf_dir = pathlib.Path(spec["pdf_dir"]).resolve()
+    if not pdf_dir.is_dir():
+        raise ValueError(f"'{pdf_dir}' ist kein gültiges Verzeichnis.")
+    exclude_dirs = scan_exclude_dirs(_category_map(spec), spec.get("quarantine_dir", QUARANTINE_DIR_NAME))
+
+    with WorkQueue(db_path or pdf_dir / QUEUE_FILE_NAME) as work_queue:
+        work_queue.set_meta(spec=spec, lease_seconds=lease_seconds, max_attempts=max_attempts,
+                            enumeration_complete=False)
+        on_event(EVENT_START, role="coordinator", pdf_dir=str(pdf_dir), queue=str(work_queue.path),
+                 model_name=spec["model_name"])
+        started = time.perf_counter()
+        found = added = 0
+        batch = []
+        for pdf_path in iter_pdf_files(pdf_dir, spec.get("recursive", False), spec.get("include_patterns"),
+                                       spec.get("exclude_patterns"), exclude_dirs=exclude_dirs):
+            try:
+                st = pdf_path.stat()
+            except OSError:
+                continue
+            batch.append((pdf_path.relative_to(pdf_dir).as_posix(), st.st_size, st.st_mtime_ns))
+            found += 1
+            if len(batch) >= ENQUEUE_BATCH_SIZE:
+                added += work_queue.enqueue(batch)
+                batch = []
+        added += work_queue.enqueue(batch)
+        work_queue.set_meta(enumeration_complete=True)
+        print(f"{found} PDFs gefunden, {added} neu oder geändert eingereiht ({time.perf_counter() - started:.1f} s). "
+              f"Warteschlange: {work_queue.path}")
+
+        counts = work_queue.counts()
+        on_event(EVENT_PROGRESS, role="coordinator", found=found, added=added, **counts)
+        while wait and (counts[ENTRY_QUEUED] or counts[ENTRY_LEASED]):
+            time.sleep(POLL_INTERVAL)
+            previous, counts = counts, work_queue.counts()
+            if counts != previous:
+                on_event(EVENT_PROGRESS, role="coordinator", workers=len(work_queue.workers()), **counts)
+        on_event(EVENT_SUMMARY, role="coordinator", ok=True, found=found, added=added,
+                 elapsed_s=round(time.perf_counter() - started, 3), **counts)
+        return counts
+
+
+class QueueWorker:
+    """Verarbeitet Dateien aus der Warteschlange mit einem warmen PdfProcessor.
+
+    Es werden immer nur so viele Dateien geleast, wie der Render-Pool vorausrendert (batch);
+    ein Hintergrund-Thread verlängert die Leases aller gehaltenen Dateien. Der Worker endet,
+    wenn die Warteschlange leer ist und keine Datei mehr von anderen Workern gehalten wird
+    (deren Leases könnten noch ablaufen), mit wait=True erst bei stop().
+    """
+
+    def __init__(self, db_path, pdf_dir=None, render_workers=0, memory_budget_mb=0, batch=None,
+                 lease_seconds=None, wait=False, on_event=None):
+        self.queue = WorkQueue(db_path)
+        self.spec = self.queue.get_meta("spec")
+        if self.spec is None:
+            self.queue.close()
+            raise ValueError(f"'{db_path}' enthält keine Job-Spezifikation; zuerst 'coordinate' ausführen.")
+        # Andere Rechner binden das gemeinsame Volume evtl. unter einem anderen Pfad ein.
+        if pdf_dir is None:
+            pdf_dir = self.spec["pdf_dir"]
+            if not pathlib.Path(pdf_dir).is_dir():
+                pdf_dir = self.queue.path.parent
+        self.pdf_dir = pathlib.Path(pdf_dir).resolve()
+        self.lease_seconds = lease_seconds or self.queue.get_meta("lease_seconds", DEFAULT_LEASE_SECONDS)
+        self.max_attempts = self.queue.get_meta("max_attempts", DEFAULT_MAX_ATTEMPTS)
+        self.render_workers = render_workers
+        self.memory_budget_mb = memory_budget_mb
+        self.batch = batch
+        self.wait = wait
+        self.on_event = on_event or (lambda event, **fields: None)
+        self.owner = worker_name()
+        self.control = ProcessingJob()
+        self.held = set()  # geleaste, noch nicht abgeschlossene Einträge
+        self.lost = 0
+        self.processed = self.succeeded = self.errors = self.released = 0
+        self._held_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._drained = False
+
+    def stop(self):
+        """Holt keine weiteren Dateien; bereits gerenderte werden zurückgegeben."""
+        self.control.cancel()
+        self._stopped.set()
+
+    def _renew_leases(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._held_lock:
+                held = list(self.held)
+            try:
+                renewed = self.queue.renew(self.owner, held, self.lease_seconds)
+            except sqlite3.Error as e:
+                print(f"Lease-Verlängerung fehlgeschlagen: {e}")
+                continue
+            if renewed < len(held):
+                print(f"Warnung: {len(held) - renewed} Leases sind abgelaufen und wurden evtl. "
+                      f"an andere Worker vergeben.")
+
+    def _claimed_files(self, order, batch):
+        """Least Dateien in kleinen Gruppen und liefert ihre Pfade an den Render-Pool.
+
+        Ist gerade nichts frei, endet der Generator, solange noch eigene Dateien in Arbeit
+        sind (run() beginnt danach eine neue Runde); sonst wird gewartet bzw. _drained gesetzt.
+        """
+        while not self.control.cancelled:
+            rows = self.queue.claim(self.owner, batch, self.lease_seconds, self.max_attempts)
+            if not rows:
+                with self._held_lock:
+                    if self.held:
+                        return
+                counts = self.queue.counts()
+                done = (not counts[ENTRY_QUEUED] and not counts[ENTRY_LEASED]
+                        and self.queue.get_meta("enumeration_complete", False))
+                if done and not self.wait:
+                    self._drained = True
+                    return
+                if self._stopped.wait(POLL_INTERVAL):
+                    return
+                continue
+            with self._held_lock:
+                self.held.update(entry_id for entry_id, _ in rows)
+            for entry_id, rel_path in rows:
+                if self.control.cancelled:
+                    self._release(entry_id, count_attempt=False)
+                    continue
+                order.append(entry_id)
+                yield self.pdf_dir / rel_path
+
+    def _release(self, entry_id, result=None, count_attempt=True):
+        self.queue.release(entry_id, self.owner, result, count_attempt, self.max_attempts)
+        self.released += 1
+        with self._held_lock:
+            self.held.discard(entry_id)
+
+    def _complete(self, entry_id, state, result):
+        if not self.queue.complete(entry_id, self.owner, state, result):
+            self.lost += 1
+            print(f"Warnung: Lease für {result.get('original_filename')} war abgelaufen; "
+                  f"das Ergebnis wurde nicht eingetragen.")
+        with self._held_lock:
+            self.held.discard(entry_id)
+
+    def _process(self, processor, entry_id, rendered):
+        from pdf_processor import retry_later
+
+        reported = [False]
+
+        def on_result(data):
+            reported[0] = True
+            data.update(worker=self.owner, entry_id=entry_id)
+            self.on_event(EVENT_RESULT, **data)
+            if retry_later(data):
+                # Server nicht erreichbar, Vorprüfung gescheitert o.ä.: ein anderer Worker (oder später) versucht es erneut.
+                self._release(entry_id, data)
+                return
+            self.processed += 1
+            if data["status"] == "Error":
+                self.errors += 1
+                self._complete(entry_id, ENTRY_FAILED, data)
+            else:
+                self.succeeded += 1
+                self._complete(entry_id, ENTRY_DONE, data)
+
+        processor.process_rendered(rendered, on_result)
+        if not reported[0]:
+            self.processed += 1
+            self.errors += 1
+            self._complete(entry_id, ENTRY_FAILED, {"original_filename": rendered.pdf_path.name, "status": "Error",
+                                                    "error_message": "PDF enthält keine Seiten"})
+        self.on_event(EVENT_PROGRESS, worker=self.owner, processed=self.processed, **self.queue.counts())
+
+    def run(self):
+        """Arbeitet die Warteschlange ab. Gibt die Anzahl verarbeiteter Dateien zurück."""
+        from pdf_processor import PdfProcessor, processor_summary, open_catalog
+        spec = self.spec
+        started = time.perf_counter()
+        rolled_forward, cleaned_up = recover_journals(self.pdf_dir)
+        if rolled_forward or cleaned_up:
+            print(f"Journal-Wiederherstellung: {rolled_forward} Dateien abgeschlossen, "
+                  f"{cleaned_up} unvollständige Dateien entfernt.")
+        renewer = threading.Thread(target=self._renew_leases, name="lease-renewal", daemon=True)
+        with RunJournal(self.pdf_dir) as journal, \
+                PdfProcessor(self.pdf_dir, spec["target_url"], spec["model_name"], spec["assembled_prompt"],
+                             _category_map(spec), self.render_workers or spec.get("render_workers", 0), journal=journal,
+                             memory_budget_mb=self.memory_budget_mb or spec.get("memory_budget_mb", 0),
+                             classifier=spec.get("classifier"),
+                             quarantine_dir=spec.get("quarantine_dir", QUARANTINE_DIR_NAME),
+                             max_pdf_size_mb=spec.get("max_pdf_size_mb", 0),
+                             render_cache_mb=spec.get("render_cache_mb", 0),
+                             render_cache_dir=spec.get("render_cache_dir"),
+                             shard_layout=spec.get("shard_layout")) as processor:
+            processor.ensure_index()
+            if spec.get("catalog", True):
+                processor.catalog = open_catalog(self.pdf_dir)
+            batch = self.batch or processor.render_pool.workers
+            self.on_event(EVENT_START, role="worker", worker=self.owner, pdf_dir=str(self.pdf_dir),
+                          queue=str(self.queue.path), model_name=spec["model_name"],
+                          render_workers=processor.render_pool.workers, pid=os.getpid())
+            print(f"Worker {self.owner}: {processor.render_pool.workers} Render-Prozesse, "
+                  f"Lease {self.lease_seconds:.0f} s, Warteschlange {self.queue.path}")
+            renewer.start()
+            try:
+                while not self._drained and not self.control.cancelled:
+                    order = deque()
+                    for rendered in processor.render_pool.imap(self._claimed_files(order, batch), prefetch=batch):
+                        entry_id = order.popleft()
+                        if self.control.cancelled:
+                            self._release(entry_id, count_attempt=False)
+                            continue
+                        self._process(processor, entry_id, rendered)
+            finally:
+                self._stopped.set()
+                renewer.join()
+                with self._held_lock:
+                    leftover = list(self.held)
+                for entry_id in leftover:
+                    self._release(entry_id, count_attempt=False)
+                if processor.catalog is not None:
+                    processor.catalog.close()
+            self.on_event(EVENT_SUMMARY, role="worker", worker=self.owner, ok=True, cancelled=self.control.cancelled,
+                          elapsed_s=round(time.perf_counter() - started, 3), processed=self.processed,
+                          succeeded=self.succeeded, errors=self.errors, released=self.released,
+                          lost_leases=self.lost, **processor_summary(processor))
+        self.queue.close()
+        print(f"Worker {self.owner} beendet: {self.processed} Dateien verarbeitet, {self.errors} Fehler.")
+        return self.processed
+
+
+def _print_status(work_queue):
+    counts = work_queue.counts()
+    print(json.dumps({"queue": str(work_queue.path), **counts,
+                      "enumeration_complete": work_queue.get_meta("enumeration_complete", False),
+                      "workers": work_queue.workers()}, ensure_ascii=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDFs über eine gemeinsame SQLite-Warteschlange auf mehrere "
+                                                 "Worker-Prozesse und Rechner verteilen.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    coordinate_parser = commands.add_parser("coordinate", help="Dateien einer Job-Spezifikation einreihen")
+    coordinate_parser.add_argument("job", help="Job-Spezifikation wie bei pdf_processor.py --job")
+    coordinate_parser.add_argument("--queue", help=f"Warteschlange (Standard: <pdf_dir>/{QUEUE_FILE_NAME})")
+    coordinate_parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                                   help="Gültigkeit einer Lease ohne Verlängerung")
+    coordinate_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                                   help="Versuche je Datei, bevor sie als fehlgeschlagen gilt")
+    coordinate_parser.add_argument("--wait", action="store_true", help="Warten, bis alle Dateien erledigt sind")
+    work_parser = commands.add_parser("work", help="Dateien aus der Warteschlange verarbeiten")
+    work_parser.add_argument("queue", help="Warteschlange oder PDF-Verzeichnis, das sie enthält")
+    work_parser.add_argument("--pdf-dir", help="PDF-Verzeichnis, falls es hier unter einem anderen Pfad eingebunden ist")
+    work_parser.add_argument("--render-workers", type=int, default=0,
+                             help="Render-Prozesse (0 = Wert der Job-Spezifikation bzw. ein Prozess pro CPU-Kern)")
+    work_parser.add_argument("--memory-budget-mb", type=int, default=0, help="Speicherbudget des Render-Pools")
+    work_parser.add_argument("--batch", type=int, help="Dateien pro Lease-Anfrage (Standard: Render-Prozesse)")
+    work_parser.add_argument("--lease-seconds", type=float, help="Lease-Dauer (Standard: Wert des Koordinators)")
+    work_parser.add_argument("--wait", action="store_true", help="Bei leerer Warteschlange auf neue Dateien warten")
+    status_parser = commands.add_parser("status", help="Zustand der Warteschlange ausgeben")
+    status_parser.add_argument("queue", help="Warteschlange oder PDF-Verzeichnis, das sie enthält")
+    status_parser.add_argument("--retry-failed", action="store_true", help="Fehlgeschlagene Dateien erneut einreihen")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        path = queue_path(args.queue)
+        if not path.is_file():
+            print(f"Keine Warteschlange gefunden: {path}", file=sys.stderr)
+            return 1
+        with WorkQueue(path) as work_queue:
+            if args.retry_failed:
+                print(f"{work_queue.retry_failed()} Dateien erneut eingereiht.", file=sys.stderr)
+            _print_status(work_queue)
+        return 0
+
+    writer = EventWriter(sys.stdout)
+    # stdout gehört dem Ereignisstrom.
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.command == "coordinate":
+            from pdf_processor import load_job_spec
+            try:
+                spec = load_job_spec(args.job)
+                coordinate(spec, args.queue, args.lease_seconds, args.max_attempts, args.wait, writer.emit)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                print(f"Fehler: {e}")
+                return 1
+            return 0
+
+        path = queue_path(args.queue)
+        if not path.is_file():
+            print(f"Keine Warteschlange gefunden: {path}")
+            return 1
+        try:
+            worker = QueueWorker(path, args.pdf_dir, args.render_workers, args.memory_budget_mb, args.batch,
+                                 args.lease_seconds, args.wait, writer.emit)
+        except (ValueError, sqlite3.Error) as e:
+            print(f"Fehler: {e}")
+            return 1
+        signal.signal(signal.SIGINT, lambda *_: worker.stop())
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        worker.run()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import sys
+import json
+import time
+import shutil
+import socket
+import sqlite3
+import pathlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from work_queue import coordinate, QUEUE_FILE_NAME, ENTRY_DONE
+
+# --- WORK-QUEUE CHECK ---
+# Prüft die Warteschlange mit echten Worker-Prozessen: Ein lokaler Stub-Server beantwortet die
+# Modellanfragen. Zwei Worker (work_queue.py work, je zwei Render-Prozesse) arbeiten dieselbe
+# temporäre Warteschlange mit kurzer Lease ab. Sobald beide Dateien geleast haben und auf eine
+# Antwort warten, wird einer mit SIGKILL beendet. Erwartet: Seine Leases laufen ab, der andere
+# Worker übernimmt sie, jede Datei ist genau einmal erledigt und genau einmal einsortiert, und
+# kein Worker hängt.
+#
+#   python work_queue_check.py
+#   python work_queue_check.py --files 12 --lease-seconds 3 --keep
+
+STUB_REPLY = "19700101_warteschlange_pruefung|OTHER"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Minimaler OpenAI-kompatibler Chat-Endpunkt; hält Antworten zurück, bis server.release gesetzt ist."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.requests += 1
+        self.server.release.wait(60)
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": STUB_REPLY}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # Verbindung des beendeten Workers
+
+
+def _start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.lock = threading.Lock()
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def _make_pdfs(pdf_dir, count):
+    import pymupdf
+
+    pdf_dir.mkdir(parents=True)
+    for index in range(count):
+        doc = pymupdf.open()
+        doc.new_page().insert_text((72, 72), f"Prüfdokument {index}")
+        doc.save(str(pdf_dir / f"doc{index:03d}.pdf"))
+        doc.close()
+
+
+def _wait_for(condition, timeout, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def _leases(db_path):
+    with sqlite3.connect(str(db_path), timeout=30) as conn:
+        return dict(conn.execute("SELECT owner, COUNT(*) FROM files WHERE state = 'leased' GROUP BY owner"))
+
+
+def run_check(work_dir, files=8, lease_seconds=3.0, timeout=180.0):
+    """Führt den Ablauf in work_dir aus. Gibt eine Liste der Fehler zurück (leer = bestanden)."""
+    pdf_dir = pathlib.Path(work_dir) / "in"
+    _make_pdfs(pdf_dir, files)
+    server = _start_stub_server()
+    spec = {
+        "pdf_dir": str(pdf_dir),
+        "target_url": f"http://127.0.0.1:{server.server_address[1]}/v1",
+        "model_name": "stub",
+        "assembled_prompt": "{original_filename}",
+        "category_map": {"OTHER": "OTHER"},
+        "catalog": False,
+    }
+    db_path = pdf_dir / QUEUE_FILE_NAME
+    coordinate(spec, db_path, lease_seconds=lease_seconds)
+
+    script = pathlib.Path(__file__).resolve().parent / "work_queue.py"
+    command = [sys.executable, str(script), "work", str(pdf_dir), "--render-workers", "2"]
+    logs = [open(pathlib.Path(work_dir) / f"worker-{name}.log", "w", encoding="utf-8") for name in ("a", "b")]
+    victim, survivor = (subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT) for log in logs)
+    owners = {f"{socket.gethostname()}:{process.pid}" for process in (victim, survivor)}
+    errors = []
+    try:
+        # Beide Worker halten Leases und warten auf das Modell: jetzt einen davon hart beenden.
+        if not _wait_for(lambda: server.requests >= 2 and owners <= set(_leases(db_path)), timeout / 2):
+            errors.append("Die Worker haben nicht beide Dateien geleast.")
+            return errors
+        victim_owner = f"{socket.gethostname()}:{victim.pid}"
+        victim_leases = _leases(db_path).get(victim_owner, 0)
+        victim.kill()
+        victim.wait()
+        server.release.set()
+        print(f"Worker {victim_owner} mit {victim_leases} Leases beendet; warte auf den zweiten Worker ...")
+        try:
+            survivor.wait(timeout)
+        except subprocess.TimeoutExpired:
+            survivor.kill()
+            errors.append(f"Der verbleibende Worker hängt (nach {timeout:.0f} s abgebrochen).")
+            return errors
+        if survivor.returncode != 0:
+            errors.append(f"Der verbleibende Worker endete mit Code {survivor.returncode}.")
+
+        with sqlite3.connect(str(db_path), timeout=30) as conn:
+            rows = conn.execute("SELECT path, state, attempts, result FROM files").fetchall()
+        not_done = [path for path, state, _, _ in rows if state != ENTRY_DONE]
+        if len(rows) != files or not_done:
+            errors.append(f"{len(rows)} Einträge, nicht erledigt: {not_done}")
+        requeued = sum(1 for _, _, attempts, _ in rows if attempts > 1)
+        if requeued < victim_leases:
+            errors.append(f"Nur {requeued} von {victim_leases} Leases des beendeten Workers wurden neu vergeben.")
+        if any(json.loads(result or "{}").get("worker") == victim_owner for _, _, _, result in rows):
+            errors.append("Ein Ergebnis des beendeten Workers wurde eingetragen.")
+
+        placed = Counter(path.stem.rsplit("_", 1)[-1] for path in (pdf_dir / "OTHER").glob("*.pdf"))
+        expected = {json.loads(result)["checksum"] for _, _, _, result in rows if result}
+        duplicates = sorted(checksum for checksum, count in placed.items() if count > 1)
+        if duplicates or set(placed) != expected or len(expected) != files:
+            errors.append(f"Einsortiert: {sum(placed.values())} Dateien für {files} Quellen "
+                          f"(doppelt: {duplicates}, fehlend: {sorted(expected - set(placed))})")
+        partial = list(pdf_dir.rglob("*.partial"))
+        if partial:
+            errors.append(f"Temporäre Kopien übrig: {[str(path) for path in partial]}")
+        print(f"{files} Dateien erledigt, {requeued} nach Lease-Ablauf neu vergeben.")
+        return errors
+    finally:
+        server.release.set()
+        for process in (victim, survivor):
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        for log in logs:
+            log.close()
+        server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prüft Lease-Ablauf und Neuvergabe der Warteschlange mit "
+                                                 "zwei Worker-Prozessen, von denen einer abstürzt.")
+    parser.add_argument("--files", type=int, default=8, help="Anzahl Test-PDFs")
+    parser.add_argument("--lease-seconds", type=float, default=3.0, help="Lease-Dauer der Warteschlange")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Höchstdauer für den verbleibenden Worker")
+    parser.add_argument("--keep", action="store_true", help="Temporäres Verzeichnis (mit Worker-Logs) behalten")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="pdf_rename_queue_check_")
+    try:
+        errors = run_check(work_dir, args.files, args.lease_seconds, args.timeout)
+    finally:
+        if args.keep:
+            print(f"Verzeichnis: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    for error in errors:
+        print(f"FEHLER  {error}")
+    print("OK" if not errors else f"{len(errors)} Fehler.")
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())